@@ -0,0 +1,362 @@
+"""Event tracker backend that writes events to compressed archive files."""
+
+from __future__ import absolute_import
+
+import atexit
+import gzip
+import io
+import json
+import logging
+import lzma
+import os
+import socket
+import threading
+import time
+import zlib
+
+from six.moves import queue
+
+from eventtracking.backends import index
+from eventtracking.backends.serialization import get_serializer
+
+LOG = logging.getLogger(__name__)
+
+GZIP = 'gzip'
+LZMA = 'lzma'
+EXTENSIONS = {
+    GZIP: '.gz',
+    LZMA: '.xz',
+}
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024  # 1 MB
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_MAX_SEGMENT_BYTES = 256 * 1024 * 1024  # 256 MB
+DEFAULT_QUEUE_SIZE = 100000
+READ_SIZE = 64 * 1024
+
+
+def compress_gzip(data, level):
+    """Compress data into a complete gzip member"""
+    return gzip.compress(data, compresslevel=level if level is not None else 6)
+
+
+def compress_lzma(data, level):
+    """Compress data into a complete xz stream"""
+    return lzma.compress(data, format=lzma.FORMAT_XZ, preset=level)
+
+
+COMPRESSORS = {
+    GZIP: compress_gzip,
+    LZMA: compress_lzma,
+}
+
+
+class Block:
+    """The serialized events that make up a block, and the range of their timestamps"""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+        self.earliest = index.NO_EARLIEST
+        self.latest = index.NO_LATEST
+
+    def add(self, data, timestamp):
+        """Add a serialized event to the block"""
+        self.parts.append(data)
+        self.size += len(data)
+        if timestamp is not None:
+            self.earliest = min(self.earliest, timestamp)
+            self.latest = max(self.latest, timestamp)
+
+
+class CompressedArchiveBackend:
+    """
+    Event tracker backend that streams events, one JSON object per line, into compressed segment files.
+
+    Events are compressed in blocks of roughly `block_size` uncompressed bytes. Each block is written as an
+    independent gzip member or xz stream, both of which standard tools decompress as if they were a single stream.
+    Since a block is only ever written whole, a segment remains readable up to its last complete block if the process
+    crashes, and blocks can be decompressed in parallel given their offsets.
+
+    Serialized events are handed to a background thread through a bounded queue, so compression and file I/O never
+    happen on the thread that emits the event. If the queue is full, the event is dropped and counted in `dropped`.
+    A block is also written if no event has arrived for `flush_interval` seconds. A block that can't be written is
+    logged and lost, and the next block is written to a new segment.
+
+    Segments are named "<prefix>-<UTC time the segment was started>-<host name>-<process id>-<sequence number>.jsonl.gz"
+    (or ".xz"), so that processes sharing a directory never write to the same segment, and are rotated once they reach
+    `max_segment_bytes` compressed bytes or are older than `segment_interval` seconds.
+
+    With `index`, a sparse index of the timestamps of the events in each segment is written next to it, with an entry
+    for each block, see `eventtracking.backends.index`. Use `read_events_between` to read the events from a range of
+    time.
+
+    Call `close` to write the remaining events and close the segment. This is done automatically when the interpreter
+    exits.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Event tracker backend that writes events to compressed archives.
+
+        `directory` is the directory that segments are written to, which is created if it doesn't exist.
+        `prefix` is the start of the name of every segment.
+        `compression` is either "gzip" (the default) or "lzma".
+        `compression_level` is passed to the compressor, higher levels compress better but more slowly.
+        `block_size` is the number of uncompressed bytes in a block.
+        `flush_interval` is the maximum number of seconds that an event waits before being written.
+        `max_segment_bytes` is the size at which a segment is rotated.
+        `segment_interval` is the number of seconds after which a segment is rotated.
+        `queue_size` is the maximum number of events waiting to be compressed.
+        `serializer` is the name of the serializer used to convert events to JSON, see
+            `eventtracking.backends.serialization.get_serializer`.
+        `index` enables writing a sparse index of each segment.
+        """
+        self.directory = kwargs.get('directory')
+        if not self.directory:
+            raise TypeError('The CompressedArchiveBackend must be passed a directory using the "directory" parameter')
+        # Created here, so that a directory that can't be written to fails when the backend is configured.
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.prefix = kwargs.get('prefix', 'events')
+        self.compression = kwargs.get('compression', GZIP)
+        if self.compression not in COMPRESSORS:
+            raise ValueError('Unknown compression: {0}'.format(self.compression))
+        self.compression_level = kwargs.get('compression_level')
+        self.block_size = kwargs.get('block_size', DEFAULT_BLOCK_SIZE)
+        self.flush_interval = kwargs.get('flush_interval', DEFAULT_FLUSH_INTERVAL)
+        self.max_segment_bytes = kwargs.get('max_segment_bytes', DEFAULT_MAX_SEGMENT_BYTES)
+        self.segment_interval = kwargs.get('segment_interval')
+        self.serializer = get_serializer(kwargs.get('serializer'))
+        self.index = kwargs.get('index', False)
+
+        self.queue_size = kwargs.get('queue_size', DEFAULT_QUEUE_SIZE)
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.worker = None
+        self.worker_pid = None
+
+        # Only used by the worker thread
+        self.segment = None
+        self.segment_path = None
+        self.segment_started = None
+        self.segment_sequence = 0
+        self.segment_index = None
+
+        atexit.register(self.close)
+
+    def send(self, event):
+        """Queue the event to be compressed"""
+        data = (self.serializer.serialize(event) + '\n').encode('utf-8')
+        timestamp = index.parse_timestamp(event.get('timestamp')) if self.index else None
+
+        if self.worker_pid != os.getpid():
+            self.start_worker()
+
+        try:
+            self.queue.put_nowait((data, timestamp))
+        except queue.Full:
+            self.dropped += 1
+
+    def start_worker(self):
+        """
+        Start the background thread that compresses events, if it isn't already running in this process.
+
+        A process forked from one that was running the thread has a copy of its queue and segment but not the thread, so
+        it starts with an empty queue, a thread of its own, and a new segment.
+        """
+        with self.lock:
+            if self.worker_pid == os.getpid():
+                return
+
+            if self.worker_pid is not None:
+                self.queue = queue.Queue(maxsize=self.queue_size)
+                # Blocks are flushed as soon as they are written, so closing the inherited segment writes nothing.
+                self.close_segment()
+            self.worker_pid = os.getpid()
+
+            self.worker = threading.Thread(target=self.compress_events, name='eventtracking-archive-writer')
+            self.worker.daemon = True
+            self.worker.start()
+
+    def compress_events(self):
+        """Gather queued events into blocks and write them until the backend is closed"""
+        block = Block()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if block.parts:
+                    self.write_block(block)
+                    block = Block()
+                continue
+
+            if item is None:
+                break
+
+            block.add(*item)
+            if block.size >= self.block_size:
+                self.write_block(block)
+                block = Block()
+
+        if block.parts:
+            self.write_block(block)
+        self.close_segment()
+
+    def write_block(self, block):
+        """
+        Compress a block and append it to the current segment.
+
+        Logs and swallows any error, in which case the events of the block are lost. The segment is closed, since it
+        may end with part of the block, so that the next block starts a new segment.
+        """
+        try:
+            self.append_block(block)
+        except Exception:  # pylint: disable=broad-except
+            LOG.exception('Error writing %d events to the archive in %s', len(block.parts), self.directory)
+            try:
+                self.close_segment()
+            except Exception:  # pylint: disable=broad-except
+                LOG.exception('Error closing the archive segment %s', self.segment_path)
+                self.segment = None
+                self.segment_index = None
+
+    def append_block(self, block):
+        """Compress a block and append it to the current segment, see `write_block`"""
+        compressed = COMPRESSORS[self.compression](b''.join(block.parts), self.compression_level)
+
+        if self.segment is None:
+            self.open_segment()
+        elif self.should_rotate():
+            self.close_segment()
+            self.open_segment()
+
+        offset = self.segment.tell()
+        self.segment.write(compressed)
+        self.segment.flush()
+        if self.segment_index is not None:
+            self.segment_index.write_entry(offset, offset + len(compressed), block.earliest, block.latest)
+            self.segment_index.flush()
+
+    def should_rotate(self):
+        """True if the current segment is full or too old"""
+        if self.segment.tell() >= self.max_segment_bytes:
+            return True
+        return self.segment_interval is not None and time.time() >= self.segment_started + self.segment_interval
+
+    def open_segment(self):
+        """Start a new segment file"""
+        self.segment_started = time.time()
+        self.segment_sequence += 1
+        self.segment_path = os.path.join(self.directory, '{0}-{1}-{2}-{3}-{4}.jsonl{5}'.format(
+            self.prefix,
+            time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(self.segment_started)),
+            socket.gethostname(),
+            os.getpid(),
+            self.segment_sequence,
+            EXTENSIONS[self.compression],
+        ))
+        self.segment = io.open(self.segment_path, 'ab')
+        if self.index:
+            # The block size is in bytes, so the index writer doesn't count events.
+            self.segment_index = index.IndexWriter(self.segment_path, interval=None)
+
+    def close_segment(self):
+        """Close the current segment file"""
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+        if self.segment_index is not None:
+            self.segment_index.close()
+            self.segment_index = None
+
+    def close(self):
+        """Write all queued events and close the current segment"""
+        with self.lock:
+            if self.worker_pid != os.getpid():
+                return
+            worker = self.worker
+            self.worker = None
+            self.worker_pid = None
+            # Sent while holding the lock, so that it is received by this worker rather than one started later. A worker
+            # that has stopped would never make room for it in a full queue.
+            if worker.is_alive():
+                self.queue.put(None)
+
+        worker.join()
+
+
+def new_decompressor(path):
+    """Build a decompressor for a single block of the segment at `path`, based on the extension of its name"""
+    if path.endswith(EXTENSIONS[LZMA]):
+        return lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+    return zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+
+
+def read_blocks(path, offset=0):
+    """
+    Read the blocks of an archive segment, starting with the block at byte `offset`.
+
+    Each block is decompressed and verified before it is returned. Reading stops at the first block that is
+    incomplete or corrupt, for example because the process writing the segment crashed while writing it. Blocks are
+    independent of each other, so different ranges of a segment can be read in parallel given the offsets at which
+    their blocks start.
+
+    Returns a generator that yields the offset and uncompressed data of each block.
+    """
+    with io.open(path, 'rb') as segment:
+        segment.seek(offset)
+        decompressor = new_decompressor(path)
+        parts = []
+        pending = b''
+        consumed = offset
+        while True:
+            chunk = pending or segment.read(READ_SIZE)
+            if not chunk:
+                return
+
+            try:
+                parts.append(decompressor.decompress(chunk))
+            except (lzma.LZMAError, zlib.error):
+                return
+
+            if not decompressor.eof:
+                pending = b''
+                consumed += len(chunk)
+                continue
+
+            pending = decompressor.unused_data
+            yield offset, b''.join(parts)
+
+            consumed += len(chunk) - len(pending)
+            offset = consumed
+            decompressor = new_decompressor(path)
+            parts = []
+
+
+def read_archive(path, offset=0, end=None):
+    """
+    Read the events stored in an archive segment.
+
+    `offset` is the position in the segment to start reading from, which must be the start of a block, and `end` is
+    the position to stop reading at, or None to read to the end of the segment. Events in an incomplete or corrupt
+    block at the end of the segment are skipped, see `read_blocks`.
+
+    Returns a generator that yields each event as a dictionary.
+    """
+    for block_offset, data in read_blocks(path, offset):
+        if end is not None and block_offset >= end:
+            return
+        for line in data.splitlines():
+            yield json.loads(line.decode('utf-8'))
+
+
+def read_events_between(path, start, end):
+    """
+    Read the events with timestamps between the datetimes `start` and `end` from an archive segment.
+
+    Only the blocks that may contain events in the range, according to the index of the segment, are decompressed.
+    See `eventtracking.backends.index.read_events_between`.
+    """
+    return index.read_events_between(path, start, end, read_archive)
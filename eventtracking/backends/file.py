@@ -0,0 +1,449 @@
+"""Event tracker backend that writes newline delimited JSON directly to a file."""
+
+from __future__ import absolute_import
+
+import atexit
+from collections import OrderedDict
+import io
+import json
+import os
+import threading
+import time
+
+from eventtracking.backends import index
+from eventtracking.backends.serialization import get_serializer
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024  # 1 MB
+DEFAULT_FLUSH_BYTES = 256 * 1024  # 256 KB
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# Policies for calling fsync
+FSYNC_NEVER = 'never'
+FSYNC_ON_FLUSH = 'flush'
+FSYNC_ALWAYS = 'always'
+
+CONTEXT_ID = '_context_id'
+DEFAULT_MAX_CONTEXTS = 1000
+# The values that are replaced by keys of their own to identify contexts, see `freeze`.
+CONTAINERS = frozenset([dict, list, tuple])
+
+# Files inherited from the parent of a forked process while they held data buffered by the parent. They are kept
+# referenced, and never flushed or closed, so that the data is only written by the parent.
+INHERITED_FILES = []
+
+
+def freeze(value):
+    """
+    Build a hashable key for a dictionary or a list, replacing the dictionaries and lists it contains by keys of their
+    own.
+
+    The types of the values are included, so that values that are equal but serialized differently, such as 1 and
+    True, have different keys. Hashing the key raises a `TypeError` if the value contains other values that can't be
+    hashed, including subclasses of dictionaries and lists.
+    """
+    if isinstance(value, dict):
+        names = tuple(value)
+        values = tuple(value.values())
+    else:
+        names = None
+        values = tuple(value)
+    types = tuple(map(type, values))
+    if dict in types or list in types or tuple in types:
+        values = tuple([freeze(item) if type(item) in CONTAINERS else item for item in values])
+    return names, values, types
+
+
+class FileBackend:
+    """
+    Event tracker backend that appends events to a file, one JSON object per line.
+
+    Unlike `LoggerBackend`, no log records are created or formatted, and no handler locks are taken. Events are written
+    to a large userspace buffer and committed to the operating system in groups: whenever `flush_bytes` have been
+    written since the last flush, and at least every `flush_interval` seconds by a background thread. The backend is
+    safe to use from multiple threads.
+
+    Most of the cost of writing an event is encoding it as JSON, which both backends do, so the gain is moderate rather
+    than several times: in the performance test in `test_file_performance`, with 600 byte payloads and including the
+    cost of `Tracker.emit`, it wrote about 1.7 times as many events per second as a `LoggerBackend` writing to a file,
+    and 2.4 times as many with the "orjson" serializer.
+
+    The background thread is started when the first event is written, so backends can safely be created before a
+    server forks its worker processes. A process forked after the file was opened opens it again, and starts a
+    background thread of its own, when it writes its first event.
+
+    Events emitted while handling the same request usually share a large, identical, context. With `context_encoding`,
+    each distinct context is only written once, in a line of the form `{"_context_id": 1, "context": {...}}`, and is
+    replaced in the events that follow by a reference to it, `"_context_id": 1`. Use `read_events` to read the
+    original events back.
+
+    With `index_interval`, a sparse index of the timestamps of the events is written next to the file, see
+    `eventtracking.backends.index`. Use `read_events_between` to read the events from a range of time. Contexts are
+    written again at the start of each block of the index, so that the file can be read starting from any block.
+
+    Call `close` to flush and close the file. This is done automatically when the interpreter exits.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Event tracker backend that writes events to a file.
+
+        `path` is the path of the file to write to. It is created if it doesn't exist, and appended to otherwise.
+        `serializer` is the name of the serializer used to convert events to JSON, see
+            `eventtracking.backends.serialization.get_serializer`.
+        `buffer_size` is the size of the userspace write buffer in bytes.
+        `flush_bytes` is the number of bytes written after which the buffer is flushed.
+        `flush_interval` is the maximum number of seconds that an event stays in the buffer.
+        `fsync` determines when written data is synced to stable storage. One of:
+
+            * "never" - leave it to the operating system. This is the default.
+            * "flush" - every time the buffer is flushed.
+            * "always" - after every event. This is very slow.
+
+        `max_bytes` is the size at which the file is rotated.
+        `rotate_interval` is the number of seconds after which the file is rotated.
+
+        When rotated, the file is renamed by appending the time of the rotation to its name, and a new file is started.
+
+        `context_encoding` enables writing each distinct context only once.
+        `max_contexts` is the number of distinct contexts remembered when using context encoding. When a new context is
+            seen, the context that was used least recently is forgotten, and written again if it is used after that.
+        `index_interval` is the number of events in each block of the index. No index is written by default.
+        """
+        self.path = kwargs.get('path')
+        if not self.path:
+            raise TypeError('The FileBackend must be passed the path of the file to write using the "path" parameter')
+        self.serializer = get_serializer(kwargs.get('serializer'))
+        self.buffer_size = kwargs.get('buffer_size', DEFAULT_BUFFER_SIZE)
+        self.flush_bytes = kwargs.get('flush_bytes', DEFAULT_FLUSH_BYTES)
+        self.flush_interval = kwargs.get('flush_interval', DEFAULT_FLUSH_INTERVAL)
+        self.fsync = kwargs.get('fsync', FSYNC_NEVER)
+        if self.fsync not in (FSYNC_NEVER, FSYNC_ON_FLUSH, FSYNC_ALWAYS):
+            raise ValueError('Unknown fsync policy: {0}'.format(self.fsync))
+        self.max_bytes = kwargs.get('max_bytes')
+        self.rotate_interval = kwargs.get('rotate_interval')
+        self.context_encoding = kwargs.get('context_encoding', False)
+        self.max_contexts = kwargs.get('max_contexts', DEFAULT_MAX_CONTEXTS)
+        self.contexts = OrderedDict()
+        self.index_interval = kwargs.get('index_interval')
+        self.index = None
+
+        self.lock = threading.Lock()
+        self.file = None
+        self.file_pid = None
+        self.rotate_at = None
+        self.unflushed_bytes = 0
+        self.flusher = None
+        self.flusher_pid = None
+        self.stopped = threading.Event()
+
+        atexit.register(self.close)
+
+    def send(self, event):
+        """Write the event to the file"""
+        timestamp = self.get_timestamp(event) if self.index_interval else None
+        if self.context_encoding and isinstance(event.get('context'), dict):
+            # Contexts must be numbered in the same order as they are written to the file, and the file must not be
+            # rotated, nor a block started, after they are.
+            with self.lock:
+                self.prepare(0)
+                data, key, definition = self.encode_with_context_id(event)
+                self.append(data, timestamp)
+                if definition is not None:
+                    if len(self.contexts) >= self.max_contexts:
+                        self.contexts.popitem(last=False)
+                    self.contexts[key] = definition
+            return
+
+        data = self.encode(event)
+        with self.lock:
+            self.write(data, timestamp)
+
+    def get_timestamp(self, event):
+        """The timestamp of the event recorded in the index, in microseconds since the epoch, or None"""
+        return index.parse_timestamp(event.get('timestamp')) if isinstance(event, dict) else None
+
+    def encode(self, event):
+        """Convert the event to the bytes written to the file"""
+        return (self.serializer.serialize(event) + '\n').encode('utf-8')
+
+    def encode_with_context_id(self, event):
+        """
+        Convert the event to bytes, replacing its context by a reference to it.
+
+        The definition of the context is included first if it hasn't been written before. Returns the bytes, the key of
+        the context, and its definition if it is new. New definitions must be added to `contexts` once they have been
+        written. Must be called while holding the lock.
+        """
+        context = event['context']
+        key = freeze(context)
+        try:
+            entry = self.contexts.get(key)
+        except TypeError:
+            # Some of the values can't be hashed, so identify the context by its serialized form instead.
+            key = self.serializer.serialize(context)
+            entry = self.contexts.get(key)
+
+        definition = None
+        if entry is not None:
+            context_id = entry[0]
+            self.contexts.move_to_end(key)
+        else:
+            if len(self.contexts) < self.max_contexts:
+                context_id = len(self.contexts) + 1
+            else:
+                # Reuse the id of the least recently used context, which is forgotten once this one is written.
+                context_id = next(iter(self.contexts.values()))[0]
+            definition = (context_id, self.encode({CONTEXT_ID: context_id, 'context': context}))
+
+        event = dict(event)
+        del event['context']
+        event[CONTEXT_ID] = context_id
+        data = self.encode(event)
+
+        if definition is not None:
+            data = definition[1] + data
+        return data, key, definition
+
+    def reset_contexts(self):
+        """
+        Forget all of the contexts that have been written, so that they are written again when they are next used.
+
+        Must be called while holding the lock.
+        """
+        self.contexts.clear()
+
+    def write(self, data, timestamp=None):
+        """
+        Append the data of an event to the file, opening or rotating it as needed.
+
+        `timestamp` is the timestamp of the event recorded in the index. Must be called while holding the lock.
+        """
+        self.prepare(len(data))
+        self.append(data, timestamp)
+
+    def prepare(self, size):
+        """
+        Open or rotate the file, or start a new block of the index, as needed before writing `size` bytes.
+
+        Must be called while holding the lock.
+        """
+        if self.file is not None and self.file_pid != os.getpid():
+            self.abandon_file()
+        if self.file is None:
+            self.open()
+        elif self.should_rotate(size):
+            self.rotate()
+        elif self.index is not None and not self.index.in_block:
+            self.start_block()
+
+    def append(self, data, timestamp=None):
+        """
+        Append the data of an event to the open file.
+
+        `timestamp` is the timestamp of the event recorded in the index. Must be called while holding the lock.
+        """
+        if self.index is not None:
+            start = self.file.tell()
+            self.file.write(data)
+            self.index.add(start, start + len(data), timestamp)
+        else:
+            self.file.write(data)
+        self.unflushed_bytes += len(data)
+
+        if self.fsync == FSYNC_ALWAYS or self.unflushed_bytes >= self.flush_bytes:
+            self.flush()
+
+    def open(self):
+        """
+        Open the file for appending and start the background flusher.
+
+        Must be called while holding the lock.
+        """
+        self.file = io.open(self.path, 'ab', buffering=self.buffer_size)
+        self.file_pid = os.getpid()
+        self.file.seek(0, os.SEEK_END)
+        if self.file.tell() == 0:
+            self.start_file()
+        if self.index_interval:
+            self.index = index.IndexWriter(self.path, self.index_interval)
+        self.start_block()
+        if self.rotate_interval is not None:
+            self.rotate_at = time.time() + self.rotate_interval
+
+        if self.flusher is None or self.flusher_pid != os.getpid():
+            # The flusher stops once the backend is closed, or doesn't exist in a forked process.
+            self.stopped = threading.Event()
+            self.flusher = threading.Thread(
+                target=self.flush_periodically, args=(self.stopped,), name='eventtracking-file-flusher'
+            )
+            self.flusher.daemon = True
+            self.flusher_pid = os.getpid()
+            self.flusher.start()
+
+    def abandon_file(self):
+        """
+        Forget the file inherited from the parent of a forked process, so that it is opened again by this process.
+
+        If the parent had data buffered, the inherited file and index are kept open, but never flushed, so that the
+        data isn't written twice. Otherwise they are closed. Must be called while holding the lock.
+        """
+        if self.unflushed_bytes > 0:
+            INHERITED_FILES.append((self.file, self.index))
+        else:
+            self.file.close()
+            if self.index is not None:
+                # Closing the index would write the entry of the block the parent is writing.
+                self.index.file.close()
+        self.file = None
+        self.index = None
+        self.unflushed_bytes = 0
+
+    def start_file(self):
+        """
+        Called when a new, empty, file has been opened.
+
+        Subclasses can override this to write a header. Must be called while holding the lock.
+        """
+
+    def start_block(self):
+        """
+        Start a new block of events, which is where readers can start reading the file.
+
+        Called when the file is opened, and at the start of each block of the index. Forgets the contexts that have
+        been written, so that the block is self contained. Must be called while holding the lock.
+        """
+        if self.index is not None:
+            self.index.start_block(self.file.tell())
+        self.reset_contexts()
+
+    def should_rotate(self, size):
+        """True if the file must be rotated before writing `size` more bytes"""
+        if self.max_bytes is not None:
+            position = self.file.tell()
+            if position > 0 and position + size > self.max_bytes:
+                return True
+
+        return self.rotate_at is not None and time.time() >= self.rotate_at
+
+    def rotate(self):
+        """
+        Close the file, rename it, and open a new one.
+
+        Must be called while holding the lock.
+        """
+        self.close_file()
+
+        rotated_path = base_path = '{0}.{1}'.format(self.path, time.strftime('%Y%m%d-%H%M%S'))
+        suffix = 0
+        while os.path.exists(rotated_path):
+            suffix += 1
+            rotated_path = '{0}.{1}'.format(base_path, suffix)
+        self.rename_file(rotated_path)
+
+        self.open()
+
+    def rename_file(self, rotated_path):
+        """
+        Rename the closed file to `rotated_path` when it is rotated.
+
+        Must be called while holding the lock.
+        """
+        os.rename(self.path, rotated_path)
+        if os.path.exists(index.index_path(self.path)):
+            os.rename(index.index_path(self.path), index.index_path(rotated_path))
+
+    def flush(self):
+        """
+        Write the buffered data to the operating system, and sync it to storage if configured to.
+
+        Must be called while holding the lock.
+        """
+        self.file.flush()
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(self.file.fileno())
+        if self.index is not None:
+            self.index.flush()
+        self.unflushed_bytes = 0
+
+    def flush_periodically(self, stopped):
+        """Flush the buffer every `flush_interval` seconds until `stopped` is set, when the backend is closed"""
+        while not stopped.wait(self.flush_interval):
+            with self.lock:
+                if self.file is not None and self.unflushed_bytes > 0:
+                    self.flush()
+
+    def close_file(self):
+        """
+        Flush and close the file.
+
+        Must be called while holding the lock.
+        """
+        if self.file is None:
+            return
+
+        self.flush()
+        self.file.close()
+        self.file = None
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+    def close(self):
+        """
+        Stop the background flusher, then flush and close the file.
+
+        Events sent after the backend is closed open the file and start the flusher again.
+        """
+        self.stopped.set()
+        flusher = self.flusher
+        if flusher is not None and self.flusher_pid == os.getpid() and flusher is not threading.current_thread():
+            flusher.join()
+        with self.lock:
+            if self.file is not None and self.file_pid != os.getpid():
+                self.abandon_file()
+            self.close_file()
+            if self.flusher is flusher:
+                self.flusher = None
+
+
+def read_events(path, offset=0, end=None):
+    """
+    Read the events written by a `FileBackend`.
+
+    References to contexts in files written using context encoding are replaced by the contexts themselves.
+
+    `offset` is the position in the file to start reading from, which must be the start of a block of the index, and
+    `end` is the position to stop reading at, or None to read to the end of the file.
+
+    Returns a generator that yields each event as a dictionary.
+    """
+    contexts = {}
+    with io.open(path, 'rb') as events_file:
+        events_file.seek(offset)
+        position = offset
+        for line in events_file:
+            if end is not None and position >= end:
+                return
+            position += len(line)
+
+            event = json.loads(line.decode('utf-8'))
+            if not isinstance(event, dict) or CONTEXT_ID not in event:
+                yield event
+                continue
+
+            context_id = event.pop(CONTEXT_ID)
+            if 'context' in event:
+                contexts[context_id] = event['context']
+            else:
+                event['context'] = dict(contexts[context_id])
+                yield event
+
+
+def read_events_between(path, start, end):
+    """
+    Read the events with timestamps between the datetimes `start` and `end` from a file written by a `FileBackend`.
+
+    Only the parts of the file that may contain events in the range, according to its index, are read. See
+    `eventtracking.backends.index.read_events_between`.
+    """
+    return index.read_events_between(path, start, end, read_events)
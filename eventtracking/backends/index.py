@@ -0,0 +1,233 @@
+"""
+Sparse time indexes for event files, which allow the events in a range of time to be found without reading whole files.
+
+The index of a file is stored next to it, in a file with the same name and the ".idx" extension. The events in the
+file are divided into consecutive blocks, and the index holds one fixed size entry for each block: the byte offsets
+of the start and end of the block, and the earliest and latest timestamps of the events in it, in microseconds since
+the epoch. Readers can start reading at the beginning of any block.
+
+Events don't need to be written in chronological order. Blocks that may contain events from a range of time are found
+by bisecting the running maximum of the latest timestamps of the blocks, and the running minimum of the earliest
+timestamps of the blocks that follow them. Data that isn't covered by any block, such as the events written after the
+last complete block, is always read.
+"""
+
+from __future__ import absolute_import
+
+from bisect import bisect_left
+from datetime import datetime
+import io
+import os
+import struct
+
+from pytz import UTC
+
+ENTRY = struct.Struct('<qqqq')
+SUFFIX = '.idx'
+
+# The timestamps recorded for blocks that contain no events with timestamps, which never match any range.
+NO_EARLIEST = 2 ** 63 - 1
+NO_LATEST = -2 ** 63
+
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+NAIVE_EPOCH = datetime(1970, 1, 1)
+
+
+def index_path(path):
+    """The path of the index of the file at `path`"""
+    return path + SUFFIX
+
+
+def to_microseconds(timestamp):
+    """Convert a datetime to microseconds since the epoch. Naive datetimes are assumed to be in UTC."""
+    delta = timestamp - (NAIVE_EPOCH if timestamp.tzinfo is None else EPOCH)
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def parse_timestamp(value):
+    """
+    Convert the timestamp of an event to microseconds since the epoch.
+
+    `value` is either a datetime, or a string in the ISO 8601 format written by the JSON serializers, such as
+    "2012-05-01T07:27:01.000200+00:00". Returns None for anything else.
+    """
+    if isinstance(value, datetime):
+        return to_microseconds(value)
+    if not isinstance(value, str) or len(value) < 19:
+        return None
+
+    try:
+        timestamp = datetime(
+            int(value[0:4]), int(value[5:7]), int(value[8:10]), int(value[11:13]), int(value[14:16]),
+            int(value[17:19]),
+        )
+        microseconds = to_microseconds(timestamp)
+        rest = value[19:]
+        if rest.startswith('.'):
+            digits = len(rest) - len(rest[1:].lstrip('0123456789'))
+            microseconds += int(rest[1:digits].ljust(6, '0')[:6])
+            rest = rest[digits:]
+        if rest and rest != 'Z':
+            sign = -1 if rest[0] == '-' else 1
+            microseconds -= sign * (int(rest[1:3]) * 3600 + int(rest[4:6]) * 60) * 1000000
+    except ValueError:
+        return None
+    return microseconds
+
+
+class IndexWriter:
+    """
+    Append an entry to the index of a file for each block of `interval` events written to the file.
+
+    The writer must be told the offsets of each event written using `add`. A block is started by the first event added
+    after the previous block ended, unless `start_block` is called first to include data written before that event,
+    such as a header, in the block.
+    """
+
+    def __init__(self, path, interval):
+        self.file = io.open(index_path(path), 'ab')
+        self.interval = interval
+        self.block_start = None
+        self.block_end = None
+        self.count = 0
+        self.earliest = NO_EARLIEST
+        self.latest = NO_LATEST
+
+    @property
+    def in_block(self):
+        """True if a block has been started and not ended yet"""
+        return self.block_start is not None
+
+    def start_block(self, offset):
+        """Start a block at `offset`"""
+        self.block_start = self.block_end = offset
+
+    def add(self, start, end, timestamp):
+        """
+        Record an event written between the offsets `start` and `end`.
+
+        `timestamp` is in microseconds since the epoch, or None if the event has no timestamp. Ends the block if it is
+        full.
+        """
+        if self.block_start is None:
+            self.block_start = start
+        self.block_end = end
+        self.count += 1
+        if timestamp is not None:
+            if timestamp < self.earliest:
+                self.earliest = timestamp
+            if timestamp > self.latest:
+                self.latest = timestamp
+
+        if self.count >= self.interval:
+            self.end_block()
+
+    def end_block(self):
+        """Write the entry for the current block, if it contains any events"""
+        if self.count > 0:
+            self.write_entry(self.block_start, self.block_end, self.earliest, self.latest)
+        self.block_start = self.block_end = None
+        self.count = 0
+        self.earliest = NO_EARLIEST
+        self.latest = NO_LATEST
+
+    def write_entry(self, start, end, earliest, latest):
+        """Write the entry for a block directly, for writers that keep track of blocks themselves"""
+        self.file.write(ENTRY.pack(start, end, earliest, latest))
+
+    def flush(self):
+        """Write the entries to the operating system"""
+        self.file.flush()
+
+    def close(self):
+        """End the current block and close the index"""
+        self.end_block()
+        self.file.close()
+
+
+def read_index(path):
+    """
+    Read the index of the file at `path`.
+
+    Returns a list of (start offset, end offset, earliest timestamp, latest timestamp) tuples. The list is empty if the
+    file has no index. An incomplete entry at the end of the index is ignored.
+    """
+    try:
+        with io.open(index_path(path), 'rb') as index_file:
+            data = index_file.read()
+    except (IOError, OSError):
+        return []
+
+    return [entry for entry in ENTRY.iter_unpack(data[:len(data) - len(data) % ENTRY.size])]
+
+
+def find_ranges(entries, start, end):
+    """
+    Find the ranges of a file that may contain events with timestamps between `start` and `end`.
+
+    `entries` is the index of the file, see `read_index`, and `start` and `end` are in microseconds since the epoch.
+    The range includes `start` but not `end`.
+
+    Returns a list of (start offset, end offset) tuples, ordered by offset. The end offset of the last range is None,
+    meaning the end of the file, since events written after the last block always need to be read.
+    """
+    latest_so_far = []
+    latest = NO_LATEST
+    for entry in entries:
+        latest = max(latest, entry[3])
+        latest_so_far.append(latest)
+
+    earliest_from_here = [0] * len(entries)
+    earliest = NO_EARLIEST
+    for position in range(len(entries) - 1, -1, -1):
+        earliest = min(earliest, entries[position][2])
+        earliest_from_here[position] = earliest
+
+    # Blocks before `first` only contain events earlier than the start, and blocks from `last` only later events.
+    first = bisect_left(latest_so_far, start)
+    last = bisect_left(earliest_from_here, end)
+
+    ranges = []
+    position = 0
+    for index, (block_start, block_end, block_earliest, block_latest) in enumerate(entries):
+        # Data between blocks isn't indexed.
+        if block_start > position:
+            add_range(ranges, position, block_start)
+        position = max(position, block_end)
+
+        if first <= index < last and block_earliest < end and block_latest >= start:
+            add_range(ranges, block_start, block_end)
+
+    add_range(ranges, position, None)
+    return ranges
+
+
+def add_range(ranges, start, end):
+    """Add a range to a list, merging it with the previous range if they are contiguous"""
+    if ranges and ranges[-1][1] == start:
+        ranges[-1] = (ranges[-1][0], end)
+    else:
+        ranges.append((start, end))
+
+
+def read_events_between(path, start, end, read):
+    """
+    Read the events with timestamps between `start` and `end` from the file at `path`, using its index.
+
+    `start` and `end` are datetimes, naive datetimes are assumed to be in UTC. The range includes `start` but not `end`.
+    `read` is the function that reads the events in a range of the file. It is called with the path and the start and
+    end offsets of the range, where the end offset is None for the end of the file, and returns an iterable of events.
+
+    Returns a generator that yields the events in the order that they appear in the file. Only the parts of the file
+    that may contain events in the range are read.
+    """
+    start = to_microseconds(start)
+    end = to_microseconds(end)
+    if not os.path.exists(path):
+        return
+
+    for range_start, range_end in find_ranges(read_index(path), start, end):
+        for event in read(path, range_start, range_end):
+            timestamp = parse_timestamp(event.get('timestamp')) if isinstance(event, dict) else None
+            if timestamp is not None and start <= timestamp < end:
+                yield event
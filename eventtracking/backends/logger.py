@@ -2,21 +2,86 @@
 
 from __future__ import absolute_import
 
-from datetime import datetime
-from datetime import date
+import atexit
+import io
 import logging
-import json
+from logging.handlers import QueueHandler, QueueListener
+import os
+import threading
+from uuid import uuid4
 
-from pytz import UTC
+from six.moves import queue
+
+from eventtracking.backends.serialization import DateTimeJSONEncoder  # pylint: disable=unused-import
+from eventtracking.backends.serialization import estimate_size, get_serializer
 
 MAX_EVENT_SIZE = 1024  # 1 KB
 
+# Policies for handling events that are larger than the maximum event size
+DROP = 'drop'
+TRUNCATE = 'truncate'
+OFFLOAD = 'offload'
+
+TRUNCATION_MARKER = '...[truncated]'
+
+DEFAULT_QUEUE_SIZE = 10000
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue log records without ever blocking, counting the records that are dropped because the queue is full.
+
+    Records are queued as they are, without being formatted first. Events are logged as plain strings without any
+    arguments or exception information, so they are safe to pass to another thread unchanged, and formatting them is
+    left to the handlers that actually output them.
+    """
+
+    def __init__(self, record_queue):
+        super(DroppingQueueHandler, self).__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """A queue listener that waits for room in a full queue when stopped, so that no queued records are lost"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def find_handlers(logger):
+    """
+    Find the handlers that records logged to `logger` are passed to.
+
+    These are the handlers of the logger and of its ancestors, up to the first one that doesn't propagate records.
+    """
+    handlers = []
+    while logger is not None:
+        handlers.extend(logger.handlers)
+        if not logger.propagate:
+            break
+        logger = logger.parent
+    return handlers
+
 
 class LoggerBackend:
     """
     Event tracker backend that uses a python logger.
 
     Events are logged to the INFO level as JSON strings.
+
+    Events whose JSON strings are longer than `max_event_size` are handled
+    according to the `oversize_policy`. The number of events that were
+    dropped, truncated or offloaded is counted in the attributes of the
+    same name.
     """
 
     def __init__(self, **kwargs):
@@ -25,42 +90,223 @@ class LoggerBackend:
 
         `name` is an identifier for the logger, which should have
             been configured using the default python mechanisms.
+        `serializer` is the name of the serializer used to convert events
+            to JSON, see `eventtracking.backends.serialization.get_serializer`.
+        `max_event_size` is the maximum length of a logged JSON string, or
+            None for no limit.
+        `oversize_policy` determines what happens to events that are too
+            large. One of:
+
+            * "drop" - the event is not logged. This is the default.
+            * "truncate" - the largest fields of the event data are
+              shortened, or replaced with a marker, until the event fits.
+            * "offload" - the full event is written to a file in
+              `offload_dir`, and an event with the same name, timestamp and
+              context that references the file is logged in its place.
+
+            Events that still don't fit are dropped.
+        `offload_dir` is the directory that oversized events are written to
+            when using the "offload" policy.
+        `use_queue` moves the output of events to a background thread. The
+            handlers that would otherwise receive the logged events are called
+            by the thread instead, so slow handlers never block the caller.
+        `queue_size` is the maximum number of events waiting to be output
+            when using a queue. Events logged while the queue is full are
+            dropped and counted in `queue_dropped`.
         """
         name = kwargs.get('name', None)
         self.max_event_size = kwargs.get('max_event_size', MAX_EVENT_SIZE)
+        self.oversize_policy = kwargs.get('oversize_policy', DROP)
+        if self.oversize_policy not in (DROP, TRUNCATE, OFFLOAD):
+            raise ValueError('Unknown oversize policy: {0}'.format(self.oversize_policy))
+        self.offload_dir = kwargs.get('offload_dir')
+        if self.oversize_policy == OFFLOAD and not self.offload_dir:
+            raise ValueError('The "offload_dir" must be set to use the offload policy')
+        self.dropped = 0
+        self.truncated = 0
+        self.offloaded = 0
+        self.serializer = get_serializer(kwargs.get('serializer'))
         self.event_logger = logging.getLogger(name)
         level = kwargs.get('level', 'info')
         self.log = getattr(self.event_logger, level.lower())
 
+        self.use_queue = False
+        self.queue_handler = None
+        self.listener = None
+        self.listener_pid = None
+        self.listener_handlers = []
+        self.original_handlers = []
+        self.original_propagate = True
+        self.lock = threading.Lock()
+        if kwargs.get('use_queue', False):
+            self.install_queue(kwargs.get('queue_size', DEFAULT_QUEUE_SIZE))
+
+    def install_queue(self, queue_size):
+        """
+        Replace the handlers of the logger with a handler that queues records for a background listener.
+
+        The listener passes the records to all of the handlers that would have received them, including those of
+        ancestor loggers, which are left in place for other loggers to use.
+        """
+        self.listener_handlers = find_handlers(self.event_logger)
+        self.original_handlers = list(self.event_logger.handlers)
+        self.original_propagate = self.event_logger.propagate
+
+        self.queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        self.event_logger.handlers = [self.queue_handler]
+        self.event_logger.propagate = False
+        self.use_queue = True
+
+        atexit.register(self.close)
+
+    @property
+    def queue_dropped(self):
+        """The number of events dropped because the queue was full"""
+        return self.queue_handler.dropped if self.queue_handler is not None else 0
+
+    def start_listener(self):
+        """
+        Start the background thread that outputs queued events.
+
+        The thread is started when the first event is sent, and again in processes forked after that, since threads
+        don't survive a fork.
+        """
+        with self.lock:
+            if self.listener_pid == os.getpid():
+                return
+
+            self.listener = DrainingQueueListener(
+                self.queue_handler.queue, *self.listener_handlers, respect_handler_level=True
+            )
+            self.listener.start()
+            self.listener_pid = os.getpid()
+
+    def close(self):
+        """
+        Output all queued events, stop the background thread and restore the handlers of the logger.
+
+        This is done automatically when the interpreter exits.
+        """
+        if not self.use_queue:
+            return
+
+        # Events may have been queued by other users of the logger, even if this process never sent one.
+        if self.listener_pid != os.getpid():
+            self.start_listener()
+
+        with self.lock:
+            if not self.use_queue:
+                return
+
+            self.listener.stop()
+            self.event_logger.handlers = self.original_handlers
+            self.event_logger.propagate = self.original_propagate
+            self.use_queue = False
+            self.listener = None
+            self.listener_pid = None
+
     def send(self, event):
         """Send the event to the standard python logger"""
-        event_str = json.dumps(event, cls=DateTimeJSONEncoder)
+        if self.use_queue and self.listener_pid != os.getpid():
+            self.start_listener()
 
-        # TODO: do something smarter than simply dropping the event on
-        # the floor.
-        if self.max_event_size is None or len(event_str) <= self.max_event_size:
-            self.log(event_str)
+        if self.max_event_size is None:
+            self.log(self.serializer.serialize(event))
+            return
 
+        # Avoid serializing events that are certain to be too large.
+        event_str = None
+        if estimate_size(event, self.max_event_size, self.serializer.compact) <= self.max_event_size:
+            event_str = self.serializer.serialize(event)
+            if len(event_str) <= self.max_event_size:
+                self.log(event_str)
+                return
 
-class DateTimeJSONEncoder(json.JSONEncoder):
-    """JSON encoder aware of datetime.datetime and datetime.date objects"""
+        self.send_oversized_event(event, event_str)
 
-    def default(self, obj):  # lint-amnesty, pylint: disable=arguments-differ, method-hidden
+    def send_oversized_event(self, event, event_str=None):
         """
-        Serialize datetime and date objects of iso format.
+        Handle an event that is too large according to the oversize policy.
 
-        datatime objects are converted to UTC.
+        `event_str` is the serialized event, if it has been computed.
         """
+        if self.oversize_policy == TRUNCATE:
+            event_str = self.truncate(event)
+            if event_str is not None:
+                self.truncated += 1
+                self.log(event_str)
+                return
+        elif self.oversize_policy == OFFLOAD:
+            event_str = self.offload(event, event_str)
+            if event_str is not None:
+                self.offloaded += 1
+                self.log(event_str)
+                return
+
+        self.dropped += 1
+
+    def truncate(self, event):
+        """
+        Shorten the largest fields of the event data until the event fits.
+
+        Strings are cut short and end with a marker, other values are
+        replaced by the marker. The event itself is not modified, since other
+        backends may receive it.
+
+        Returns the serialized truncated event, or None if it doesn't fit.
+        """
+        data = event.get('data')
+        if not isinstance(data, dict):
+            return None
+
+        truncated_data = dict(data)
+        truncated_event = dict(event)
+        truncated_event['data'] = truncated_data
+
+        sizes = {key: estimate_size(value, compact=self.serializer.compact) for key, value in data.items()}
+        for key in sorted(sizes, key=sizes.get, reverse=True):
+            event_str = self.serializer.serialize(truncated_event)
+            excess = len(event_str) - self.max_event_size
+            if excess <= 0:
+                return event_str
+
+            value = truncated_data[key]
+            if isinstance(value, str) and len(value) > excess + len(TRUNCATION_MARKER):
+                truncated_data[key] = value[:len(value) - excess - len(TRUNCATION_MARKER)] + TRUNCATION_MARKER
+            elif sizes[key] > len(TRUNCATION_MARKER) + 2:
+                truncated_data[key] = TRUNCATION_MARKER
+
+        event_str = self.serializer.serialize(truncated_event)
+        if len(event_str) <= self.max_event_size:
+            return event_str
+        return None
+
+    def offload(self, event, event_str=None):
+        """
+        Write the full event to a file in the offload directory.
+
+        Returns the serialized event that references the file, or None if it
+        doesn't fit.
+        """
+        if event_str is None:
+            event_str = self.serializer.serialize(event)
+
+        path = os.path.join(self.offload_dir, '{0}.json'.format(uuid4().hex))
+        with io.open(path, 'w', encoding='utf-8') as offload_file:
+            offload_file.write(event_str)
+
+        reference = {
+            key: event[key]
+            for key in ('name', 'timestamp', 'context')
+            if key in event
+        }
+        reference['data'] = {}
+        reference['offloaded'] = {
+            'path': path,
+            'size': len(event_str),
+        }
 
-        if isinstance(obj, datetime):
-            if obj.tzinfo is None:
-                # Localize to UTC naive datetime objects
-                obj = UTC.localize(obj)  # pylint: disable=no-value-for-parameter
-            else:
-                # Convert to UTC datetime objects from other timezones
-                obj = obj.astimezone(UTC)
-            return obj.isoformat()
-        elif isinstance(obj, date):
-            return obj.isoformat()
-
-        return super(DateTimeJSONEncoder, self).default(obj)
+        reference_str = self.serializer.serialize(reference)
+        if len(reference_str) <= self.max_event_size:
+            return reference_str
+        return None
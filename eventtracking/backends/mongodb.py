@@ -2,19 +2,240 @@
 
 from __future__ import absolute_import
 
+import atexit
+from collections import OrderedDict, deque
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import logging
+import os
+import threading
+import time
 
 import pymongo
 from pymongo import MongoClient
-from pymongo.errors import PyMongoError
+from pymongo.errors import BulkWriteError, CollectionInvalid, ConnectionFailure, OperationFailure, PyMongoError
+import bson
 from bson.errors import BSONError
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+from pytz import UTC
+from six.moves import queue
 
 
 log = logging.getLogger(__name__)
 
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_QUEUE_SIZE = 100000
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_DELAY = 0.1
+DEFAULT_CLOSE_TIMEOUT = 10.0
+
+# The error code of a write that failed because a document with the same _id already exists.
+DUPLICATE_KEY = 11000
+# The error code of creating a collection that already exists.
+NAMESPACE_EXISTS = 48
+
+DAY = 'day'
+WEEK = 'week'
+BUCKET_DAYS = {
+    DAY: 1,
+    WEEK: 7,
+}
+DEFAULT_BUCKET_PATTERN = '{collection}_%Y%m%d'
+DEFAULT_TIME_FIELD = 'time'
+
+DEFAULT_QUERY_BATCH_SIZE = 1000
+# Lets `MongoBackend.find_events` choose the index used by a query.
+AUTO = 'auto'
+
+
+def as_utc(timestamp):
+    """Convert a datetime to UTC. Naive datetimes are assumed to be in UTC already."""
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=UTC)
+    return timestamp.astimezone(UTC)
+
+
+def bucket_start(timestamp, interval):
+    """
+    The start of the bucket of the given interval, "day" or "week", that contains a timestamp.
+
+    Buckets start at midnight UTC, and weekly buckets on Mondays. Naive timestamps are assumed to be in UTC.
+    """
+    timestamp = as_utc(timestamp)
+    start = datetime(timestamp.year, timestamp.month, timestamp.day, tzinfo=UTC)
+    if interval == WEEK:
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def bucket_starts(start, end, interval):
+    """Yield the start of each bucket of the given interval that may contain timestamps from `start` to `end`"""
+    bucket = bucket_start(start, interval)
+    end = as_utc(end)
+    while bucket < end:
+        yield bucket
+        bucket += timedelta(days=BUCKET_DAYS[interval])
+
+
+def failed_documents(documents, details):
+    """
+    Find the documents of an unordered bulk insert that failed and may succeed if they are inserted again.
+
+    `details` are the details of the `BulkWriteError` raised by the insert. Documents that failed because they had
+    already been inserted, for example by an earlier attempt that failed part way through, are not retried.
+    """
+    return [
+        documents[error['index']]
+        for error in details.get('writeErrors', [])
+        if error.get('code') != DUPLICATE_KEY
+    ]
+
+
+def client_key(parameters, user, password):
+    """
+    The key of a client in a `ClientRegistry`.
+
+    The credentials are part of the key because a client can only be authenticated as a single user for each database.
+    Parameters that aren't hashable, such as lists of hosts, are compared by their representation.
+    """
+    return (user, password) + tuple(sorted((name, repr(value)) for name, value in parameters.items()))
+
+
+def to_document(event, id_field=None, deep=False):
+    """
+    Convert an event to the document that is inserted.
+
+    Events that are already encoded as BSON, such as `RawBSONDocument`, are inserted as they are. Other events are
+    copied, since the driver adds an _id to the documents it inserts, which must not be added to the event shared with
+    the other backends. If the event has an `id_field`, its value is used as the _id of the document.
+
+    With `deep`, the values of the event are copied too, for documents that are inserted later by another thread,
+    after the code that emitted the event may have changed them.
+    """
+    if isinstance(event, RawBSONDocument):
+        return event
+    document = copy.deepcopy(event) if deep else dict(event)
+    if id_field and id_field in document:
+        document['_id'] = document[id_field]
+    return document
+
+
+def encode_documents(documents, codec_options):
+    """
+    Encode documents as BSON, so that inserting them doesn't encode them again.
+
+    Each document is given an _id before it is encoded, if it doesn't have one, so that retrying the insert never
+    inserts a duplicate. Documents that are already encoded are left as they are, and documents that can't be encoded
+    are logged and skipped.
+    """
+    encoded = []
+    for document in documents:
+        if isinstance(document, RawBSONDocument):
+            encoded.append(document)
+            continue
+
+        if '_id' not in document:
+            document['_id'] = ObjectId()
+        try:
+            encoded.append(RawBSONDocument(bson.BSON.encode(document, codec_options=codec_options)))
+        except (BSONError, TypeError, ValueError, OverflowError):
+            msg = 'Error encoding an event for the MongoDB event tracker backend'
+            log.exception(msg)
+    return encoded
+
+
+class ClientRegistry:
+    """
+    A registry of `MongoClient` objects, shared by the backends that connect with the same parameters.
+
+    Each client has its own pool of connections and its own monitoring threads, so sharing them between backends that
+    write to different collections of the same cluster saves sockets and threads. Clients are reference counted, and
+    closed once the last backend using them releases them.
+
+    A `MongoClient` must not be used in a process forked from the one that created it. When the registry is used in a
+    forked process, it forgets the clients of the parent process and creates new ones.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.pid = os.getpid()
+
+    def acquire(self, parameters, user='', password=''):
+        """
+        Get the client for the given parameters of `MongoClient`, creating it if necessary.
+
+        Every call must be matched by a call to `release`, see `release`.
+        """
+        key = client_key(parameters, user, password)
+        with self.lock:
+            if self.pid != os.getpid():
+                # The clients belong to the parent process, which will close them.
+                self.clients = {}
+                self.pid = os.getpid()
+
+            entry = self.clients.get(key)
+            if entry is None:
+                entry = self.clients[key] = [MongoClient(**parameters), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, client):
+        """Release a client obtained from `acquire`, closing it if it is no longer used"""
+        with self.lock:
+            for key, entry in self.clients.items():
+                if entry[0] is client:
+                    entry[1] -= 1
+                    if entry[1] <= 0:
+                        del self.clients[key]
+                        client.close()
+                    return
+
+
+CLIENTS = ClientRegistry()
+
 
 class MongoBackend:
-    """Class for a MongoDB event tracker Backend"""
+    """
+    Class for a MongoDB event tracker Backend
+
+    Events are buffered and written in batches of `batch_size` events, using a single unordered `insert_many` for each
+    batch, by a background thread. A batch is also written once its first event has waited `flush_interval` seconds.
+    Events are copied when they are sent and handed to the thread through a bounded queue, if it is full the event is
+    dropped and counted in `dropped`. Call `flush` to write the buffered events, and `close` to write them and stop the
+    thread, which is done automatically when the interpreter exits. With a `batch_size` of 1, each event is inserted as
+    it is sent instead. Errors are logged and lose the batch that failed, but never stop the thread.
+
+    If some of the documents of a batch fail to be inserted, only those are retried, up to `max_retries` times.
+    Each document is given its `_id` before it is first inserted, so a retry never inserts a duplicate. Failures are
+    only reported by acknowledged writes, so when events are buffered, writes are acknowledged (`w` is 1) unless
+    another write concern is given in `extra`. When each event is inserted as it is sent, writes aren't acknowledged
+    by default, so that sending an event doesn't wait for the database.
+
+    Closing waits at most `close_timeout` seconds for the buffered events to be written, and the events that are left
+    then are dropped. The remaining events are also dropped as soon as the database can't be reached while closing,
+    rather than waiting for each of their batches to time out in turn.
+
+    The backend connects to the database when it is first used rather than when it is constructed, and then creates
+    its indexes in a background thread. Call `warm_up` to connect ahead of the first event. Backends that connect with
+    the same parameters share a single `MongoClient`, see `ClientRegistry`.
+
+    A single collection and its indexes grow without limit, and inserts slow down as the indexes grow. With
+    `bucket_interval`, events are instead written to a collection per day or week, so only the indexes of the current
+    collection are updated, and old collections can simply be dropped. With `time_series`, collections are created as
+    MongoDB time series collections (MongoDB 5.0 or later), which store events compactly, ordered by time. With
+    `ttl`, events are deleted that many seconds after their timestamp. Use `find_between` to query a range of time
+    across the buckets.
+
+    Events that are already encoded as BSON, such as `RawBSONDocument` objects decoded by a forwarding or replay
+    pipeline, are inserted without being decoded or encoded again, except that their timestamp is decoded to choose
+    their bucket. They should have an _id, otherwise a retried insert may insert them twice. With `encoders`, batches
+    are encoded by a pool of that many threads instead of by the thread that writes them, so encoding the next batches
+    overlaps with waiting for the database to acknowledge the current one.
+    """
 
     def __init__(self, **kwargs):
         """
@@ -29,6 +250,30 @@ class MongoBackend:
           - `database`: name of the database
           - `collection`: name of the collection
           - `extra`: parameters to pymongo.MongoClient not listed above
+          - `batch_size`: number of events written at a time
+          - `flush_interval`: maximum number of seconds an event is buffered
+          - `queue_size`: maximum number of events waiting to be written
+          - `max_retries`: number of times documents that failed to be inserted are retried
+          - `retry_delay`: number of seconds before the first retry, doubled for each retry
+          - `close_timeout`: maximum number of seconds that closing waits
+            for the buffered events to be written
+          - `create_indexes`: whether to create the indexes once connected, set
+            to False to create them with the "create_event_indexes" management
+            command instead
+          - `time_field`: the field of each event that holds its timestamp,
+            which is indexed and queried, the "timestamp" of events that
+            don't have it is copied to it
+          - `bucket_interval`: "day" or "week" to write events to a collection
+            per interval of time
+          - `bucket_pattern`: the name of each bucket, formatted with
+            `collection` and then `strftime` for the start of the bucket
+          - `time_series`: whether to create collections as time series
+            collections
+          - `ttl`: number of seconds after which events expire
+          - `encoders`: number of threads that encode batches as BSON before
+            they are written, or 0 to let the driver encode them
+          - `id_field`: the field of each event that holds its id, which is
+            used as the _id of the document, see `Tracker`
 
         """
 
@@ -48,50 +293,622 @@ class MongoBackend:
         # Other mongo connection arguments
         extra = kwargs.get('extra', {})
 
-        # By default disable write acknowledgments, reducing the time
-        # blocking during an insert
-        extra['w'] = extra.get('w', 0)
+        # By default disable write acknowledgments when each event is
+        # inserted as it is sent, reducing the time blocking during an
+        # insert. Batches are written by a background thread, so they are
+        # acknowledged, which reports the documents that failed.
+        batch_size = kwargs.get('batch_size', DEFAULT_BATCH_SIZE)
+        extra['w'] = extra.get('w', 1 if batch_size > 1 else 0)
 
         # Make timezone aware by default
         extra['tz_aware'] = extra.get('tz_aware', True)
 
-        # Connect to database and get collection
+        # The connection is made when it is first used, so that constructing
+        # the backend, which usually happens while the application is
+        # starting up, never waits for the database.
+        self.connection_parameters = dict(extra, host=host, port=port)
+        self.user = user
+        self.password = password
+        self.db_name = db_name
+        self.collection_name = collection_name
+        self.index_creation = kwargs.get('create_indexes', True)
+        self.time_field = kwargs.get('time_field', DEFAULT_TIME_FIELD)
+        self.bucket_interval = kwargs.get('bucket_interval')
+        if self.bucket_interval is not None and self.bucket_interval not in BUCKET_DAYS:
+            raise ValueError('Unknown bucket interval: {0}'.format(self.bucket_interval))
+        self.bucket_pattern = kwargs.get('bucket_pattern', DEFAULT_BUCKET_PATTERN)
+        self.time_series = kwargs.get('time_series', False)
+        self.ttl = kwargs.get('ttl')
+        # The collections other than the default one that have been created and indexed by this backend.
+        self.prepared_collections = set()
+        self.connect_lock = threading.Lock()
+        self.registry = None
+        self.connection_pid = None
+        self.indexes_started = False
+        self._connection = None
+        self._database = None
+        self._collection = None
+
+        self.batch_size = batch_size
+        self.flush_interval = kwargs.get('flush_interval', DEFAULT_FLUSH_INTERVAL)
+        self.max_retries = kwargs.get('max_retries', DEFAULT_MAX_RETRIES)
+        self.retry_delay = kwargs.get('retry_delay', DEFAULT_RETRY_DELAY)
+        self.close_timeout = kwargs.get('close_timeout', DEFAULT_CLOSE_TIMEOUT)
+
+        self.encoders = kwargs.get('encoders', 0)
+        self.id_field = kwargs.get('id_field')
+
+        self.queue_size = kwargs.get('queue_size', DEFAULT_QUEUE_SIZE)
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.worker = None
+        self.worker_pid = None
+        # The time by which the worker must stop writing events, once the backend is closing.
+        self.close_deadline = None
+        # Whether the last attempt to insert events failed to reach the database.
+        self.unreachable = False
 
-        self.connection = MongoClient(
-            host=host,
-            port=port,
-            **extra
-        )
+        atexit.register(self.close)
 
-        self.database = self.connection[db_name]
+    @property
+    def connection(self):
+        """The `MongoClient`, which is created when it is first used"""
+        self.connect()
+        return self._connection
 
-        if user or password:
-            self.database.authenticate(user, password)
+    @property
+    def database(self):
+        """The database that events are written to"""
+        self.connect()
+        return self._database
 
-        self.collection = self.database[collection_name]
+    @property
+    def collection(self):
+        """The collection that events are written to"""
+        self.connect()
+        return self._collection
 
-        self._create_indexes()
+    def connect(self):
+        """
+        Connect to the database, unless already connected.
+
+        The client is obtained from the shared `CLIENTS` registry. A process forked from one that was connected connects
+        again with a client of its own. Once connected for the first time, the indexes are created in a background
+        thread, unless the `create_indexes` option is False.
+        """
+        if self._collection is not None and self.connection_pid == os.getpid():
+            return
+
+        with self.connect_lock:
+            pid = os.getpid()
+            if self._collection is not None and self.connection_pid == pid:
+                return
+
+            registry = CLIENTS
+            connection = registry.acquire(self.connection_parameters, self.user, self.password)
+            try:
+                database = connection[self.db_name]
+                if self.user or self.password:
+                    database.authenticate(self.user, self.password)
+            except Exception:
+                registry.release(connection)
+                raise
 
-    def _create_indexes(self):
-        """Ensures the proper fields are indexed"""
-        # WARNING: The collection will be locked during the index
-        # creation. If the collection has a large number of
-        # documents in it, the operation can take a long time.
+            self.registry = registry
+            self.connection_pid = pid
+            self._connection = connection
+            self._database = database
+            self._collection = database[self.collection_name]
+
+            # Buckets and time series collections are prepared when they are first written to.
+            start_index_creation = self.index_creation and not self.indexes_started and not self.partitioned
+            self.indexes_started = True
+
+        if start_index_creation:
+            thread = threading.Thread(target=self.create_indexes_safely, name='eventtracking-mongo-indexes')
+            thread.daemon = True
+            thread.start()
+
+    @property
+    def partitioned(self):
+        """True if events are written to buckets or time series collections, which are created as they are needed"""
+        return self.bucket_interval is not None or self.time_series
+
+    def create_indexes(self, collection=None):
+        """
+        Ensures the proper fields are indexed.
 
-        # TODO: The creation of indexes can be moved to a Django
-        # management command or equivalent. There is also an option to
-        # run the indexing on the background, without locking.
-        self.collection.ensure_index([('time', pymongo.DESCENDING)])
-        self.collection.ensure_index('name')
+        The indexes are built in the background by MongoDB, so that the collection isn't locked while they are built,
+        which can take a long time if it contains a large number of documents. This is also available as the
+        "create_event_indexes" Django management command.
+
+        `collection` defaults to the collection that events are currently written to. With `ttl`, the index of the
+        time field expires events.
+        """
+        if collection is None:
+            name = self.collection_name_for(datetime.now(UTC))
+            if self.time_series:
+                # Time series collections are indexed by time when they are created.
+                self.get_collection(name)
+                return
+            collection = self.database[name]
+
+        time_options = {'expireAfterSeconds': self.ttl} if self.ttl else {}
+        collection.create_index([(self.time_field, pymongo.DESCENDING)], background=True, **time_options)
+        collection.create_index('name', background=True)
+
+    def create_indexes_safely(self, collection=None):
+        """Create the indexes, logging any error, see `create_indexes`"""
+        try:
+            self.create_indexes(collection)
+        except PyMongoError:
+            log.exception('Error creating the indexes of the MongoDB event tracker backend')
+
+    def warm_up(self):
+        """
+        Connect to the database and start the writer thread, so that the first event doesn't wait for either.
+
+        Intended to be called by each worker process of a pre-fork server once it has started, for example from the
+        `post_fork` hook of gunicorn. Logs and swallows connection errors.
+        """
+        try:
+            self.connection.admin.command('ping')
+        except PyMongoError:
+            log.exception('Error connecting to MongoDB event tracker backend')
+
+        if self.batch_size > 1 and self.worker_pid != os.getpid():
+            self.start_worker()
 
     def send(self, event):
-        """Insert the event in to the Mongo collection"""
+        """Buffer the event to be inserted in to the Mongo collection"""
+        if self.batch_size <= 1:
+            self.insert_documents([to_document(event, self.id_field)])
+            return
+
+        if self.worker_pid != os.getpid():
+            self.start_worker()
+
         try:
-            self.collection.insert(event, manipulate=False)
-        except (PyMongoError, BSONError):
-            # The event will be lost in case of a connection error or any error
-            # that occurs when trying to insert the event into Mongo.
-            # pymongo will re-connect/re-authenticate automatically
-            # during the next event.
-            msg = 'Error inserting to MongoDB event tracker backend'
-            log.exception(msg)
+            self.queue.put_nowait(to_document(event, self.id_field, deep=True))
+        except queue.Full:
+            self.dropped += 1
+
+    def send_batch(self, events):
+        """Buffer a batch of events to be inserted in to the Mongo collection"""
+        if self.batch_size <= 1:
+            self.insert_documents([to_document(event, self.id_field) for event in events])
+            return
+
+        for event in events:
+            self.send(event)
+
+    def start_worker(self):
+        """
+        Start the background thread that writes events, if it isn't already running in this process.
+
+        A process forked from one that was running the thread has a copy of its queue but not the thread, so it starts
+        with an empty queue and a thread of its own.
+        """
+        with self.lock:
+            if self.worker_pid == os.getpid():
+                return
+
+            if self.worker_pid is not None:
+                self.queue = queue.Queue(maxsize=self.queue_size)
+            self.worker_pid = os.getpid()
+            self.close_deadline = None
+
+            self.worker = threading.Thread(
+                target=self.write_events, args=(self.queue,), name='eventtracking-mongo-writer'
+            )
+            self.worker.daemon = True
+            self.worker.start()
+
+    def write_events(self, events):
+        """
+        Gather the events in the queue `events` into batches and write them until the backend is closed.
+
+        The queue is passed in, rather than read from the backend, since a worker that is still writing when `close`
+        times out keeps its queue, while the backend is given a new one.
+        """
+        pool = ThreadPoolExecutor(max_workers=self.encoders) if self.encoders else None
+        # The batches being encoded by the pool, oldest first.
+        pending = deque()
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = events.get(timeout=timeout)
+            except queue.Empty:
+                item = threading.Event()
+
+            if item is None:
+                break
+
+            if isinstance(item, threading.Event):
+                # Either a flush was requested, or the oldest event has waited long enough.
+                self.write_batch(batch, pool, pending, drain=True)
+                batch = []
+                deadline = None
+                item.set()
+                continue
+
+            if self.abandoned():
+                self.dropped += len(batch) + 1
+                batch = []
+                deadline = None
+                continue
+
+            if not batch:
+                deadline = time.monotonic() + self.flush_interval
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch, pool, pending)
+                batch = []
+                deadline = None
+
+        self.write_batch(batch, pool, pending, drain=True)
+        if pool is not None:
+            pool.shutdown()
+
+    def abandoned(self):
+        """True if the backend is closing and the events that are left must be dropped rather than written"""
+        if self.close_deadline is None:
+            return False
+        return self.unreachable or time.monotonic() >= self.close_deadline
+
+    def write_batch(self, batch, pool, pending, drain=False):
+        """
+        Write a batch of documents, or with a pool of encoders, queue it to be encoded and then written.
+
+        Batches are written in the order they were queued. Unless `drain` is true, up to one batch per encoder is left
+        to be encoded while this thread writes the others. Any error is logged and the batch is lost, so that the thread
+        keeps writing the batches that follow. Batches are dropped instead if the backend is `abandoned`.
+        """
+        if pool is None:
+            if self.abandoned():
+                self.dropped += len(batch)
+                return
+            try:
+                self.insert_documents(batch)
+            except Exception:  # pylint: disable=broad-except
+                msg = 'Error writing events to the MongoDB event tracker backend'
+                log.exception(msg)
+            return
+
+        if batch:
+            pending.append(pool.submit(self.encode_groups, batch))
+        while pending and (drain or len(pending) > self.encoders):
+            try:
+                groups = pending.popleft().result()
+            except Exception:  # pylint: disable=broad-except
+                msg = 'Error encoding events for the MongoDB event tracker backend'
+                log.exception(msg)
+                continue
+            for name, documents in groups:
+                if self.abandoned():
+                    self.dropped += len(documents)
+                    continue
+                try:
+                    self.insert_into(name, documents)
+                except Exception:  # pylint: disable=broad-except
+                    msg = 'Error writing events to the MongoDB event tracker backend'
+                    log.exception(msg)
+
+    def encode_groups(self, documents):
+        """Group documents by collection, see `group_documents`, and encode each group, see `encode_documents`"""
+        codec_options = self.database.codec_options
+        return [
+            (name, encode_documents(group, codec_options))
+            for name, group in self.group_documents(documents)
+        ]
+
+    def get_time(self, document):
+        """The timestamp of a document, which is the current time if it has none"""
+        for field in (self.time_field, 'timestamp'):
+            timestamp = document.get(field)
+            if isinstance(timestamp, datetime):
+                return timestamp
+        return datetime.now(UTC)
+
+    def collection_name_for(self, timestamp):
+        """The name of the collection that events with the given timestamp are written to"""
+        if self.bucket_interval is None:
+            return self.collection_name
+        start = bucket_start(timestamp, self.bucket_interval)
+        return start.strftime(self.bucket_pattern.format(collection=self.collection_name))
+
+    def collection_names_between(self, start=None, end=None):
+        """
+        The names of the collections that may contain events with timestamps from `start` to `end`, earliest first.
+
+        If either end of the range is None, the range is open, and the existing buckets are listed to find the ones in
+        the range.
+        """
+        if self.bucket_interval is None:
+            return [self.collection_name]
+        if start is not None and end is not None:
+            return [self.collection_name_for(bucket) for bucket in bucket_starts(start, end, self.bucket_interval)]
+
+        pattern = self.bucket_pattern.format(collection=self.collection_name)
+        length = timedelta(days=BUCKET_DAYS[self.bucket_interval])
+        buckets = []
+        for name in self.database.list_collection_names():
+            try:
+                bucket = datetime.strptime(name, pattern).replace(tzinfo=UTC)
+            except ValueError:
+                continue
+            if (start is None or bucket + length > as_utc(start)) and (end is None or bucket < as_utc(end)):
+                buckets.append((bucket, name))
+        return [name for _, name in sorted(buckets)]
+
+    def get_collection(self, name):
+        """Get a collection that events are written to, creating and indexing it if this is its first use"""
+        if not self.partitioned:
+            return self.collection
+
+        if name not in self.prepared_collections:
+            self.prepare_collection(name)
+            self.prepared_collections.add(name)
+        return self.database[name]
+
+    def prepare_collection(self, name):
+        """
+        Create a time series collection, or the indexes of a bucket, unless they exist already.
+
+        A bucket whose indexes can't be created, for example because the user may only insert documents, is still
+        written to, the error is only logged.
+        """
+        if not self.time_series:
+            if self.index_creation:
+                self.create_indexes_safely(self.database[name])
+            return
+
+        options = {
+            'timeseries': {'timeField': self.time_field, 'metaField': 'name', 'granularity': 'seconds'},
+        }
+        if self.ttl:
+            options['expireAfterSeconds'] = self.ttl
+        try:
+            self.database.create_collection(name, **options)
+        except CollectionInvalid:
+            pass
+        except OperationFailure as error:
+            if error.code != NAMESPACE_EXISTS:
+                raise
+
+    def group_documents(self, documents):
+        """
+        Group documents by the collection they are written to, keeping their order within each collection.
+
+        Returns a list of (collection name, documents) tuples. Each document is given its timestamp, see `stamp`.
+        """
+        timestamps = [self.stamp(document) for document in documents]
+        if not self.partitioned:
+            return [(self.collection_name, documents)]
+
+        groups = OrderedDict()
+        for document, timestamp in zip(documents, timestamps):
+            groups.setdefault(self.collection_name_for(timestamp), []).append(document)
+        return list(groups.items())
+
+    def stamp(self, document):
+        """
+        Set the `time_field` of a document that doesn't have it, and return its timestamp, see `get_time`.
+
+        The time index, the expiry of events and queries by time all use the `time_field`, so events that only have a
+        "timestamp", like those emitted by a `Tracker`, are given a copy of it. With `ttl` or `time_series`, documents
+        without either are given the current time, so that they expire. Documents that are already encoded can't be
+        changed, and must have their timestamp.
+        """
+        timestamp = self.get_time(document)
+        if isinstance(document, dict) and not isinstance(document.get(self.time_field), datetime):
+            if isinstance(document.get('timestamp'), datetime) or self.time_series or self.ttl:
+                document[self.time_field] = timestamp
+        return timestamp
+
+    def insert_documents(self, documents):
+        """Insert documents in to the collections they belong to, see `group_documents` and `insert_into`"""
+        for name, group in self.group_documents(documents):
+            self.insert_into(name, group)
+
+    def insert_into(self, name, documents):
+        """
+        Insert documents in to a Mongo collection, retrying the documents that fail.
+
+        Logs and swallows any errors, in which case the documents that could not be inserted are lost.
+        """
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            if not documents:
+                return
+            if attempt > 0:
+                time.sleep(delay)
+                delay *= 2
+
+            try:
+                self.get_collection(name).insert_many(documents, ordered=False)
+                self.unreachable = False
+                return
+            except BulkWriteError as error:
+                self.unreachable = False
+                documents = failed_documents(documents, error.details)
+            except BSONError:
+                # A document that can't be encoded fails the whole batch, so insert them one at a time.
+                self.insert_each(name, documents)
+                return
+            except ConnectionFailure:
+                msg = 'Error connecting to MongoDB event tracker backend, %d events are lost'
+                log.exception(msg, len(documents))
+                self.unreachable = True
+                return
+            except PyMongoError:
+                # The event will be lost in case of a connection error or any error
+                # that occurs when trying to insert the event into Mongo.
+                # pymongo will re-connect/re-authenticate automatically
+                # during the next event.
+                msg = 'Error inserting to MongoDB event tracker backend'
+                log.exception(msg)
+                return
+
+        if documents:
+            log.error('Failed to insert %d events to MongoDB event tracker backend', len(documents))
+
+    def insert_each(self, name, documents):
+        """Insert documents one at a time, logging and skipping those that fail"""
+        for document in documents:
+            try:
+                self.get_collection(name).insert_one(document)
+            except (PyMongoError, BSONError):
+                msg = 'Error inserting to MongoDB event tracker backend'
+                log.exception(msg)
+
+    def find_events(self, name=None, start=None, end=None, context=None, **kwargs):
+        """
+        Find the stored events that match the given criteria.
+
+        `name` is the name of the events.
+        `start` and `end` are the datetimes that the timestamps of the events are from, and before.
+        `context` is a dictionary of values that the fields of the context of the events must be equal to.
+        `query` is a MongoDB filter that the events must also match.
+        `fields` is a list of the fields of the events to return, the server only sends these fields. The _id is only
+            returned if it is listed.
+        `batch_size` is the number of events fetched from the server at a time.
+        `hint` is the index used by the query. By default, the time index is used for queries with a range of time
+            and the name index for queries by name, and the query planner chooses otherwise. Set it to None if the
+            indexes don't exist.
+        `sort` is either `pymongo.ASCENDING` or `pymongo.DESCENDING` to order the events by time, or None to return
+            them in the order they are found.
+        The other keyword arguments are passed to `Collection.find`.
+
+        Events are fetched in batches as the generator is consumed, so any number of events can be read in constant
+        memory. With `bucket_interval`, each bucket that overlaps the range of time is queried in turn.
+
+        Returns a generator that yields each event.
+        """
+        query = dict(kwargs.pop('query', None) or {})
+        if name is not None:
+            query['name'] = name
+        time_range = {}
+        if start is not None:
+            time_range['$gte'] = start
+        if end is not None:
+            time_range['$lt'] = end
+        if time_range:
+            query[self.time_field] = time_range
+        for field, value in (context or {}).items():
+            query['context.' + field] = value
+
+        fields = kwargs.pop('fields', None)
+        if fields is not None:
+            projection = {field: True for field in fields}
+            projection.setdefault('_id', False)
+            kwargs['projection'] = projection
+
+        hint = kwargs.pop('hint', AUTO)
+        if hint == AUTO:
+            hint = self.choose_index(name, time_range)
+        if hint is not None:
+            kwargs['hint'] = hint
+
+        sort = kwargs.pop('sort', None)
+        if sort is not None:
+            kwargs['sort'] = [(self.time_field, sort)]
+
+        kwargs.setdefault('batch_size', DEFAULT_QUERY_BATCH_SIZE)
+        names = self.collection_names_between(start, end)
+        if sort == pymongo.DESCENDING:
+            names.reverse()
+        return self.query_collections(names, query, kwargs)
+
+    def query_collections(self, names, query, find_kwargs):
+        """Yield the events that match the query in each of the named collections in turn"""
+        for name in names:
+            cursor = self.database[name].find(query, **find_kwargs)
+            try:
+                for event in cursor:
+                    yield event
+            finally:
+                # Release the cursor on the server if the generator isn't consumed completely.
+                cursor.close()
+
+    def choose_index(self, name, time_range):
+        """The index that a query by name and range of time uses, see `create_indexes`"""
+        if self.time_series:
+            return None
+        if time_range:
+            return [(self.time_field, pymongo.DESCENDING)]
+        if name is not None:
+            return [('name', pymongo.ASCENDING)]
+        return None
+
+    def find_between(self, start, end, query=None, **kwargs):
+        """
+        Find the events with timestamps from the datetime `start` up to, but not including, `end`.
+
+        `query` is a MongoDB filter that the events must also match. The other keyword arguments are passed to
+        `Collection.find`. With `bucket_interval`, each of the buckets that overlap the range is queried in turn,
+        starting with the earliest, so events are returned in order of bucket but not necessarily of time within a
+        bucket unless a `sort` is given. See `find_events` for more ways to query events.
+
+        Returns a generator that yields each event.
+        """
+        query = dict(query or {})
+        query[self.time_field] = {'$gte': start, '$lt': end}
+        return self.query_collections(self.collection_names_between(start, end), query, kwargs)
+
+    def flush(self):
+        """Write all of the buffered events and wait until they have been written"""
+        if self.worker_pid != os.getpid():
+            return
+
+        flushed = threading.Event()
+        self.queue.put(flushed)
+        flushed.wait()
+
+    def close(self):
+        """
+        Write the buffered events, stop the background thread and release the client.
+
+        Waits at most `close_timeout` seconds, after which the events that haven't been written are dropped.
+        """
+        with self.lock:
+            worker = None
+            if self.worker_pid == os.getpid():
+                worker = self.worker
+                self.worker = None
+                self.worker_pid = None
+                deadline = self.close_deadline = time.monotonic() + self.close_timeout
+                # Only a failure to reach the database while closing drops the events that are left.
+                self.unreachable = False
+                # Sent while holding the lock, so that it is received by this worker rather than one started later.
+                try:
+                    self.queue.put(None, timeout=self.close_timeout)
+                except queue.Full:
+                    pass
+
+        if worker is not None:
+            worker.join(max(deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                log.error('Timed out writing the buffered events to MongoDB event tracker backend')
+                with self.lock:
+                    # A worker started later must not share the queue of this one, which may still be writing.
+                    if self.worker_pid is None:
+                        self.queue = queue.Queue(maxsize=self.queue_size)
+                return
+        self.disconnect()
+
+    def disconnect(self):
+        """Release the client, which is closed if no other backend is using it"""
+        with self.connect_lock:
+            if self._collection is None or self.connection_pid != os.getpid():
+                return
+
+            self.registry.release(self._connection)
+            self.registry = None
+            self.connection_pid = None
+            self._connection = None
+            self._database = None
+            self._collection = None
@@ -3,14 +3,50 @@
 from __future__ import absolute_import
 
 import logging
+import time
 from collections import OrderedDict
 
 import six
 
+from eventtracking.backends.serialization import SharedSerialization
 from eventtracking.processors.exceptions import EventEmissionExit
 
 LOG = logging.getLogger(__name__)
 
+DEFAULT_REORDER_INTERVAL = 1000
+
+
+class FilterStatistics:
+    """
+    Running measurements of the cost and selectivity of a processor that is a pure filter.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.rejections = 0
+        self.elapsed = 0.0
+
+    @property
+    def score(self):
+        """
+        The expected cost of running the filter per event it rejects.
+
+        Running filters in ascending order of score minimizes the expected cost of processing an event. The counts are
+        smoothed so that filters that have never run or never rejected an event still get a finite score.
+        """
+        average_cost = self.elapsed / (self.calls + 1)
+        rejection_rate = (self.rejections + 1.0) / (self.calls + 2.0)
+        return average_cost / rejection_rate
+
+
+def is_pure_filter(processor):
+    """
+    True if the processor has declared that it is a pure filter.
+
+    A pure filter never modifies the event, it either returns it unchanged or raises `EventEmissionExit`.
+    """
+    return getattr(processor, 'pure_filter', False) is True
+
 
 class RoutingBackend:
     """
@@ -25,7 +61,9 @@ class RoutingBackend:
        and highly nested, so creating multiple copies could be problematic. A processor can also choose to prevent the
        event from being emitted by raising `EventEmissionExit`. Doing so will prevent any subsequent processors from
        running and prevent the event from being sent to the backends. Any other exception raised by a processor will be
-       logged and swallowed, subsequent processors will execute and the event will be emitted.
+       logged and swallowed, subsequent processors will execute and the event will be emitted. Processors that expose
+       an `attach_router(router)` method are passed the routing backend when they are registered, which lets them emit
+       events of their own through the rest of the pipeline using `send_from`.
     2) Backends - Backends are intended to not mutate the event and each receive the same event data. They are not
        chained like processors. Once an event has been processed by the processor chain, it is passed to each backend in
        the order that they were registered. Backends typically persist the event in some way, either by sending it
@@ -37,14 +75,26 @@ class RoutingBackend:
         sortable and the values are expected to expose a `send(event)` method that will be called for each event. Each
         backend in this collection is registered in order sorted alphanumeric ascending by key.
     `processors` is an iterable of callables.
+    `reorder_filters` enables adaptive ordering of processors that are pure filters. A processor declares that it is a
+        pure filter by setting its `pure_filter` attribute to True, promising that it never modifies the event and only
+        ever returns it unchanged or raises `EventEmissionExit`. The cost and rejection rate of each filter is measured,
+        and every `reorder_interval` events each run of consecutive filters is sorted so that the cheapest, most
+        selective filters run first. Filters are never moved past a processor that is not a pure filter, and those
+        processors always run in the order they were registered, so the outcome of processing is unchanged.
 
     Raises a `ValueError` if any of the provided backends do not have a callable "send" attribute or any of the
         processors are not callable.
     """
 
-    def __init__(self, backends=None, processors=None):
+    def __init__(self, backends=None, processors=None, reorder_filters=False,
+                 reorder_interval=DEFAULT_REORDER_INTERVAL):
         self.backends = OrderedDict()
         self.processors = []
+        self.reorder_filters = reorder_filters
+        self.reorder_interval = reorder_interval
+        self.filter_statistics = {}
+        self.execution_plan = []
+        self.events_until_reorder = reorder_interval
 
         if backends is not None:
             for name in sorted(backends.keys()):
@@ -65,6 +115,27 @@ class RoutingBackend:
 
         self.backends[name] = backend
 
+    def warm_up(self):
+        """
+        Prepare the registered backends to send events, for example by connecting to external systems.
+
+        Calls the `warm_up()` method of each backend that has one, which includes nested routing backends. This is
+        intended to be called by each worker process of a pre-fork server once it has started, so that the first event
+        doesn't wait for the backends to connect.
+
+        Logs and swallows all `Exception`.
+        """
+        for name, backend in six.iteritems(self.backends):
+            warm_up = getattr(backend, 'warm_up', None)
+            if not callable(warm_up):
+                continue
+            try:
+                warm_up()
+            except Exception:  # pylint: disable=broad-except
+                LOG.exception(
+                    'Unable to warm up backend: %s', name
+                )
+
     def register_processor(self, processor):
         """
         Register a new processor.
@@ -76,6 +147,37 @@ class RoutingBackend:
 
         self.processors.append(processor)
 
+        if self.reorder_filters:
+            if is_pure_filter(processor):
+                self.filter_statistics[id(processor)] = FilterStatistics()
+            self.reorder_processors()
+
+        attach_router = getattr(processor, 'attach_router', None)
+        if callable(attach_router):
+            attach_router(self)
+
+    def reorder_processors(self):
+        """
+        Rebuild the execution plan, sorting each run of consecutive pure filters by their score.
+
+        The execution plan is a list of `(processor, statistics)` pairs, where `statistics` is None for processors
+        that are not pure filters.
+        """
+        plan = []
+        filters = []
+        for processor in self.processors:
+            statistics = self.filter_statistics.get(id(processor))
+            if statistics is not None:
+                filters.append((processor, statistics))
+                continue
+
+            plan.extend(sorted(filters, key=lambda entry: entry[1].score))
+            filters = []
+            plan.append((processor, None))
+        plan.extend(sorted(filters, key=lambda entry: entry[1].score))
+
+        self.execution_plan = plan
+
     def send(self, event):
         """
         Process the event using all registered processors and send it to all registered backends.
@@ -89,6 +191,67 @@ class RoutingBackend:
         else:
             self.send_to_backends(processed_event)
 
+    def send_batch(self, events):
+        """
+        Process a batch of events using all registered processors and send them to all registered backends.
+
+        Backends that expose a callable `send_batch(events)` method are passed all of the processed events at once, the
+        others are passed each event in turn using `send`, as if `send` had been called for each event. Events that a
+        processor prevents from being emitted are left out of the batch.
+
+        Logs and swallows all `Exception`.
+        """
+        processed_events = []
+        for event in events:
+            try:
+                processed_events.append(self.process_event(event))
+            except EventEmissionExit:
+                continue
+
+        if not processed_events:
+            return
+
+        # Backends are still called in the order they were registered. Consecutive backends without `send_batch` are
+        # passed each event in turn, so that they share its serialized form.
+        backends = []
+        for name, backend in six.iteritems(self.backends):
+            if not callable(getattr(backend, 'send_batch', None)):
+                backends.append((name, backend))
+                continue
+
+            self.send_each(backends, processed_events)
+            backends = []
+            try:
+                backend.send_batch(processed_events)
+            except Exception:  # pylint: disable=broad-except
+                LOG.exception(
+                    'Unable to send events to backend: %s', name
+                )
+        self.send_each(backends, processed_events)
+
+    def send_each(self, backends, events):
+        """Sends each of the events to the `(name, backend)` pairs in `backends`, using their `send` method"""
+        if backends:
+            for event in events:
+                self.send_to(backends, event)
+
+    def send_from(self, processor, event):
+        """
+        Send an event that was generated by one of the registered processors.
+
+        The event is processed by all of the processors registered after `processor` and then sent to all registered
+        backends. This allows processors to inject new events into the remainder of the pipeline.
+
+        Logs and swallows all `Exception`.
+        """
+        remaining_processors = self.processors[self.processors.index(processor) + 1:]
+        try:
+            processed_event = self.run_processors(remaining_processors, event)
+        except EventEmissionExit:
+            return
+        else:
+            self.send_to_backends(processed_event)
+
     def process_event(self, event):
         """
 
@@ -101,36 +264,98 @@ class RoutingBackend:
         Returns the modified event.
         """
 
-        if len(self.processors) == 0:
-            return event
+        if self.reorder_filters:
+            return self.run_execution_plan(event)
+
+        return self.run_processors(self.processors, event)
+
+    def run_execution_plan(self, event):
+        """
+        Executes all event processors on the event in the order of the execution plan, measuring the filters.
+
+        See `process_event` for details.
+        """
+        self.events_until_reorder -= 1
+        if self.events_until_reorder <= 0:
+            self.events_until_reorder = self.reorder_interval
+            self.reorder_processors()
 
         processed_event = event
 
-        for processor in self.processors:
+        for processor, statistics in self.execution_plan:
+            if statistics is None:
+                processed_event = self.run_processor(processor, processed_event)
+                continue
+
+            start_time = time.perf_counter()
             try:
-                modified_event = processor(processed_event)
-                if modified_event is not None:
-                    processed_event = modified_event
+                processed_event = self.run_processor(processor, processed_event)
             except EventEmissionExit:
+                statistics.rejections += 1
                 raise
-            except Exception:  # pylint: disable=broad-except
-                LOG.exception(
-                    'Failed to execute processor: %s', str(processor)
-                )
+            finally:
+                statistics.calls += 1
+                statistics.elapsed += time.perf_counter() - start_time
 
         return processed_event
 
+    def run_processors(self, processors, event):
+        """
+        Executes the given processors on the event in order.
+
+        See `process_event` for details.
+        """
+        if len(processors) == 0:
+            return event
+
+        processed_event = event
+
+        for processor in processors:
+            processed_event = self.run_processor(processor, processed_event)
+
+        return processed_event
+
+    def run_processor(self, processor, event):
+        """
+        Executes a single processor on the event and returns the event it produced, or `event` if it returned None.
+
+        Logs and swallows all `Exception` except `EventEmissionExit`, returning `event` unchanged.
+        """
+        try:
+            modified_event = processor(event)
+        except EventEmissionExit:
+            raise
+        except Exception:  # pylint: disable=broad-except
+            LOG.exception(
+                'Failed to execute processor: %s', str(processor)
+            )
+            return event
+
+        return modified_event if modified_event is not None else event
+
     def send_to_backends(self, event):
         """
         Sends the event to all registered backends.
 
+        Backends that serialize the event share the result, see `SharedSerialization`. If this router has processors,
+        they may have modified the event, so serialized forms computed by an enclosing router are not reused.
+
         Logs and swallows all `Exception`.
         """
 
-        for name, backend in six.iteritems(self.backends):
-            try:
-                backend.send(event)
-            except Exception:  # pylint: disable=broad-except
-                LOG.exception(
-                    'Unable to send event to backend: %s', name
-                )
+        self.send_to(six.iteritems(self.backends), event)
+
+    def send_to(self, backends, event):
+        """
+        Sends the event to each of the `(name, backend)` pairs in `backends`.
+
+        See `send_to_backends` for details.
+        """
+        with SharedSerialization(event, isolated=bool(self.processors)):
+            for name, backend in backends:
+                try:
+                    backend.send(event)
+                except Exception:  # pylint: disable=broad-except
+                    LOG.exception(
+                        'Unable to send event to backend: %s', name
+                    )
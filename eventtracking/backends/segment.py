@@ -1,13 +1,48 @@
 """Event tracking backend that sends events to segment.com"""
 
 from __future__ import absolute_import
+
+from collections import OrderedDict
+from datetime import datetime
+import threading
+
+from pytz import UTC
+import six
 from six.moves.urllib.parse import urlunsplit
 
+from eventtracking import ids
+from eventtracking.backends.serialization import encode_datetime, get_serializer
+from eventtracking.backends.transport import BatchTransport, json_array
+from eventtracking.processors.fields import compile_projection
+
 try:
     import analytics
 except ImportError:
     analytics = None
 
+SEGMENT_BATCH_URL = 'https://api.segment.io/v1/batch'
+# The limits documented for the batch endpoint of the HTTP tracking API.
+MAX_MESSAGE_BYTES = 32 * 1024
+MAX_BATCH_BYTES = 500 * 1024
+MAX_BATCH_SIZE = 100
+# Room left in a batch for the object that wraps the messages.
+BATCH_ENVELOPE_BYTES = 1024
+
+# The number of combinations of page fields whose "page" context is kept.
+MAX_CACHED_PAGES = 1024
+
+# Options that are passed to the `BatchTransport`.
+TRANSPORT_OPTIONS = (
+    'compress', 'max_batch_size', 'flush_interval', 'queue_size', 'timeout', 'max_retries', 'retry_delay',
+    'max_retry_delay', 'concurrency', 'close_timeout',
+)
+
+
+def build_batch(parts):
+    """Build the body of a request to the batch endpoint from serialized messages"""
+    sent_at = encode_datetime(datetime.now(UTC)).encode('ascii')
+    return b'{"batch":' + json_array(parts) + b',"sentAt":"' + sent_at + b'"}'
+
 
 class SegmentBackend:
     """
@@ -43,13 +78,82 @@ class SegmentBackend:
     and 'path' are present, these are used to create a URL value to substitute for the 'page' value.
 
     Note that although some parts of the event are lifted out to pass explicitly into the Segment.com API, the entire
-    event is sent as the payload to segment.com, which includes all context, data and other fields in the event.
+    event is sent as the payload to segment.com, which includes all context, data and other fields in the event,
+    unless a projection is configured for it. For example, with these options::
+
+        {
+            'projections': {
+                'edx.course.enrollment.activated': ['name', 'timestamp', 'data.course_id', 'context.org_id'],
+            },
+            'default_projection': ['name', 'timestamp'],
+        }
+
+    only the course and organization are sent along with the name and time of enrollment events, and other events are
+    sent with just their name and time.
+
+    By default, events are sent using the segment.com python API, which must be initialized elsewhere. If a
+    `write_key` is given instead, the backend sends events to the batch endpoint of the HTTP tracking API itself,
+    using a `BatchTransport`. Events are then queued and sent from background threads, in gzip compressed batches
+    that respect the size limits of the endpoint, over connections that are kept open. The counters in `statistics`
+    describe the events that were delivered, dropped and retried.
 
     """
 
+    def __init__(self, **kwargs):
+        """
+        Send events to segment.com
+
+        `write_key` is the write key of the Segment source. If it is not given, events are sent using the segment.com
+            python API instead.
+        `url` is the URL of the batch endpoint.
+        `serializer` is the name of the serializer used to convert messages to JSON, see
+            `eventtracking.backends.serialization.get_serializer`.
+        `projections` is a dictionary that maps event names to the list of fields of those events that are sent as the
+            payload, as dot separated paths such as "data.course_id", see
+            `eventtracking.processors.fields.compile_projection`.
+        `default_projection` is the list of fields sent for events that don't have a projection. By default, the
+            entire event is sent.
+        `max_cached_pages` is the number of distinct combinations of host, path, page and referer for which the "page"
+            context is kept, rather than built again for each event.
+
+        The `compress`, `max_batch_size`, `flush_interval`, `queue_size`, `timeout`, `max_retries`, `retry_delay`,
+        `max_retry_delay`, `concurrency` and `close_timeout` parameters configure the transport, see `BatchTransport`.
+        Batches are compressed by default.
+        """
+        self.projections = {
+            name: compile_projection(paths) for name, paths in kwargs.get('projections', {}).items()
+        }
+        default_projection = kwargs.get('default_projection')
+        self.default_projection = compile_projection(default_projection) if default_projection is not None else None
+        self.max_cached_pages = kwargs.get('max_cached_pages', MAX_CACHED_PAGES)
+        self.pages = OrderedDict()
+        self.pages_lock = threading.Lock()
+
+        self.write_key = kwargs.get('write_key')
+        self.transport = None
+        self.serializer = None
+        if self.write_key:
+            options = {name: kwargs[name] for name in TRANSPORT_OPTIONS if name in kwargs}
+            options.setdefault('compress', True)
+            options['max_batch_size'] = min(options.get('max_batch_size', MAX_BATCH_SIZE), MAX_BATCH_SIZE)
+            self.transport = BatchTransport(
+                url=kwargs.get('url', SEGMENT_BATCH_URL),
+                build_body=build_batch,
+                username=self.write_key,
+                max_batch_bytes=MAX_BATCH_BYTES - BATCH_ENVELOPE_BYTES,
+                max_record_bytes=MAX_MESSAGE_BYTES,
+                **options
+            )
+            self.serializer = get_serializer(kwargs.get('serializer'))
+
+    @property
+    def statistics(self):
+        """The statistics of the transport, or None if events are sent using the segment.com python API"""
+        return self.transport.statistics if self.transport is not None else None
+
     def send(self, event):
-        """Use the segment.com python API to send the event to segment.com"""
-        if analytics is None:
+        """Send the event to segment.com"""
+        if self.transport is None and analytics is None:
             return
 
         context = event.get('context', {})
@@ -58,6 +162,39 @@ class SegmentBackend:
         if name is None or user_id is None:
             return
 
+        segment_context = self.segment_context(context)
+        properties = self.project(name, event)
+        if self.transport is None:
+            analytics.track(
+                user_id,
+                name,
+                properties,
+                context=segment_context
+            )
+            return
+
+        message = {
+            'type': 'track',
+            'userId': six.text_type(user_id),
+            'event': name,
+            'properties': properties,
+            'context': segment_context,
+            'timestamp': event.get('timestamp') or datetime.now(UTC),
+            'messageId': ids.new_id(),
+        }
+        self.transport.add(self.serializer.serialize(message).encode('utf-8'))
+
+    def project(self, name, event):
+        """The fields of the event that are sent as the payload"""
+        projection = self.projections.get(name, self.default_projection)
+        return projection(event) if projection is not None else event
+
+    def segment_context(self, context):
+        """
+        Build the context sent to segment.com from the context of an event.
+
+        The "page" dictionary is shared by events with the same page fields, so it must not be modified.
+        """
         segment_context = {}
 
         ga_client_id = context.get('client_id')
@@ -71,30 +208,57 @@ class SegmentBackend:
         user_agent = context.get('agent')
         if user_agent is not None:
             segment_context['userAgent'] = user_agent
-        path = context.get('path')
-        referer = context.get('referer')
-        page = context.get('page')
+        page = self.page_context(context.get('host'), context.get('path'), context.get('referer'), context.get('page'))
+        if page is not None:
+            segment_context['page'] = page
+
+        return segment_context
+
+    def page_context(self, host, path, referer, page):
+        """The "page" dictionary of the context sent to segment.com, or None if there is no page information"""
+        key = (host, path, referer, page)
+        try:
+            return self.pages[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Some of the values can't be hashed, so they can't be cached either.
+            return self.build_page_context(host, path, referer, page)
+
+        page_context = self.build_page_context(host, path, referer, page)
+        with self.pages_lock:
+            self.pages[key] = page_context
+            if len(self.pages) > self.max_cached_pages:
+                self.pages.popitem(last=False)
+        return page_context
 
+    def build_page_context(self, host, path, referer, page):
+        """Build the "page" dictionary of the context sent to segment.com"""
         if path and not page:
             # Try to put together a url from host and path, hardcoding the schema.
             # (Segment doesn't care about the schema for GA, but will extract the host and path from the url.)
-            host = context.get('host')
             if host:
                 parts = ("https", host, path, "", "")
                 page = urlunsplit(parts)
 
-        if path is not None or referer is not None or page is not None:
-            segment_context['page'] = {}
-            if path is not None:
-                segment_context['page']['path'] = path
-            if referer is not None:
-                segment_context['page']['referrer'] = referer
-            if page is not None:
-                segment_context['page']['url'] = page
-
-        analytics.track(
-            user_id,
-            name,
-            event,
-            context=segment_context
-        )
+        if path is None and referer is None and page is None:
+            return None
+
+        page_context = {}
+        if path is not None:
+            page_context['path'] = path
+        if referer is not None:
+            page_context['referrer'] = referer
+        if page is not None:
+            page_context['url'] = page
+        return page_context
+
+    def flush(self):
+        """Wait until the queued events have been sent, when sending them to the batch endpoint"""
+        if self.transport is not None:
+            self.transport.flush()
+
+    def close(self):
+        """Send the queued events and stop the transport"""
+        if self.transport is not None:
+            self.transport.close()
@@ -0,0 +1,276 @@
+"""Serialize events for backends that persist them as JSON"""
+
+from __future__ import absolute_import
+
+from datetime import datetime
+from datetime import date
+from datetime import timedelta
+import json
+import threading
+
+from pytz import UTC
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ZERO = timedelta(0)
+
+LOCAL = threading.local()
+
+
+def encode_datetime(obj):
+    """
+    Serialize a datetime object in iso format, converting it to UTC.
+
+    Naive datetime objects are assumed to be in UTC already. The result is identical to
+    `UTC.localize(obj).isoformat()` or `obj.astimezone(UTC).isoformat()`, but avoids the conversion entirely for
+    objects that are naive or already in UTC, which are by far the most common.
+    """
+    offset = obj.utcoffset()
+    if offset is None:
+        return obj.isoformat() + '+00:00'
+    elif offset == ZERO:
+        return obj.isoformat()
+    return obj.astimezone(UTC).isoformat()
+
+
+def encode_date(obj):
+    """Serialize a date object in iso format"""
+    return obj.isoformat()
+
+
+ENCODERS_BY_TYPE = {
+    datetime: encode_datetime,
+    date: encode_date,
+}
+
+
+def encode_default(obj):
+    """
+    Serialize objects that JSON doesn't support natively.
+
+    Raises a `TypeError` if the object can't be serialized.
+    """
+    encoder = ENCODERS_BY_TYPE.get(type(obj))
+    if encoder is not None:
+        return encoder(obj)
+
+    # Subclasses of the supported types are slower to find.
+    if isinstance(obj, datetime):
+        return encode_datetime(obj)
+    elif isinstance(obj, date):
+        return encode_date(obj)
+
+    raise TypeError('Object of type {0} is not JSON serializable'.format(obj.__class__.__name__))
+
+
+# Lower bounds for the serialized size of values that are not containers or strings
+MINIMUM_SIZES_BY_TYPE = {
+    type(None): 4,
+    bool: 4,
+    datetime: 27,
+    date: 12,
+}
+# Lower bound for the serialized size of dictionary keys that are not strings
+MINIMUM_KEY_SIZE = 3
+
+
+def estimate_size(obj, limit=None, compact=False):
+    """
+    Estimate the length of the JSON serialized form of an object without serializing it.
+
+    The estimate is a lower bound: the object is guaranteed to serialize to at least this many characters. It is exact
+    for strings that contain no characters that need escaping, which make up the bulk of most large events.
+
+    By default, separators are counted as written by the standard library, ", " and ": ". If `compact` is True, they
+    are counted as single characters, as written by serializers such as orjson, see `Serializer.compact`.
+
+    If `limit` is provided, the estimate stops as soon as it exceeds the limit and the partial estimate, which is still
+    a lower bound, is returned. This makes the cost of detecting an oversized event proportional to the limit rather
+    than to the size of the event.
+    """
+    separator_size = 1 if compact else 2
+    size = 0
+    pending = [obj]
+    while pending:
+        value = pending.pop()
+        value_type = type(value)
+        if value_type is str or isinstance(value, str):
+            size += len(value) + 2
+        elif isinstance(value, dict):
+            # Braces, plus ": " after each key and ", " between the items
+            size += 2 + max(0, 2 * separator_size * len(value) - separator_size)
+            for key, item in value.items():
+                size += len(key) + 2 if isinstance(key, str) else MINIMUM_KEY_SIZE
+                pending.append(item)
+        elif isinstance(value, (list, tuple)):
+            # Brackets, plus ", " between the items
+            size += 2 + max(0, separator_size * len(value) - separator_size)
+            pending.extend(value)
+        else:
+            size += MINIMUM_SIZES_BY_TYPE.get(value_type, 1)
+
+        if limit is not None and size > limit:
+            break
+
+    return size
+
+
+class DateTimeJSONEncoder(json.JSONEncoder):
+    """JSON encoder aware of datetime.datetime and datetime.date objects"""
+
+    def default(self, obj):  # lint-amnesty, pylint: disable=arguments-differ, method-hidden
+        """
+        Serialize datetime and date objects of iso format.
+
+        datatime objects are converted to UTC.
+        """
+        try:
+            return encode_default(obj)
+        except TypeError:
+            return super(DateTimeJSONEncoder, self).default(obj)
+
+
+class SharedSerialization:
+    """
+    Share the serialized forms of an event between all of the backends that it is sent to.
+
+    While this context manager is active, the first call to `Serializer.serialize` for `event` stores the result, and
+    subsequent calls by serializers with the same name reuse it. This is tracked per thread, and only for the exact
+    event object passed in.
+
+    Scopes can be nested, as happens when a `RoutingBackend` is registered as a backend of another one. A nested scope
+    for the same event reuses the results of the enclosing scope, unless it is `isolated`. An isolated scope should be
+    used when the event may have been modified since the enclosing scope was entered, for example by processors. In
+    that case the nested scope starts out empty, and the results of the enclosing scope are discarded when it exits,
+    since they may no longer match the event.
+    """
+
+    def __init__(self, event, isolated=False):
+        self.event = event
+        self.isolated = isolated
+        self.results = {}
+        self.parent = None
+
+    def __enter__(self):
+        self.parent = getattr(LOCAL, 'scope', None)
+        if not self.isolated and self.parent is not None and self.parent.event is self.event:
+            self.results = self.parent.results
+        LOCAL.scope = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        LOCAL.scope = self.parent
+        if self.isolated and self.parent is not None and self.parent.event is self.event:
+            self.parent.results.clear()
+        self.parent = None
+
+
+class Serializer:
+    """
+    Base class for serializers, which convert events to strings.
+
+    Subclasses must define a unique `name` and implement `encode`. Serializers that write separators without spaces
+    must set `compact`, so that size estimates remain lower bounds, see `estimate_size`.
+    """
+
+    name = None
+    compact = False
+
+    def serialize(self, event):
+        """
+        Return the serialized event.
+
+        Inside of a `SharedSerialization` scope for the event, the event is only encoded once for all serializers
+        sharing the same name.
+        """
+        scope = getattr(LOCAL, 'scope', None)
+        if scope is None or scope.event is not event:
+            return self.encode(event)
+
+        try:
+            return scope.results[self.name]
+        except KeyError:
+            serialized = scope.results[self.name] = self.encode(event)
+            return serialized
+
+    def encode(self, event):
+        """Return the event serialized as a string"""
+        raise NotImplementedError
+
+
+class JSONSerializer(Serializer):
+    """
+    Serialize events using the standard library JSON encoder.
+
+    A single encoder instance is reused for every event, rather than constructing a new one for each call like
+    `json.dumps(event, cls=DateTimeJSONEncoder)` does. The output is identical.
+    """
+
+    name = 'json'
+
+    def __init__(self):
+        self.encoder = DateTimeJSONEncoder()
+
+    def encode(self, event):
+        """Return the event serialized as a JSON string"""
+        return self.encoder.encode(event)
+
+
+class OrjsonSerializer(Serializer):
+    """
+    Serialize events using the orjson library, which is several times faster than the standard library.
+
+    The output is equivalent JSON, with dates and times encoded the same way, but it is not byte-for-byte identical:
+    it is compact (no spaces after separators) and non-ASCII characters are not escaped. Events that orjson can't
+    serialize, such as those that contain integers larger than 64 bits, are serialized using the standard library
+    instead.
+    """
+
+    name = 'orjson'
+    compact = True
+
+    def __init__(self):
+        if orjson is None:
+            raise ValueError('The orjson serializer requires the "orjson" package to be installed')
+
+        self.options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        self.fallback = JSONSerializer()
+
+    def encode(self, event):
+        """Return the event serialized as a JSON string"""
+        try:
+            return orjson.dumps(event, default=encode_default, option=self.options).decode('utf-8')
+        except TypeError:
+            return self.fallback.encode(event)
+
+
+SERIALIZERS = {
+    JSONSerializer.name: JSONSerializer,
+    OrjsonSerializer.name: OrjsonSerializer,
+}
+FASTEST = 'fastest'
+
+
+def get_serializer(name=None):
+    """
+    Construct the serializer registered with `name`.
+
+    Defaults to the standard library JSON serializer. The special name "fastest" selects orjson if it is installed
+    and the standard library otherwise.
+
+    Raises a `ValueError` if there is no such serializer.
+    """
+    if name is None:
+        name = JSONSerializer.name
+    elif name == FASTEST:
+        name = OrjsonSerializer.name if orjson is not None else JSONSerializer.name
+
+    try:
+        serializer_class = SERIALIZERS[name]
+    except KeyError:
+        raise ValueError('Unknown serializer: {0}'.format(name))
+
+    return serializer_class()
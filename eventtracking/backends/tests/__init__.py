@@ -4,12 +4,18 @@ Helper classes for backend tests
 from __future__ import absolute_import, print_function
 
 from unittest import TestCase
+from collections import deque, namedtuple
 from contextlib import contextmanager
+import gzip
+import json
 import time
 import os
 import random
 import string
+import threading
 from six.moves import range
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
 
 
 class InMemoryBackend:
@@ -24,6 +30,82 @@ class InMemoryBackend:
         self.events.append(event)
 
 
+RecordedRequest = namedtuple('RecordedRequest', ['path', 'headers', 'body', 'client_address', 'time'])
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    """Handle requests to a `StandInServer`, keeping connections open between requests"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Record the request and send the next response"""
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        status, headers = self.server.record(
+            RecordedRequest(self.path, dict(self.headers.items()), body, self.client_address, time.time())
+        )
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Don't log requests"""
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """
+    A local HTTP server that stands in for the services that backends send events to.
+
+    It records every request it receives, decompressing gzip bodies, and responds with the statuses queued with
+    `respond`, or 200 once there are none left. Use it as a context manager to run it in a background thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StandInRequestHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.responses = deque()
+        self.thread = None
+
+    @property
+    def url(self):
+        """The URL of the server"""
+        return 'http://{0}:{1}/'.format(*self.server_address)
+
+    def respond(self, status, headers=None):
+        """Queue a response to a future request"""
+        self.responses.append((status, headers or {}))
+
+    def record(self, request):
+        """Record a request and return the status and headers of the response"""
+        with self.lock:
+            self.requests.append(request)
+            if self.responses:
+                return self.responses.popleft()
+        return 200, {}
+
+    def json_bodies(self):
+        """The bodies of the requests received, parsed as JSON"""
+        return [json.loads(request.body.decode('utf-8')) for request in self.requests]
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+
 class IntegrationTestCase(TestCase):
     """
     Tests the integration between a backend and any external systems
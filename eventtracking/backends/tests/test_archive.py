@@ -0,0 +1,306 @@
+"""Test the compressed archive backend"""
+
+from __future__ import absolute_import
+
+import datetime
+import gzip
+import io
+import json
+import lzma
+import os
+import shutil
+import socket
+import tempfile
+import time
+from unittest import TestCase
+
+from mock import patch
+from pytz import UTC
+from six.moves import range
+
+from eventtracking.backends import index
+from eventtracking.backends.archive import (
+    Block, CompressedArchiveBackend, read_archive, read_blocks, read_events_between
+)
+
+
+class TestCompressedArchiveBackend(TestCase):
+    """Test the compressed archive backend"""
+
+    def setUp(self):
+        super(TestCompressedArchiveBackend, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def create_backend(self, **kwargs):
+        """Build a backend that writes to the temporary directory, and closes it when the test ends"""
+        kwargs.setdefault('directory', self.directory)
+        kwargs.setdefault('flush_interval', 60)
+        backend = CompressedArchiveBackend(**kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+    def segment_paths(self):
+        """The paths of all of the segments in the temporary directory, in the order they were started"""
+        names = sorted(
+            (name for name in os.listdir(self.directory) if not name.endswith(index.SUFFIX)),
+            key=lambda name: int(name.split('-')[-1].split('.')[0])
+        )
+        return [os.path.join(self.directory, name) for name in names]
+
+    def read_all_events(self):
+        """Read the events stored in every segment"""
+        return [event for path in self.segment_paths() for event in read_archive(path)]
+
+    def create_block(self, *events):
+        """Build a block containing the events"""
+        block = Block()
+        for event in events:
+            block.add((json.dumps(event) + '\n').encode('utf-8'), None)
+        return block
+
+    def create_events(self, count):
+        """Build a number of distinct events"""
+        return [{'name': 'test', 'data': {'sequence': i}} for i in range(count)]
+
+    def test_events_written_on_close(self):
+        backend = self.create_backend()
+        events = self.create_events(3)
+        for event in events:
+            backend.send(event)
+        backend.close()
+        self.assertEqual(self.read_all_events(), events)
+
+    def test_gzip_readable_by_standard_tools(self):
+        backend = self.create_backend(block_size=50)
+        events = self.create_events(10)
+        for event in events:
+            backend.send(event)
+        backend.close()
+
+        path, = self.segment_paths()
+        self.assertTrue(path.endswith('.jsonl.gz'))
+        with gzip.open(path, 'rb') as segment:
+            self.assertEqual(len(segment.read().splitlines()), 10)
+
+    def test_lzma(self):
+        backend = self.create_backend(compression='lzma', block_size=50)
+        events = self.create_events(10)
+        for event in events:
+            backend.send(event)
+        backend.close()
+
+        path, = self.segment_paths()
+        self.assertTrue(path.endswith('.jsonl.xz'))
+        with lzma.open(path, 'rb') as segment:
+            self.assertEqual(len(segment.read().splitlines()), 10)
+        self.assertEqual(self.read_all_events(), events)
+
+    def test_independent_blocks(self):
+        backend = self.create_backend(block_size=1)
+        for event in self.create_events(3):
+            backend.send(event)
+        backend.close()
+
+        path, = self.segment_paths()
+        with open(path, 'rb') as segment:
+            data = segment.read()
+        # Every block starts with its own gzip header
+        self.assertEqual(data.count(b'\x1f\x8b\x08'), 3)
+
+    def test_truncated_block_skipped(self):
+        backend = self.create_backend(block_size=1)
+        events = self.create_events(3)
+        for event in events:
+            backend.send(event)
+        backend.close()
+
+        path, = self.segment_paths()
+        with open(path, 'rb+') as segment:
+            segment.truncate(os.path.getsize(path) - 5)
+        self.assertEqual(list(read_archive(path)), events[:2])
+
+    def test_datetimes_serialized(self):
+        backend = self.create_backend()
+        backend.send({'timestamp': datetime.datetime(2012, 5, 1, 7, 27, 1, tzinfo=UTC)})
+        backend.close()
+        self.assertEqual(self.read_all_events(), [{'timestamp': '2012-05-01T07:27:01+00:00'}])
+
+    def test_flush_interval(self):
+        backend = self.create_backend(flush_interval=0.01)
+        backend.send({'name': 'test'})
+
+        deadline = time.time() + 5
+        while not self.segment_paths() or not list(read_archive(self.segment_paths()[0])):
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+
+    def test_rotate_by_size(self):
+        backend = self.create_backend(block_size=1, max_segment_bytes=1)
+        events = self.create_events(3)
+        for event in events:
+            backend.send(event)
+        backend.close()
+
+        self.assertEqual(len(self.segment_paths()), 3)
+        self.assertEqual(self.read_all_events(), events)
+
+    def test_rotate_by_time(self):
+        backend = self.create_backend(segment_interval=60)
+        with patch('eventtracking.backends.archive.time.time') as mock_time:
+            mock_time.return_value = 1000
+            backend.write_block(self.create_block({'sequence': 0}))
+            mock_time.return_value = 1059
+            backend.write_block(self.create_block({'sequence': 1}))
+            mock_time.return_value = 1060
+            backend.write_block(self.create_block({'sequence': 2}))
+            backend.close_segment()
+
+        self.assertEqual(len(self.segment_paths()), 2)
+        self.assertEqual(self.read_all_events(), [{'sequence': i} for i in range(3)])
+
+    def test_read_from_block_offset(self):
+        backend = self.create_backend(block_size=1)
+        events = self.create_events(3)
+        for event in events:
+            backend.send(event)
+        backend.close()
+
+        path, = self.segment_paths()
+        offsets = [offset for offset, _data in read_blocks(path)]
+        self.assertEqual(offsets[0], 0)
+        self.assertEqual(len(offsets), 3)
+        self.assertEqual([data for _offset, data in read_blocks(path, offsets[1])], [
+            b'{"name": "test", "data": {"sequence": 1}}\n',
+            b'{"name": "test", "data": {"sequence": 2}}\n',
+        ])
+
+    def test_index(self):
+        backend = self.create_backend(block_size=1, index=True)
+        start = datetime.datetime(2020, 1, 1, tzinfo=UTC)
+        events = [{'timestamp': start + datetime.timedelta(minutes=i), 'sequence': i} for i in range(5)]
+        for event in events:
+            backend.send(event)
+        backend.close()
+
+        path, = self.segment_paths()
+        entries = index.read_index(path)
+        self.assertEqual([entry[0] for entry in entries], [offset for offset, _data in read_blocks(path)])
+        self.assertEqual(entries[-1][1], os.path.getsize(path))
+        self.assertEqual(entries[1][2], index.parse_timestamp(events[1]['timestamp']))
+
+        self.assertEqual(
+            [event['sequence'] for event in read_events_between(
+                path, start + datetime.timedelta(minutes=2), start + datetime.timedelta(minutes=4)
+            )],
+            [2, 3],
+        )
+        self.assertEqual(list(read_archive(path, entries[3][0], entries[4][0])), [
+            dict(events[3], timestamp=events[3]['timestamp'].isoformat())
+        ])
+
+    def test_prefix(self):
+        backend = self.create_backend(prefix='tracking')
+        backend.send({'name': 'test'})
+        backend.close()
+
+        path, = self.segment_paths()
+        self.assertTrue(os.path.basename(path).startswith('tracking-'))
+
+    def test_process_in_name(self):
+        backend = self.create_backend()
+        backend.send({'name': 'test'})
+        backend.close()
+
+        path, = self.segment_paths()
+        self.assertIn('-{0}-{1}-1.jsonl'.format(socket.gethostname(), os.getpid()), os.path.basename(path))
+
+    def test_processes_write_separate_segments(self):
+        backends = [self.create_backend(), self.create_backend()]
+        for pid, backend in enumerate(backends, start=1000):
+            with patch('eventtracking.backends.archive.os.getpid', return_value=pid):
+                backend.write_block(self.create_block({'pid': pid}))
+                backend.close_segment()
+
+        self.assertEqual(len(self.segment_paths()), 2)
+        self.assertEqual(sorted(event['pid'] for event in self.read_all_events()), [1000, 1001])
+
+    def test_worker_restarted_after_fork(self):
+        backend = self.create_backend()
+        backend.send({'name': 'parent'})
+        parent_queue = backend.queue
+        parent_worker = backend.worker
+        backend.close()
+
+        # Recreate the state of a forked process: a worker that doesn't run in it, and an inherited segment.
+        backend.worker = parent_worker
+        backend.worker_pid = os.getpid() + 1
+        inherited_segment = backend.segment = tempfile.TemporaryFile()
+
+        backend.send({'name': 'child'})
+        self.assertIsNot(backend.worker, parent_worker)
+        self.assertEqual(backend.worker_pid, os.getpid())
+        self.assertIsNot(backend.queue, parent_queue)
+        self.assertTrue(inherited_segment.closed)
+        backend.close()
+
+        self.assertEqual([event['name'] for event in self.read_all_events()], ['parent', 'child'])
+
+    def test_full_queue_drops_events(self):
+        backend = self.create_backend(queue_size=1)
+        with patch.object(backend, 'start_worker'):
+            backend.send({'sequence': 0})
+            backend.send({'sequence': 1})
+        self.assertEqual(backend.dropped, 1)
+
+    def test_close_without_events(self):
+        backend = self.create_backend()
+        backend.close()
+        self.assertEqual(self.segment_paths(), [])
+
+    def test_directory_created(self):
+        directory = os.path.join(self.directory, 'missing', 'archive')
+        backend = self.create_backend(directory=directory)
+        backend.send({'name': 'test'})
+        backend.close()
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_directory_not_writable(self):
+        path = os.path.join(self.directory, 'file')
+        open(path, 'w').close()
+        with self.assertRaises(OSError):
+            CompressedArchiveBackend(directory=os.path.join(path, 'archive'))
+
+    def test_write_error(self):
+        backend = self.create_backend(block_size=1)
+        real_open = io.open
+        failures = [IOError('disk full')]
+
+        def open_segment(*args, **kwargs):
+            """Fail to open the first segment"""
+            if failures:
+                raise failures.pop()
+            return real_open(*args, **kwargs)
+
+        with patch('eventtracking.backends.archive.io.open', side_effect=open_segment):
+            backend.send({'sequence': 0})
+            backend.send({'sequence': 1})
+            backend.close()
+
+        self.assertEqual(self.read_all_events(), [{'sequence': 1}])
+
+    def test_close_after_worker_stopped(self):
+        backend = self.create_backend(queue_size=1)
+        with patch.object(backend, 'compress_events'):
+            backend.send({'sequence': 0})
+            backend.worker.join()
+            backend.close()
+        self.assertIsNone(backend.worker)
+
+    def test_no_directory_param(self):
+        with self.assertRaises(TypeError):
+            CompressedArchiveBackend()
+
+    def test_unknown_compression(self):
+        with self.assertRaises(ValueError):
+            CompressedArchiveBackend(directory=self.directory, compression='zip')
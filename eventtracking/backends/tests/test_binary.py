@@ -0,0 +1,227 @@
+"""Test the binary event file format"""
+
+from __future__ import absolute_import
+
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from pytz import UTC
+
+from eventtracking.backends import index
+from eventtracking.backends.binary import (
+    FRAME, HEADER, MAGIC, VERSION, BinaryEncoder, BinaryFileBackend, frame, read_events, read_events_between
+)
+from eventtracking.backends.file import FileBackend
+
+TIMESTAMP = datetime.datetime(2012, 5, 1, 7, 27, 1, 200, tzinfo=UTC)
+
+
+def create_event(sequence, name='test.event'):
+    """Build an event like those emitted by the tracker"""
+    return {
+        'name': name,
+        'timestamp': TIMESTAMP,
+        'context': {'user_id': 10, 'course_id': 'course-v1:Org+Course+Run'},
+        'data': {'sequence': sequence, 'tags': ['a', 'b'], 'nested': {'value': 1.5, 'flag': None}},
+    }
+
+
+class TestBinaryEncoder(TestCase):
+    """Test encoding and decoding events without a file"""
+
+    def setUp(self):
+        super(TestBinaryEncoder, self).setUp()
+        self.encoder = BinaryEncoder()
+
+    def round_trip(self, *events):
+        """Encode the events and read them back"""
+        data = self.encoder.header() + b''.join(self.encoder.encode(event) for event in events)
+        return list(read_events(io.BytesIO(data)))
+
+    def test_round_trip(self):
+        events = [create_event(i) for i in range(3)]
+        self.assertEqual(self.round_trip(*events), events)
+
+    def test_names_and_shapes_written_once(self):
+        first = self.encoder.encode(create_event(0))
+        second = self.encoder.encode(create_event(1))
+        self.assertIn(b'test.event', first)
+        self.assertIn(b'course_id', first)
+        self.assertNotIn(b'test.event', second)
+        self.assertNotIn(b'course_id', second)
+        self.assertNotIn(b'course-v1:Org+Course+Run', second)
+        self.assertLess(len(second), len(first))
+
+    def test_nested_datetimes_converted_to_strings(self):
+        event = create_event(0)
+        event['data']['when'] = TIMESTAMP
+        event['data']['day'] = datetime.date(2012, 5, 7)
+
+        decoded, = self.round_trip(event)
+        self.assertEqual(decoded['timestamp'], TIMESTAMP)
+        self.assertEqual(decoded['data']['when'], '2012-05-01T07:27:01.000200+00:00')
+        self.assertEqual(decoded['data']['day'], '2012-05-07')
+
+    def test_naive_timestamp_assumed_utc(self):
+        event = create_event(0)
+        event['timestamp'] = datetime.datetime(2012, 5, 1, 7, 27, 1)
+        decoded, = self.round_trip(event)
+        self.assertEqual(decoded['timestamp'], datetime.datetime(2012, 5, 1, 7, 27, 1, tzinfo=UTC))
+
+    def test_irregular_events(self):
+        events = [
+            {'name': 10, 'timestamp': '2012-05-01', 'context': 'none', 'data': [1, 2]},
+            {'other': 'value'},
+            {'data': {1: 'not a string key'}},
+            ['not', 'a', 'dict'],
+        ]
+        decoded = self.round_trip(*events)
+        self.assertEqual(decoded[:2] + decoded[3:], events[:2] + events[3:])
+        # As in JSON, the keys of nested dictionaries become strings.
+        self.assertEqual(decoded[2], {'data': {'1': 'not a string key'}})
+
+    def test_full_tables(self):
+        self.encoder = BinaryEncoder(max_table_size=1)
+        events = [create_event(0, name='first'), create_event(1, name='second')]
+        self.assertEqual(self.round_trip(*events), events)
+        self.assertEqual(list(self.encoder.strings), ['first'])
+
+    def test_unserializable_event_leaves_tables_unchanged(self):
+        event = create_event(0)
+        event['data']['invalid'] = object()
+        with self.assertRaises(TypeError):
+            self.encoder.encode(event)
+        self.assertEqual(self.encoder.strings, {})
+        self.assertEqual(self.encoder.shapes, {})
+
+    def test_not_a_binary_event_file(self):
+        with self.assertRaises(ValueError):
+            list(read_events(io.BytesIO(b'{"name": "test"}\n')))
+
+    def test_payloads_are_json(self):
+        self.encoder.encode(create_event(0))
+        event_frame = self.encoder.encode(create_event(1))
+
+        self.assertEqual(json.loads(event_frame[FRAME.size:].decode('utf-8')), [
+            0, index.to_microseconds(TIMESTAMP), 0, [10, 1], 2, 1, [1, ['a', 'b'], {'value': 1.5, 'flag': None}], None,
+        ])
+
+    def test_unsupported_format_version(self):
+        for payload in (MAGIC + VERSION.pack(2) + b'\x03\x0b\x00\x04', MAGIC + VERSION.pack(4), MAGIC):
+            with self.assertRaises(ValueError):
+                list(read_events(io.BytesIO(frame(HEADER, payload))))
+
+    def test_unsupported_format_version_in_appended_section(self):
+        data = self.encoder.header() + self.encoder.encode(create_event(0))
+        data += frame(HEADER, MAGIC + VERSION.pack(2)) + self.encoder.encode(create_event(1))
+        events = read_events(io.BytesIO(data))
+        self.assertEqual(next(events), create_event(0))
+        with self.assertRaises(ValueError):
+            next(events)
+
+    def test_empty_file(self):
+        self.assertEqual(list(read_events(io.BytesIO(b''))), [])
+
+    def test_incomplete_frame_ignored(self):
+        events = [create_event(i) for i in range(2)]
+        data = self.encoder.header() + b''.join(self.encoder.encode(event) for event in events)
+        self.assertEqual(list(read_events(io.BytesIO(data[:-1]))), events[:1])
+
+
+class TestBinaryFileBackend(TestCase):
+    """Test the backend that writes binary event files"""
+
+    def setUp(self):
+        super(TestBinaryFileBackend, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'events.bin')
+
+    def create_backend(self, **kwargs):
+        """Build a backend that writes to the temporary file, and closes it when the test ends"""
+        kwargs.setdefault('path', self.path)
+        kwargs.setdefault('flush_interval', 60)
+        backend = BinaryFileBackend(**kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_events_written(self):
+        backend = self.create_backend()
+        events = [create_event(i) for i in range(3)]
+        for event in events:
+            backend.send(event)
+        backend.close()
+        self.assertEqual(list(read_events(self.path)), events)
+
+    def test_append_to_existing_file(self):
+        backend = self.create_backend()
+        backend.send(create_event(0, name='first'))
+        backend.close()
+
+        backend = self.create_backend()
+        backend.send(create_event(1, name='second'))
+        backend.send(create_event(2, name='first'))
+        backend.close()
+
+        self.assertEqual(
+            [event['name'] for event in read_events(self.path)],
+            ['first', 'second', 'first'],
+        )
+
+    def test_rotated_files_self_contained(self):
+        backend = self.create_backend(max_bytes=1)
+        events = [create_event(i) for i in range(3)]
+        for event in events:
+            backend.send(event)
+        backend.close()
+
+        paths = sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory))
+        self.assertEqual(len(paths), 3)
+        self.assertEqual(sorted(
+            (event for path in paths for event in read_events(path)),
+            key=lambda event: event['data']['sequence']
+        ), events)
+
+    def test_read_range(self):
+        backend = self.create_backend(index_interval=10)
+        events = [create_event(i, name='event.{0}'.format(i % 3)) for i in range(50)]
+        for i, event in enumerate(events):
+            event['timestamp'] = TIMESTAMP + datetime.timedelta(minutes=i)
+            backend.send(event)
+        backend.close()
+
+        self.assertEqual(len(index.read_index(self.path)), 5)
+        self.assertEqual(list(read_events_between(
+            self.path, TIMESTAMP + datetime.timedelta(minutes=22), TIMESTAMP + datetime.timedelta(minutes=24)
+        )), events[22:24])
+
+    def test_read_from_offset(self):
+        backend = self.create_backend(index_interval=2)
+        events = [create_event(i) for i in range(5)]
+        for event in events:
+            backend.send(event)
+        backend.close()
+
+        (_start, end, _earliest, _latest), (start, _end, _earliest, _latest) = index.read_index(self.path)[:2]
+        self.assertEqual(start, end)
+        self.assertEqual(list(read_events(self.path, start)), events[2:])
+        self.assertEqual(list(read_events(self.path, 0, end)), events[:2])
+
+    def test_smaller_than_json(self):
+        backend = self.create_backend()
+        for i in range(100):
+            backend.send(create_event(i))
+        backend.close()
+
+        json_path = os.path.join(self.directory, 'events.json')
+        json_backend = FileBackend(path=json_path)
+        for i in range(100):
+            json_backend.send(create_event(i))
+        json_backend.close()
+
+        self.assertLess(os.path.getsize(self.path), os.path.getsize(json_path) / 2)
@@ -0,0 +1,92 @@
+"""
+Compares writing and reading events in the binary format with the JSON written by a LoggerBackend.
+"""
+
+from __future__ import absolute_import, print_function
+
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from six.moves import range
+
+from eventtracking.backends.binary import BinaryFileBackend, read_events
+from eventtracking.backends.logger import LoggerBackend
+from eventtracking.backends.tests import PerformanceTestCase
+from eventtracking.tracker import Tracker
+
+
+class TestBinaryFormatPerformance(PerformanceTestCase):
+    """
+    Writes the same events in both formats, then reads them back, and reports the rates and file sizes.
+    """
+
+    def setUp(self):
+        super(TestBinaryFormatPerformance, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.json_path = os.path.join(self.directory, 'events.log')
+        self.binary_path = os.path.join(self.directory, 'events.bin')
+
+    def create_logger_backend(self):
+        """Build a LoggerBackend that writes to a file in the temporary directory"""
+        logger_name = 'performance.test.binary'
+        test_logger = logging.getLogger(logger_name)
+        test_logger.setLevel(logging.INFO)
+        test_logger.propagate = False
+        handler = logging.FileHandler(self.json_path, mode='w', encoding='utf_8')
+        handler.setFormatter(logging.Formatter(fmt='%(message)s'))
+        test_logger.addHandler(handler)
+        self.addCleanup(test_logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+        return LoggerBackend(name=logger_name, max_event_size=None)
+
+    def measure_writes(self, backend):
+        """Return the number of events written per second"""
+        tracker = Tracker({'backend': backend})
+        start_time = time.time()
+        for i in range(self.num_events):
+            tracker.emit('perf.event', {
+                'sequence': i,
+                'payload': self.random_payload
+            })
+        if hasattr(backend, 'close'):
+            backend.close()
+        return self.num_events / (time.time() - start_time)
+
+    def measure_reads(self, read):
+        """Return the number of events read per second"""
+        start_time = time.time()
+        count = sum(1 for _event in read())
+        self.assertEqual(count, self.num_events)
+        return self.num_events / (time.time() - start_time)
+
+    def read_json(self):
+        """Read the events written by the LoggerBackend"""
+        with io.open(self.json_path, 'rb') as events_file:
+            for line in events_file:
+                yield json.loads(line)
+
+    def test_binary_format(self):
+        with self.assert_execution_time_less_than_threshold():
+            json_write_rate = self.measure_writes(self.create_logger_backend())
+            binary_write_rate = self.measure_writes(BinaryFileBackend(path=self.binary_path))
+
+        json_read_rate = self.measure_reads(self.read_json)
+        binary_read_rate = self.measure_reads(lambda: read_events(self.binary_path))
+        json_size = os.path.getsize(self.json_path)
+        binary_size = os.path.getsize(self.binary_path)
+
+        print('JSON: {0:.0f} events written per second, {1:.0f} read per second, {2} bytes'.format(
+            json_write_rate, json_read_rate, json_size
+        ))
+        print('Binary: {0:.0f} events written per second ({1:.1f}x), {2:.0f} read per second ({3:.1f}x), '
+              '{4} bytes ({5:.0%})'.format(
+                  binary_write_rate, binary_write_rate / json_write_rate,
+                  binary_read_rate, binary_read_rate / json_read_rate,
+                  binary_size, float(binary_size) / json_size,
+              ))
@@ -0,0 +1,492 @@
+"""Test the file backend"""
+
+from __future__ import absolute_import
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from mock import patch
+from pytz import UTC
+from six.moves import range
+
+from eventtracking.backends import index
+from eventtracking.backends import file as file_backend
+from eventtracking.backends.file import FileBackend, read_events, read_events_between
+
+
+class TestFileBackend(TestCase):
+    """Test the file backend"""
+
+    def setUp(self):
+        super(TestFileBackend, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'events.log')
+
+    def create_backend(self, **kwargs):
+        """Build a backend that writes to the temporary file, and closes it when the test ends"""
+        kwargs.setdefault('path', self.path)
+        kwargs.setdefault('flush_interval', 60)
+        backend = FileBackend(**kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+    def read_events(self, path=None):
+        """Read all of the events written to a file"""
+        with open(path or self.path) as events_file:
+            return [json.loads(line) for line in events_file]
+
+    def test_events_written_on_close(self):
+        backend = self.create_backend()
+        events = [{'name': 'test', 'data': {'sequence': i}} for i in range(3)]
+        for event in events:
+            backend.send(event)
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+        backend.close()
+        self.assertEqual(self.read_events(), events)
+
+    def test_datetimes_serialized(self):
+        backend = self.create_backend()
+        backend.send({'timestamp': datetime.datetime(2012, 5, 1, 7, 27, 1, tzinfo=UTC)})
+        backend.close()
+        self.assertEqual(self.read_events(), [{'timestamp': '2012-05-01T07:27:01+00:00'}])
+
+    def test_appends_to_existing_file(self):
+        with open(self.path, 'w') as events_file:
+            events_file.write('{"name": "existing"}\n')
+        backend = self.create_backend()
+        backend.send({'name': 'new'})
+        backend.close()
+        self.assertEqual(self.read_events(), [{'name': 'existing'}, {'name': 'new'}])
+
+    def test_flush_after_bytes(self):
+        backend = self.create_backend(flush_bytes=50)
+        backend.send({'name': 'a' * 10})
+        self.assertEqual(os.path.getsize(self.path), 0)
+        backend.send({'name': 'a' * 40})
+        self.assertEqual(len(self.read_events()), 2)
+
+    def test_flush_periodically(self):
+        backend = self.create_backend(flush_interval=0.01)
+        backend.send({'name': 'test'})
+        for _ in range(100):
+            if os.path.getsize(self.path) > 0:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.read_events(), [{'name': 'test'}])
+
+    @patch('eventtracking.backends.file.os.fsync')
+    def test_fsync_on_flush(self, mock_fsync):
+        backend = self.create_backend(fsync='flush', flush_bytes=20)
+        backend.send({'name': 'a'})
+        self.assertFalse(mock_fsync.called)
+        backend.send({'name': 'a' * 10})
+        self.assertEqual(mock_fsync.call_count, 1)
+
+    @patch('eventtracking.backends.file.os.fsync')
+    def test_fsync_always(self, mock_fsync):
+        backend = self.create_backend(fsync='always')
+        backend.send({'name': 'a'})
+        backend.send({'name': 'b'})
+        self.assertEqual(mock_fsync.call_count, 2)
+        self.assertEqual(len(self.read_events()), 2)
+
+    @patch('eventtracking.backends.file.os.fsync')
+    def test_fsync_never(self, mock_fsync):
+        backend = self.create_backend(flush_bytes=1)
+        backend.send({'name': 'a'})
+        backend.close()
+        self.assertFalse(mock_fsync.called)
+
+    def test_rotate_by_size(self):
+        backend = self.create_backend(max_bytes=40)
+        for i in range(5):
+            backend.send({'name': 'test', 'sequence': i})
+        backend.close()
+
+        rotated = sorted(name for name in os.listdir(self.directory) if name != 'events.log')
+        self.assertEqual(len(rotated), 4)
+        events = []
+        for name in rotated:
+            events.extend(self.read_events(os.path.join(self.directory, name)))
+        events.extend(self.read_events())
+        self.assertEqual([event['sequence'] for event in events], list(range(5)))
+
+    @patch('eventtracking.backends.file.time')
+    def test_rotate_by_time(self, mock_time):
+        mock_time.time.return_value = 1000
+        mock_time.strftime.return_value = '20200101-000000'
+        backend = self.create_backend(rotate_interval=10)
+        backend.send({'name': 'first'})
+        mock_time.time.return_value = 1005
+        backend.send({'name': 'second'})
+        mock_time.time.return_value = 1010
+        backend.send({'name': 'third'})
+        backend.close()
+
+        self.assertEqual(self.read_events(self.path + '.20200101-000000'), [{'name': 'first'}, {'name': 'second'}])
+        self.assertEqual(self.read_events(), [{'name': 'third'}])
+
+    def test_unserializable_event(self):
+        backend = self.create_backend()
+        with self.assertRaises(TypeError):
+            backend.send({'foo': object()})
+
+    def test_send_after_close(self):
+        backend = self.create_backend(flush_interval=0.01)
+        backend.send({'name': 'first'})
+        backend.close()
+        self.assertIsNone(backend.flusher)
+
+        backend.send({'name': 'second'})
+        self.assertTrue(backend.flusher.is_alive())
+        for _ in range(100):
+            if len(self.read_events()) == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.read_events(), [{'name': 'first'}, {'name': 'second'}])
+
+    def test_reopened_after_fork(self):
+        backend = self.create_backend(index_interval=10)
+        backend.send({'name': 'parent'})
+        with backend.lock:
+            backend.flush()
+        inherited_file = backend.file
+        parent_flusher = backend.flusher
+
+        with patch('eventtracking.backends.file.os.getpid', return_value=os.getpid() + 1):
+            backend.send({'name': 'child'})
+            self.assertTrue(inherited_file.closed)
+            self.assertIsNot(backend.flusher, parent_flusher)
+            self.assertEqual(backend.flusher_pid, os.getpid())
+            backend.close()
+
+        self.assertEqual(self.read_events(), [{'name': 'parent'}, {'name': 'child'}])
+
+    def test_parent_buffer_not_written_after_fork(self):
+        backend = self.create_backend()
+        backend.send({'name': 'buffered by the parent'})
+        inherited_file = backend.file
+
+        with patch('eventtracking.backends.file.os.getpid', return_value=os.getpid() + 1):
+            backend.send({'name': 'child'})
+            backend.close()
+
+        self.assertIn((inherited_file, None), file_backend.INHERITED_FILES)
+        self.assertEqual(self.read_events(), [{'name': 'child'}])
+        file_backend.INHERITED_FILES.remove((inherited_file, None))
+
+    def test_no_path(self):
+        with self.assertRaises(TypeError):
+            FileBackend()
+
+    def test_unknown_fsync_policy(self):
+        with self.assertRaises(ValueError):
+            FileBackend(path=self.path, fsync='sometimes')
+
+
+class TestContextEncoding(TestCase):
+    """Test writing each distinct context only once"""
+
+    def setUp(self):
+        super(TestContextEncoding, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'events.log')
+        self.backend = self.create_backend()
+
+    def create_backend(self, **kwargs):
+        """Build a backend that uses context encoding, and closes it when the test ends"""
+        kwargs.setdefault('path', self.path)
+        kwargs.setdefault('flush_interval', 60)
+        backend = FileBackend(context_encoding=True, **kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+    def read_lines(self, path=None):
+        """Read the lines of a file as they were written"""
+        with open(path or self.path) as events_file:
+            return [json.loads(line) for line in events_file]
+
+    def create_event(self, sequence, user_id=1):
+        """Build an event with a typical context"""
+        return {
+            'name': 'test',
+            'context': {'user_id': user_id, 'path': '/courses/test', 'agent': 'Mozilla/5.0'},
+            'data': {'sequence': sequence},
+        }
+
+    def test_context_written_once(self):
+        events = [self.create_event(i) for i in range(3)]
+        for event in events:
+            self.backend.send(event)
+        self.backend.close()
+
+        lines = self.read_lines()
+        self.assertEqual(lines[0], {'_context_id': 1, 'context': events[0]['context']})
+        self.assertEqual(lines[1:], [
+            {'name': 'test', 'data': {'sequence': i}, '_context_id': 1} for i in range(3)
+        ])
+        self.assertEqual(list(read_events(self.path)), events)
+
+    def test_event_not_modified(self):
+        event = self.create_event(0)
+        self.backend.send(event)
+        self.assertIn('context', event)
+        self.assertNotIn('_context_id', event)
+
+    def test_distinct_contexts(self):
+        events = [self.create_event(0, user_id=1), self.create_event(1, user_id=2), self.create_event(2, user_id=1)]
+        for event in events:
+            self.backend.send(event)
+        self.backend.close()
+
+        self.assertEqual(len(self.read_lines()), 5)
+        self.assertEqual(list(read_events(self.path)), events)
+
+    def test_equal_values_of_different_types(self):
+        events = [self.create_event(0, user_id=1), self.create_event(1, user_id=True)]
+        for event in events:
+            self.backend.send(event)
+        self.backend.close()
+        self.assertEqual(
+            [event['context']['user_id'] for event in read_events(self.path)],
+            [1, True],
+        )
+
+    def test_unhashable_context(self):
+        events = [self.create_event(i) for i in range(2)]
+        for event in events:
+            event['context']['module'] = {'display_name': 'Introduction'}
+            self.backend.send(event)
+        self.backend.close()
+
+        self.assertEqual(len(self.read_lines()), 3)
+        self.assertEqual(list(read_events(self.path)), events)
+
+    def test_unhashable_context_not_serialized(self):
+        events = [self.create_event(i) for i in range(2)]
+        for event in events:
+            event['context']['module'] = {'display_name': 'Introduction', 'tags': ['a', 1]}
+        self.backend.send(events[0])
+        with patch.object(self.backend.serializer, 'serialize', wraps=self.backend.serializer.serialize) as serialize:
+            self.backend.send(events[1])
+        self.backend.close()
+
+        self.assertNotIn(events[1]['context'], [call[0][0] for call in serialize.call_args_list])
+        self.assertEqual(len(self.read_lines()), 3)
+        self.assertEqual(list(read_events(self.path)), events)
+
+    def test_nested_values_of_different_types(self):
+        events = [self.create_event(0), self.create_event(1)]
+        events[0]['context']['module'] = {'position': 1}
+        events[1]['context']['module'] = {'position': True}
+        for event in events:
+            self.backend.send(event)
+        self.backend.close()
+
+        self.assertEqual(list(read_events(self.path)), events)
+        self.assertEqual(len(self.read_lines()), 4)
+
+    def test_context_that_cant_be_frozen(self):
+        events = [self.create_event(i) for i in range(2)]
+        with patch.object(file_backend, 'freeze', return_value=[]):
+            for event in events:
+                event['context']['module'] = {'display_name': 'Introduction'}
+                self.backend.send(event)
+        self.backend.close()
+
+        self.assertEqual(len(self.read_lines()), 3)
+        self.assertEqual(list(read_events(self.path)), events)
+
+    def test_least_recently_used_context_forgotten(self):
+        backend = self.create_backend(path=os.path.join(self.directory, 'limited.log'), max_contexts=2)
+        events = [self.create_event(i, user_id=user_id) for i, user_id in enumerate([1, 2, 1, 3, 2, 1])]
+        for event in events:
+            backend.send(event)
+        backend.close()
+
+        lines = self.read_lines(backend.path)
+        definitions = [line['context']['user_id'] for line in lines if 'context' in line]
+        self.assertEqual(definitions, [1, 2, 3, 2, 1])
+        self.assertEqual(list(read_events(backend.path)), events)
+
+    def test_rotated_files_self_contained(self):
+        backend = self.create_backend(path=os.path.join(self.directory, 'rotated.log'), max_bytes=1)
+        events = [self.create_event(i) for i in range(3)]
+        for event in events:
+            backend.send(event)
+        backend.close()
+
+        events_read = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith('rotated.log.'):
+                events_read.extend(read_events(os.path.join(self.directory, name)))
+        events_read.extend(read_events(backend.path))
+        self.assertEqual(events_read, events)
+
+    def test_unserializable_event(self):
+        event = self.create_event(0)
+        event['data']['invalid'] = object()
+        with self.assertRaises(TypeError):
+            self.backend.send(event)
+
+        self.backend.send(self.create_event(1))
+        self.backend.close()
+        self.assertEqual(list(read_events(self.path)), [self.create_event(1)])
+
+    def test_unserializable_event_with_full_table(self):
+        backend = self.create_backend(path=os.path.join(self.directory, 'limited.log'), max_contexts=2)
+        backend.send(self.create_event(0, user_id=1))
+        backend.send(self.create_event(1, user_id=2))
+        invalid = self.create_event(2, user_id=3)
+        invalid['data']['invalid'] = object()
+        with self.assertRaises(TypeError):
+            backend.send(invalid)
+
+        events = [self.create_event(3, user_id=4), self.create_event(4, user_id=2)]
+        for event in events:
+            backend.send(event)
+        backend.close()
+        self.assertEqual(list(read_events(backend.path))[2:], events)
+
+    def test_events_without_context(self):
+        events = [{'name': 'test'}, {'name': 'test', 'context': 'not a dictionary'}]
+        for event in events:
+            self.backend.send(event)
+        self.backend.close()
+        self.assertEqual(self.read_lines(), events)
+        self.assertEqual(list(read_events(self.path)), events)
+
+
+class TestTimeIndex(TestCase):
+    """Test writing a sparse time index and reading ranges of time"""
+
+    START = datetime.datetime(2020, 1, 1, tzinfo=UTC)
+
+    def setUp(self):
+        super(TestTimeIndex, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'events.log')
+
+    def create_backend(self, **kwargs):
+        """Build a backend that writes an index, and closes it when the test ends"""
+        kwargs.setdefault('path', self.path)
+        kwargs.setdefault('flush_interval', 60)
+        kwargs.setdefault('index_interval', 10)
+        backend = FileBackend(**kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+    def create_events(self, count):
+        """Build events one minute apart, whose contexts change every five events"""
+        return [
+            {
+                'name': 'test',
+                'timestamp': self.START + datetime.timedelta(minutes=i),
+                'context': {'user_id': i // 5},
+                'data': {'sequence': i},
+            }
+            for i in range(count)
+        ]
+
+    def minutes(self, count):
+        """The time `count` minutes after the first event"""
+        return self.START + datetime.timedelta(minutes=count)
+
+    def assert_sequences_between(self, start, end, sequences, path=None):
+        """Assert that reading a range of time returns the events with the given sequence numbers"""
+        events = read_events_between(path or self.path, self.minutes(start), self.minutes(end))
+        self.assertEqual([event['data']['sequence'] for event in events], sequences)
+
+    def test_index_written(self):
+        backend = self.create_backend()
+        for event in self.create_events(25):
+            backend.send(event)
+        backend.close()
+
+        entries = index.read_index(self.path)
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(entries[0][0], 0)
+        self.assertEqual(entries[-1][1], os.path.getsize(self.path))
+        self.assertEqual(entries[1][2:], (
+            index.parse_timestamp(self.minutes(10)), index.parse_timestamp(self.minutes(19))
+        ))
+
+    def test_read_range(self):
+        backend = self.create_backend()
+        for event in self.create_events(50):
+            backend.send(event)
+        backend.close()
+
+        self.assert_sequences_between(12, 15, [12, 13, 14])
+        self.assert_sequences_between(18, 32, list(range(18, 32)))
+        self.assert_sequences_between(100, 200, [])
+
+    def test_read_range_with_context_encoding(self):
+        backend = self.create_backend(context_encoding=True)
+        events = self.create_events(50)
+        for event in events:
+            backend.send(event)
+        backend.close()
+
+        self.assertEqual(
+            list(read_events_between(self.path, self.minutes(22), self.minutes(24))),
+            [dict(event, timestamp=event['timestamp'].isoformat()) for event in events[22:24]],
+        )
+
+    def test_unindexed_tail_read(self):
+        backend = self.create_backend()
+        for event in self.create_events(15):
+            backend.send(event)
+        with backend.lock:
+            backend.flush()
+
+        # The last block hasn't been completed yet
+        self.assertEqual(len(index.read_index(self.path)), 1)
+        self.assert_sequences_between(12, 14, [12, 13])
+
+    def test_only_blocks_in_range_read(self):
+        backend = self.create_backend()
+        for event in self.create_events(50):
+            backend.send(event)
+        backend.close()
+
+        lines_read = []
+        original_loads = json.loads
+
+        def loads(line):
+            lines_read.append(line)
+            return original_loads(line)
+
+        with patch('eventtracking.backends.file.json.loads', side_effect=loads):
+            self.assert_sequences_between(22, 24, [22, 23])
+        self.assertEqual(len(lines_read), 10)
+
+    def test_index_rotated_with_file(self):
+        backend = self.create_backend(max_bytes=2000)
+        for event in self.create_events(50):
+            backend.send(event)
+        backend.close()
+
+        rotated = sorted(name for name in os.listdir(self.directory) if not name.endswith('.idx'))
+        self.assertGreater(len(rotated), 1)
+        for name in rotated:
+            path = os.path.join(self.directory, name)
+            self.assertTrue(os.path.exists(index.index_path(path)))
+            events = list(read_events(path))
+            first, last = events[0]['data']['sequence'], events[-1]['data']['sequence']
+            self.assert_sequences_between(first, last + 1, list(range(first, last + 1)), path=path)
+
+    def test_no_index_by_default(self):
+        backend = self.create_backend(index_interval=None)
+        backend.send(self.create_events(1)[0])
+        backend.close()
+        self.assertFalse(os.path.exists(index.index_path(self.path)))
@@ -0,0 +1,115 @@
+"""
+Compares the throughput of the FileBackend with a LoggerBackend writing to a file.
+"""
+
+from __future__ import absolute_import, print_function
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from six.moves import range
+
+from eventtracking.backends.file import FileBackend
+from eventtracking.backends.logger import LoggerBackend
+from eventtracking.backends.tests import PerformanceTestCase
+from eventtracking.tracker import Tracker
+
+
+class TestFileBackendPerformance(PerformanceTestCase):
+    """
+    Writes the same events to a file using both backends, and reports the number of events written per second.
+    """
+
+    def setUp(self):
+        super(TestFileBackendPerformance, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def create_logger_backend(self):
+        """Build a LoggerBackend that writes to a file in the temporary directory"""
+        logger_name = 'performance.test'
+        test_logger = logging.getLogger(logger_name)
+        test_logger.setLevel(logging.INFO)
+        test_logger.propagate = False
+        handler = logging.FileHandler(os.path.join(self.directory, 'logger.log'), mode='w', encoding='utf_8')
+        handler.setFormatter(logging.Formatter(fmt='%(message)s'))
+        test_logger.addHandler(handler)
+        self.addCleanup(test_logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+        return LoggerBackend(name=logger_name, max_event_size=None)
+
+    def measure(self, backend):
+        """Return the number of events written per second"""
+        tracker = Tracker({'backend': backend})
+        start_time = time.time()
+        for i in range(self.num_events):
+            tracker.emit('perf.event', {
+                'sequence': i,
+                'payload': self.random_payload
+            })
+        if hasattr(backend, 'close'):
+            backend.close()
+        return self.num_events / (time.time() - start_time)
+
+    def test_file_backend_throughput(self):
+        with self.assert_execution_time_less_than_threshold():
+            logger_rate = self.measure(self.create_logger_backend())
+            file_rate = self.measure(FileBackend(path=os.path.join(self.directory, 'file.log')))
+            fastest_rate = self.measure(
+                FileBackend(path=os.path.join(self.directory, 'fastest.log'), serializer='fastest')
+            )
+
+        print('')
+        print('LoggerBackend: {0:.0f} events per second'.format(logger_rate))
+        print('FileBackend: {0:.0f} events per second ({1:.1f}x)'.format(file_rate, file_rate / logger_rate))
+        print('FileBackend with the fastest serializer: {0:.0f} events per second ({1:.1f}x)'.format(
+            fastest_rate, fastest_rate / logger_rate
+        ))
+
+    def test_context_encoding(self):
+        # A context like the one the LMS adds to every event in a request, shared by ten events at a time.
+        context = {
+            'user_id': 12345,
+            'username': 'learner',
+            'course_id': 'course-v1:OrgX+Course101+2024_T1',
+            'org_id': 'OrgX',
+            'host': 'courses.example.com',
+            'ip': '203.0.113.7',
+            'agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) '
+                     'Chrome/120.0.0.0 Safari/537.36',
+            'path': '/courses/course-v1:OrgX+Course101+2024_T1/courseware/week1/',
+            'referer': 'https://courses.example.com/courses/course-v1:OrgX+Course101+2024_T1/home',
+            'accept_language': 'en-US,en;q=0.9',
+            'session': 'b2ad1b5c7e0f4d6c9a3e8f1d2c4b6a8e',
+        }
+        plain_path = os.path.join(self.directory, 'plain.log')
+        encoded_path = os.path.join(self.directory, 'encoded.log')
+
+        with self.assert_execution_time_less_than_threshold():
+            plain_rate = self.measure_requests(FileBackend(path=plain_path), context)
+            encoded_rate = self.measure_requests(FileBackend(path=encoded_path, context_encoding=True), context)
+
+        plain_size = os.path.getsize(plain_path)
+        encoded_size = os.path.getsize(encoded_path)
+        print('')
+        print('FileBackend: {0:.0f} events per second, {1} bytes'.format(plain_rate, plain_size))
+        print('FileBackend with context encoding: {0:.0f} events per second ({1:.1f}x), {2} bytes ({3:.0%})'.format(
+            encoded_rate, encoded_rate / plain_rate, encoded_size, float(encoded_size) / plain_size
+        ))
+
+    def measure_requests(self, backend, context, events_per_request=10):
+        """Return the number of events written per second, when each request emits several events"""
+        tracker = Tracker({'backend': backend})
+        start_time = time.time()
+        for request in range(self.num_events // events_per_request):
+            with tracker.context('perf.request', dict(context, session=str(request))):
+                for i in range(events_per_request):
+                    tracker.emit('perf.event', {
+                        'sequence': i,
+                        'payload': self.random_payload
+                    })
+        backend.close()
+        return self.num_events / (time.time() - start_time)
@@ -0,0 +1,206 @@
+"""Test the sparse time indexes of event files"""
+
+from __future__ import absolute_import
+
+import datetime
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pytz
+from pytz import UTC
+
+from eventtracking.backends import index
+
+SECOND = 1000000
+
+
+class TestParseTimestamp(TestCase):
+    """Test converting the timestamps of events to microseconds"""
+
+    def test_datetime(self):
+        self.assertEqual(index.parse_timestamp(datetime.datetime(1970, 1, 1, 0, 0, 1, 5, tzinfo=UTC)), SECOND + 5)
+
+    def test_naive_datetime(self):
+        self.assertEqual(index.parse_timestamp(datetime.datetime(1970, 1, 1, 0, 0, 1)), SECOND)
+
+    def test_other_timezone(self):
+        eastern = pytz.timezone('US/Eastern')
+        timestamp = eastern.localize(datetime.datetime(2012, 5, 1, 3, 27, 1))
+        self.assertEqual(
+            index.parse_timestamp(timestamp),
+            index.parse_timestamp(datetime.datetime(2012, 5, 1, 7, 27, 1, tzinfo=UTC)),
+        )
+
+    def test_strings(self):
+        expected = index.parse_timestamp(datetime.datetime(2012, 5, 1, 7, 27, 1, 200, tzinfo=UTC))
+        for value in (
+                '2012-05-01T07:27:01.000200+00:00',
+                '2012-05-01T07:27:01.0002Z',
+                '2012-05-01T07:27:01.000200',
+                '2012-05-01T09:27:01.000200+02:00',
+                '2012-05-01T05:57:01.000200-01:30',
+        ):
+            self.assertEqual(index.parse_timestamp(value), expected, value)
+
+    def test_string_without_microseconds(self):
+        self.assertEqual(index.parse_timestamp('1970-01-01T00:00:01+00:00'), SECOND)
+
+    def test_invalid(self):
+        for value in (None, 10, 'yesterday', '2012-05-01Tmidnight'):
+            self.assertIsNone(index.parse_timestamp(value))
+
+
+class TestIndexWriter(TestCase):
+    """Test writing and reading indexes"""
+
+    def setUp(self):
+        super(TestIndexWriter, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'events.log')
+
+    def test_blocks(self):
+        writer = index.IndexWriter(self.path, interval=2)
+        writer.add(0, 10, 5)
+        writer.add(10, 20, 3)
+        writer.add(20, 30, None)
+        writer.add(30, 40, 8)
+        writer.add(40, 50, 9)
+        writer.close()
+
+        self.assertEqual(index.read_index(self.path), [
+            (0, 20, 3, 5),
+            (20, 40, 8, 8),
+            (40, 50, 9, 9),
+        ])
+
+    def test_start_block(self):
+        writer = index.IndexWriter(self.path, interval=1)
+        writer.start_block(0)
+        self.assertTrue(writer.in_block)
+        writer.add(5, 10, 1)
+        self.assertFalse(writer.in_block)
+        writer.close()
+        self.assertEqual(index.read_index(self.path), [(0, 10, 1, 1)])
+
+    def test_block_without_timestamps(self):
+        writer = index.IndexWriter(self.path, interval=1)
+        writer.add(0, 10, None)
+        writer.close()
+        self.assertEqual(index.read_index(self.path), [(0, 10, index.NO_EARLIEST, index.NO_LATEST)])
+
+    def test_empty_block_not_written(self):
+        writer = index.IndexWriter(self.path, interval=1)
+        writer.start_block(0)
+        writer.close()
+        self.assertEqual(index.read_index(self.path), [])
+
+    def test_missing_index(self):
+        self.assertEqual(index.read_index(self.path), [])
+
+    def test_incomplete_entry_ignored(self):
+        writer = index.IndexWriter(self.path, interval=1)
+        writer.add(0, 10, 1)
+        writer.add(10, 20, 2)
+        writer.close()
+        with open(index.index_path(self.path), 'rb+') as index_file:
+            index_file.truncate(index.ENTRY.size + 3)
+        self.assertEqual(index.read_index(self.path), [(0, 10, 1, 1)])
+
+
+class TestFindRanges(TestCase):
+    """Test finding the parts of a file to read"""
+
+    ENTRIES = [
+        (0, 10, 0, 9),
+        (10, 20, 10, 19),
+        (20, 30, 20, 29),
+        (30, 40, 30, 39),
+    ]
+
+    def test_single_block(self):
+        self.assertEqual(index.find_ranges(self.ENTRIES, 12, 15), [(10, 20), (40, None)])
+
+    def test_contiguous_blocks_merged(self):
+        self.assertEqual(index.find_ranges(self.ENTRIES, 5, 25), [(0, 30), (40, None)])
+
+    def test_end_excluded(self):
+        self.assertEqual(index.find_ranges(self.ENTRIES, 15, 20), [(10, 20), (40, None)])
+
+    def test_tail_merged(self):
+        self.assertEqual(index.find_ranges(self.ENTRIES, 35, 100), [(30, None)])
+
+    def test_nothing_in_range(self):
+        self.assertEqual(index.find_ranges(self.ENTRIES, 100, 200), [(40, None)])
+
+    def test_no_index(self):
+        self.assertEqual(index.find_ranges([], 0, 10), [(0, None)])
+
+    def test_out_of_order_blocks(self):
+        entries = [
+            (0, 10, 0, 9),
+            (10, 20, 10, 50),
+            (20, 30, 20, 29),
+            (30, 40, 5, 7),
+        ]
+        self.assertEqual(index.find_ranges(entries, 40, 45), [(10, 20), (40, None)])
+        self.assertEqual(index.find_ranges(entries, 6, 8), [(0, 10), (30, None)])
+
+    def test_gaps_between_blocks_read(self):
+        entries = [
+            (0, 10, 0, 9),
+            (15, 20, 10, 19),
+        ]
+        self.assertEqual(index.find_ranges(entries, 0, 5), [(0, 15), (20, None)])
+
+
+class TestReadEventsBetween(TestCase):
+    """Test reading the events in a range of time"""
+
+    def setUp(self):
+        super(TestReadEventsBetween, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'events.log')
+        with open(self.path, 'w'):
+            pass
+
+        writer = index.IndexWriter(self.path, interval=1)
+        writer.add(0, 10, 0)
+        writer.add(10, 20, 2 * SECOND)
+        writer.close()
+
+        self.reads = []
+
+    def read(self, path, start, end):
+        """Pretend to read the events in a range of the file, and remember the ranges read"""
+        self.assertEqual(path, self.path)
+        self.reads.append((start, end))
+        events = {
+            0: [{'timestamp': '1970-01-01T00:00:00+00:00'}],
+            10: [{'timestamp': '1970-01-01T00:00:02+00:00'}],
+            20: [{'timestamp': '1970-01-01T00:00:01+00:00'}, {'name': 'no timestamp'}, 'not a dict'],
+        }
+        return [event for offset, offset_events in events.items() if start <= offset for event in offset_events
+                if end is None or offset < end]
+
+    def test_only_ranges_read(self):
+        events = list(index.read_events_between(
+            self.path,
+            datetime.datetime(1970, 1, 1, 0, 0, 1, tzinfo=UTC),
+            datetime.datetime(1970, 1, 1, 0, 0, 2, tzinfo=UTC),
+            self.read,
+        ))
+        self.assertEqual(events, [{'timestamp': '1970-01-01T00:00:01+00:00'}])
+        self.assertEqual(self.reads, [(20, None)])
+
+    def test_missing_file(self):
+        events = index.read_events_between(
+            os.path.join(self.directory, 'missing.log'),
+            datetime.datetime(1970, 1, 1),
+            datetime.datetime(1970, 1, 2),
+            self.read,
+        )
+        self.assertEqual(list(events), [])
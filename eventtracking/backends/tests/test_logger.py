@@ -4,12 +4,18 @@ from __future__ import absolute_import
 
 import json
 import datetime
-from unittest import TestCase
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase, skipIf
 
 from mock import patch
 from mock import sentinel
 import pytz
 
+from eventtracking.backends import serialization
 from eventtracking.backends.logger import LoggerBackend
 
 
@@ -55,6 +61,85 @@ class TestLoggerBackend(TestCase):
         backend = LoggerBackend(max_event_size=10)
         backend.send({'foo': 'a'*(backend.max_event_size + 1)})
         self.assert_no_events_emitted()
+        self.assertEqual(backend.dropped, 1)
+
+    def test_big_event_not_serialized(self):
+        backend = LoggerBackend(max_event_size=10)
+        with patch.object(backend.serializer, 'encode') as mock_encode:
+            backend.send({'foo': 'a'*(backend.max_event_size + 1)})
+        self.assertFalse(mock_encode.called)
+
+    def test_big_event_detected_after_serialization(self):
+        backend = LoggerBackend(max_event_size=20)
+        backend.send({'foo': u'\xe9' * 10})
+        self.assert_no_events_emitted()
+        self.assertEqual(backend.dropped, 1)
+
+    @skipIf(serialization.orjson is None, 'orjson is not installed')
+    def test_compact_event_that_fits(self):
+        event = {'name': 'test', 'data': {str(i): i for i in range(50)}}
+        max_event_size = len(serialization.get_serializer('orjson').serialize(event))
+        backend = LoggerBackend(max_event_size=max_event_size, serializer='orjson')
+        backend.send(event)
+        self.assertTrue(self.mock_logger.info.called)
+        self.assertEqual(backend.dropped, 0)
+
+    def test_truncate_big_event(self):
+        backend = LoggerBackend(max_event_size=100, oversize_policy='truncate')
+        event = {
+            'name': 'test',
+            'data': {'big': 'a' * 200, 'nested': {'list': ['b'] * 50}, 'small': 'c'},
+        }
+        backend.send(event)
+
+        logged = json.loads(self.mock_logger.info.call_args[0][0])
+        self.assertLessEqual(len(self.mock_logger.info.call_args[0][0]), 100)
+        self.assertEqual(logged['data']['nested'], '...[truncated]')
+        self.assertTrue(logged['data']['big'].startswith('aaa'))
+        self.assertTrue(logged['data']['big'].endswith('...[truncated]'))
+        self.assertEqual(logged['data']['small'], 'c')
+        self.assertEqual(backend.truncated, 1)
+        self.assertEqual(len(event['data']['big']), 200)
+
+    def test_truncate_impossible(self):
+        backend = LoggerBackend(max_event_size=10, oversize_policy='truncate')
+        backend.send({'name': 'a' * 20, 'data': {'big': 'a' * 200}})
+        backend.send({'name': 'a' * 20})
+        self.assert_no_events_emitted()
+        self.assertEqual(backend.dropped, 2)
+
+    def test_offload_big_event(self):
+        offload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, offload_dir)
+        backend = LoggerBackend(max_event_size=200, oversize_policy='offload', offload_dir=offload_dir)
+        event = {'name': 'test', 'context': {'user_id': 1}, 'data': {'big': 'a' * 200}}
+        backend.send(event)
+
+        logged = json.loads(self.mock_logger.info.call_args[0][0])
+        self.assertEqual(logged['name'], 'test')
+        self.assertEqual(logged['context'], {'user_id': 1})
+        self.assertEqual(logged['data'], {})
+        self.assertEqual(os.path.dirname(logged['offloaded']['path']), offload_dir)
+        with open(logged['offloaded']['path']) as offload_file:
+            self.assertEqual(json.load(offload_file), event)
+        self.assertEqual(logged['offloaded']['size'], len(json.dumps(event)))
+        self.assertEqual(backend.offloaded, 1)
+
+    def test_offload_reference_too_big(self):
+        offload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, offload_dir)
+        backend = LoggerBackend(max_event_size=20, oversize_policy='offload', offload_dir=offload_dir)
+        backend.send({'name': 'test', 'context': {'user_id': 1}, 'data': {'big': 'a' * 200}})
+        self.assert_no_events_emitted()
+        self.assertEqual(backend.dropped, 1)
+
+    def test_offload_requires_directory(self):
+        with self.assertRaises(ValueError):
+            LoggerBackend(oversize_policy='offload')
+
+    def test_unknown_oversize_policy(self):
+        with self.assertRaises(ValueError):
+            LoggerBackend(oversize_policy='ignore')
 
     def test_unlimited_event_size(self):
         default_max_event_size = self.backend.max_event_size
@@ -92,3 +177,109 @@ class TestLoggerBackend(TestCase):
         backend.send({})
         self.assertFalse(self.mock_logger.info.called)
         self.mock_logger.warning.assert_called_once_with('{}')
+
+    def test_unknown_serializer(self):
+        with self.assertRaises(ValueError):
+            LoggerBackend(serializer='xml')
+
+
+class RecordingHandler(logging.Handler):
+    """Record the messages of the log records handled, and the threads that handled them"""
+
+    def __init__(self, level=logging.NOTSET):
+        super(RecordingHandler, self).__init__(level)
+        self.messages = []
+        self.threads = set()
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+        self.threads.add(threading.current_thread())
+
+
+class TestQueuedLoggerBackend(TestCase):
+    """Test the logging backend when events are output by a background thread"""
+
+    def setUp(self):
+        super(TestQueuedLoggerBackend, self).setUp()
+        self.parent_logger = self.create_logger('eventtracking.tests.queued')
+        self.logger = self.create_logger('eventtracking.tests.queued.events')
+        self.parent_handler = RecordingHandler()
+        self.parent_logger.addHandler(self.parent_handler)
+        self.handler = RecordingHandler()
+        self.logger.addHandler(self.handler)
+
+    def create_logger(self, name):
+        """Get a logger that is restored to its original state when the test ends"""
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.INFO)
+        self.addCleanup(setattr, logger, 'handlers', list(logger.handlers))
+        self.addCleanup(setattr, logger, 'propagate', logger.propagate)
+        return logger
+
+    def create_backend(self, **kwargs):
+        """Build a backend that uses a queue, and closes it when the test ends"""
+        backend = LoggerBackend(name=self.logger.name, use_queue=True, **kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_events_output_by_listener(self):
+        backend = self.create_backend()
+        backend.send({'a': 'a'})
+        backend.send({'b': 'b'})
+        backend.close()
+
+        for handler in (self.handler, self.parent_handler):
+            self.assertEqual(handler.messages, ['{"a": "a"}', '{"b": "b"}'])
+            self.assertNotIn(threading.current_thread(), handler.threads)
+
+    def test_handler_level_respected(self):
+        self.handler.setLevel(logging.WARNING)
+        backend = self.create_backend()
+        backend.send({})
+        backend.close()
+
+        self.assertEqual(self.handler.messages, [])
+        self.assertEqual(self.parent_handler.messages, ['{}'])
+
+    def test_stops_at_logger_that_does_not_propagate(self):
+        self.logger.propagate = False
+        backend = self.create_backend()
+        backend.send({})
+        backend.close()
+
+        self.assertEqual(self.handler.messages, ['{}'])
+        self.assertEqual(self.parent_handler.messages, [])
+
+    def test_full_queue_drops_events(self):
+        backend = self.create_backend(queue_size=1)
+        with patch.object(backend, 'start_listener'):
+            backend.send({'a': 'a'})
+            backend.send({'b': 'b'})
+        self.assertEqual(backend.queue_dropped, 1)
+
+        backend.close()
+        self.assertEqual(self.handler.messages, ['{"a": "a"}'])
+
+    def test_close_restores_logger(self):
+        backend = self.create_backend()
+        self.assertFalse(self.logger.propagate)
+        backend.close()
+
+        self.assertEqual(self.logger.handlers, [self.handler])
+        self.assertTrue(self.logger.propagate)
+        backend.send({})
+        self.assertEqual(self.handler.messages, ['{}'])
+
+    def test_close_twice(self):
+        backend = self.create_backend()
+        backend.send({})
+        backend.close()
+        backend.close()
+        self.assertEqual(self.handler.messages, ['{}'])
+
+    def test_not_queued_by_default(self):
+        backend = LoggerBackend(name=self.logger.name)
+        self.assertEqual(self.logger.handlers, [self.handler])
+        backend.send({})
+        self.assertEqual(self.handler.threads, {threading.current_thread()})
+        self.assertEqual(backend.queue_dropped, 0)
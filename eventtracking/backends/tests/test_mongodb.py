@@ -1,26 +1,62 @@
 """Unit tests for the Mongo backend"""
 from __future__ import absolute_import
 
+from datetime import datetime
+import os
+import threading
+import time
 from unittest import TestCase
-from mock import patch
+from mock import MagicMock, call, patch
 from mock import sentinel
 
-from pymongo.errors import PyMongoError
-from bson.errors import BSONError
+import pymongo
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError, ServerSelectionTimeoutError
+from bson import BSON
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from bson.errors import BSONError, InvalidDocument
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+from pytz import UTC, timezone
 
-from eventtracking.backends.mongodb import MongoBackend
+from eventtracking.backends.mongodb import (
+    DAY, DUPLICATE_KEY, NAMESPACE_EXISTS, WEEK, ClientRegistry, MongoBackend, bucket_start, bucket_starts,
+    encode_documents,
+)
 
 
-class TestMongoBackend(TestCase):
-    """Unit tests for the Mongo backend"""
+def first_argument(call):
+    """Extract the first argument from a `mock.call`"""
+    _, args, _ = call
+    return args[0]
+
+
+def cursor(events):
+    """A mock cursor that returns the given events"""
+    mock_cursor = MagicMock()
+    mock_cursor.__iter__.return_value = iter(events)
+    return mock_cursor
+
+
+class MongoTestCase(TestCase):
+    """Replace the client with a mock, and use a registry of clients of its own"""
 
     def setUp(self):
-        super(TestMongoBackend, self).setUp()
+        super(MongoTestCase, self).setUp()
         self.mongo_patcher = patch('eventtracking.backends.mongodb.MongoClient')
         self.addCleanup(self.mongo_patcher.stop)
-        self.mongo_patcher.start()
+        self.mongo_client = self.mongo_patcher.start()
 
-        self.backend = MongoBackend()
+        registry_patcher = patch('eventtracking.backends.mongodb.CLIENTS', ClientRegistry())
+        self.addCleanup(registry_patcher.stop)
+        registry_patcher.start()
+
+
+class TestMongoBackend(MongoTestCase):
+    """Unit tests for the Mongo backend"""
+
+    def setUp(self):
+        super(TestMongoBackend, self).setUp()
+        self.backend = MongoBackend(batch_size=1)
 
     def test_mongo_backend(self):
         events = [{'test': 1}, {'test': 2}]
@@ -30,33 +66,698 @@ class TestMongoBackend(TestCase):
 
         # Check if we inserted events into the database
 
-        calls = self.backend.collection.insert.mock_calls
+        calls = self.backend.collection.insert_many.mock_calls
 
         self.assertEqual(len(calls), 2)
 
         # Unpack the arguments and check if the events were used
-        # as the first argument to collection.insert
+        # as the first argument to collection.insert_many
 
-        def first_argument(call):
-            """Extract the first argument from a `mock.call`"""
-            _, args, _ = call
-            return args[0]
-
-        self.assertEqual(events[0], first_argument(calls[0]))
-        self.assertEqual(events[1], first_argument(calls[1]))
+        self.assertEqual([events[0]], first_argument(calls[0]))
+        self.assertEqual([events[1]], first_argument(calls[1]))
 
     def test_authentication_settings(self):
         backend = MongoBackend(user=sentinel.user, password=sentinel.password)
         backend.database.authenticate.assert_called_once_with(sentinel.user, sentinel.password)
 
     def test_mongo_pymongo_insertion_error(self):
-        self.backend.collection.insert.side_effect = PyMongoError
+        self.backend.collection.insert_many.side_effect = PyMongoError
 
         self.backend.send({'test': 1})
         # Ensure this error is caught
 
     def test_mongo_bson_insertion_error(self):
-        self.backend.collection.insert.side_effect = BSONError
+        self.backend.collection.insert_many.side_effect = BSONError
+        self.backend.collection.insert_one.side_effect = BSONError
 
         self.backend.send({'test': 1})
         # Ensure this error is caught
+
+    def test_event_not_modified(self):
+        def add_ids(documents, **kwargs):  # pylint: disable=unused-argument
+            """Add an _id to each document, like the driver does"""
+            for document in documents:
+                document['_id'] = sentinel.id
+
+        self.backend.collection.insert_many.side_effect = add_ids
+        event = {'test': 1}
+
+        self.backend.send(event)
+
+        self.assertEqual(event, {'test': 1})
+
+    def test_id_field(self):
+        backend = MongoBackend(batch_size=1, id_field='id')
+        backend.send({'id': sentinel.id, 'test': 1})
+        backend.send({'test': 2})
+
+        documents = [first_argument(call)[0] for call in backend.collection.insert_many.mock_calls]
+        self.assertEqual(documents, [{'_id': sentinel.id, 'id': sentinel.id, 'test': 1}, {'test': 2}])
+
+    def test_send_batch_unbuffered(self):
+        events = [{'test': 1}, {'test': 2}]
+        self.backend.send_batch(events)
+        self.backend.collection.insert_many.assert_called_once_with(events, ordered=False)
+
+
+class TestLazyConnection(MongoTestCase):
+    """Test connecting to the database when it is first used"""
+
+    def wait_for_indexes(self, collection):
+        """Wait until the background thread has created the indexes"""
+        for _ in range(500):
+            if len(collection.create_index.mock_calls) == 2:
+                return
+            time.sleep(0.01)
+
+    def test_no_connection_when_constructed(self):
+        MongoBackend(host=sentinel.host, extra={'w': 1})
+        self.assertFalse(self.mongo_client.called)
+
+    def test_connected_once(self):
+        backend = MongoBackend(batch_size=1, host=sentinel.host, extra={'w': 1})
+        backend.send({'test': 1})
+        backend.send({'test': 2})
+
+        self.mongo_client.assert_called_once_with(host=sentinel.host, port=27017, w=1, tz_aware=True)
+        self.assertIs(backend.connection, self.mongo_client.return_value)
+        self.assertEqual(len(backend.collection.insert_many.mock_calls), 2)
+
+    def test_indexes_created_in_background(self):
+        backend = MongoBackend()
+        collection = backend.collection
+        self.wait_for_indexes(collection)
+
+        self.assertEqual(collection.create_index.mock_calls, [
+            call([('time', pymongo.DESCENDING)], background=True),
+            call('name', background=True),
+        ])
+
+    def test_indexes_not_created(self):
+        backend = MongoBackend(create_indexes=False)
+        backend.warm_up()
+        self.assertFalse(backend.collection.create_index.called)
+
+    def test_index_creation_error(self):
+        backend = MongoBackend(create_indexes=False)
+        backend.collection.create_index.side_effect = PyMongoError
+        backend.create_indexes_safely()
+        # Ensure this error is caught
+
+    def test_connection_error(self):
+        self.mongo_client.return_value.__getitem__.return_value.authenticate.side_effect = PyMongoError
+        backend = MongoBackend(batch_size=1, user='user')
+
+        backend.send({'test': 1})
+        # Ensure this error is caught, and the connection is attempted again
+        self.mongo_client.return_value.__getitem__.return_value.authenticate.side_effect = None
+        backend.send({'test': 2})
+
+        self.assertEqual(self.mongo_client.call_count, 2)
+        backend.collection.insert_many.assert_called_once_with([{'test': 2}], ordered=False)
+
+    def test_warm_up(self):
+        backend = MongoBackend(create_indexes=False)
+        self.addCleanup(backend.close)
+
+        backend.warm_up()
+
+        backend.connection.admin.command.assert_called_once_with('ping')
+        self.assertIsNotNone(backend.worker)
+
+    def test_warm_up_error(self):
+        backend = MongoBackend(batch_size=1, create_indexes=False)
+        self.mongo_client.return_value.admin.command.side_effect = PyMongoError
+
+        backend.warm_up()
+
+        self.assertIsNone(backend.worker)
+
+
+class TestClientRegistry(MongoTestCase):
+    """Test sharing clients between backends"""
+
+    def setUp(self):
+        super(TestClientRegistry, self).setUp()
+        self.mongo_client.side_effect = lambda **kwargs: MagicMock()
+
+    def test_shared_client(self):
+        first = MongoBackend(collection='first', create_indexes=False)
+        second = MongoBackend(collection='second', create_indexes=False)
+
+        self.assertIs(first.connection, second.connection)
+        self.assertEqual(self.mongo_client.call_count, 1)
+        first.database.__getitem__.assert_any_call('second')
+
+    def test_different_parameters(self):
+        first = MongoBackend(create_indexes=False)
+        second = MongoBackend(host='other', create_indexes=False)
+        third = MongoBackend(user='user', password='password', create_indexes=False)
+
+        self.assertEqual(len({id(first.connection), id(second.connection), id(third.connection)}), 3)
+
+    def test_unhashable_parameters(self):
+        first = MongoBackend(host=['a', 'b'], create_indexes=False)
+        second = MongoBackend(host=['a', 'b'], create_indexes=False)
+        self.assertIs(first.connection, second.connection)
+
+    def test_closed_when_released(self):
+        first = MongoBackend(create_indexes=False)
+        second = MongoBackend(create_indexes=False)
+        client = first.connection
+        second.warm_up()
+
+        first.close()
+        self.assertFalse(client.close.called)
+        second.close()
+        client.close.assert_called_once_with()
+
+        self.assertIsNot(MongoBackend(create_indexes=False).connection, client)
+
+    def test_forked_process(self):
+        backend = MongoBackend(create_indexes=False)
+        client = backend.connection
+
+        with patch('eventtracking.backends.mongodb.os.getpid', return_value=-1):
+            self.assertIsNot(backend.connection, client)
+            self.assertIs(MongoBackend(create_indexes=False).connection, backend.connection)
+
+        self.assertFalse(client.close.called)
+
+
+class TestBuckets(MongoTestCase):
+    """Test writing events to time-bucketed and time series collections"""
+
+    def setUp(self):
+        super(TestBuckets, self).setUp()
+        self.collections = {}
+        self.database = self.mongo_client.return_value.__getitem__.return_value
+        self.database.__getitem__.side_effect = lambda name: self.collections.setdefault(name, MagicMock())
+
+    def create_backend(self, **kwargs):
+        """Build an unbuffered backend"""
+        return MongoBackend(batch_size=1, collection='events', **kwargs)
+
+    def inserted(self):
+        """The documents inserted in to each collection"""
+        return {
+            name: [document for call in collection.insert_many.mock_calls for document in first_argument(call)]
+            for name, collection in self.collections.items()
+            if collection.insert_many.called
+        }
+
+    def test_bucket_start(self):
+        timestamp = datetime(2013, 1, 3, 23, 30, tzinfo=UTC)
+        self.assertEqual(bucket_start(timestamp, DAY), datetime(2013, 1, 3, tzinfo=UTC))
+        self.assertEqual(bucket_start(timestamp, WEEK), datetime(2012, 12, 31, tzinfo=UTC))
+        self.assertEqual(bucket_start(timestamp.replace(tzinfo=None), DAY), datetime(2013, 1, 3, tzinfo=UTC))
+        self.assertEqual(
+            bucket_start(timestamp.astimezone(timezone('Asia/Tokyo')), DAY), datetime(2013, 1, 3, tzinfo=UTC)
+        )
+
+    def test_bucket_starts(self):
+        self.assertEqual(
+            list(bucket_starts(datetime(2013, 1, 3, 12, tzinfo=UTC), datetime(2013, 1, 5), DAY)),
+            [datetime(2013, 1, 3, tzinfo=UTC), datetime(2013, 1, 4, tzinfo=UTC)],
+        )
+
+    def test_unknown_interval(self):
+        with self.assertRaises(ValueError):
+            self.create_backend(bucket_interval='year')
+
+    def test_daily_buckets(self):
+        backend = self.create_backend(bucket_interval=DAY)
+        events = [
+            {'name': 'a', 'time': datetime(2013, 1, 1, 12, tzinfo=UTC)},
+            {'name': 'b', 'timestamp': datetime(2013, 1, 2, 12, tzinfo=UTC)},
+            {'name': 'c', 'time': datetime(2013, 1, 1, 13, tzinfo=UTC)},
+        ]
+
+        backend.send_batch(events)
+
+        self.assertEqual(self.inserted(), {
+            'events_20130101': [events[0], events[2]],
+            'events_20130102': [dict(events[1], time=events[1]['timestamp'])],
+        })
+        self.collections['events_20130101'].create_index.assert_any_call('name', background=True)
+        self.assertEqual(len(self.collections['events_20130101'].create_index.mock_calls), 2)
+
+    def test_bucket_index_error(self):
+        backend = self.create_backend(bucket_interval=DAY)
+        bucket = self.collections['events_20130101'] = MagicMock()
+        bucket.create_index.side_effect = OperationFailure('not authorized', code=13)
+        events = [
+            {'name': 'a', 'time': datetime(2013, 1, 1, 12, tzinfo=UTC)},
+            {'name': 'b', 'time': datetime(2013, 1, 1, 13, tzinfo=UTC)},
+        ]
+
+        for event in events:
+            backend.send(event)
+
+        self.assertEqual(self.inserted(), {'events_20130101': events})
+        self.assertEqual(len(bucket.create_index.mock_calls), 1)
+        self.assertEqual(backend.prepared_collections, {'events_20130101'})
+
+    def test_weekly_buckets_with_pattern(self):
+        backend = self.create_backend(bucket_interval=WEEK, bucket_pattern='{collection}.week-%Y-%m-%d')
+        backend.send({'name': 'a', 'time': datetime(2013, 1, 3, tzinfo=UTC)})
+        self.assertEqual(list(self.inserted()), ['events.week-2012-12-31'])
+
+    def test_event_without_time(self):
+        backend = self.create_backend(bucket_interval=DAY, create_indexes=False)
+        backend.send({'name': 'a'})
+        self.assertEqual(list(self.inserted()), ['events_' + datetime.now(UTC).strftime('%Y%m%d')])
+
+    def test_ttl(self):
+        backend = self.create_backend(ttl=3600)
+        backend.create_indexes()
+        self.collections['events'].create_index.assert_any_call(
+            [('time', pymongo.DESCENDING)], background=True, expireAfterSeconds=3600
+        )
+
+    def test_timestamp_copied_to_time_field(self):
+        backend = self.create_backend(ttl=3600)
+        timestamp = datetime(2013, 1, 1, tzinfo=UTC)
+        event = {'name': 'a', 'timestamp': timestamp}
+
+        backend.send(event)
+        backend.send({'name': 'b'})
+
+        inserted = self.inserted()['events']
+        self.assertEqual(inserted[0], {'name': 'a', 'timestamp': timestamp, 'time': timestamp})
+        self.assertIsInstance(inserted[1]['time'], datetime)
+        self.assertEqual(event, {'name': 'a', 'timestamp': timestamp})
+
+    def test_timestamp_copied_without_ttl(self):
+        backend = self.create_backend()
+        timestamp = datetime(2013, 1, 1, tzinfo=UTC)
+
+        backend.send({'name': 'a', 'timestamp': timestamp, 'time': sentinel.time})
+        backend.send({'name': 'b', 'timestamp': timestamp})
+        backend.send({'name': 'c'})
+
+        self.assertEqual(self.inserted()['events'], [
+            {'name': 'a', 'timestamp': timestamp, 'time': timestamp},
+            {'name': 'b', 'timestamp': timestamp, 'time': timestamp},
+            {'name': 'c'},
+        ])
+
+    def test_time_series(self):
+        backend = self.create_backend(time_series=True, ttl=3600, time_field='timestamp')
+        timestamp = datetime(2013, 1, 1, tzinfo=UTC)
+
+        backend.send({'name': 'a', 'timestamp': timestamp})
+        backend.send({'name': 'b', 'timestamp': timestamp})
+
+        self.database.create_collection.assert_called_once_with(
+            'events',
+            timeseries={'timeField': 'timestamp', 'metaField': 'name', 'granularity': 'seconds'},
+            expireAfterSeconds=3600,
+        )
+        self.assertEqual(len(self.inserted()['events']), 2)
+        self.assertFalse(self.collections['events'].create_index.called)
+
+    def test_time_series_collection_exists(self):
+        self.database.create_collection.side_effect = OperationFailure('exists', code=NAMESPACE_EXISTS)
+        backend = self.create_backend(time_series=True)
+
+        backend.send({'name': 'a'})
+
+        self.assertEqual(len(self.inserted()['events']), 1)
+        self.assertIsInstance(self.inserted()['events'][0]['time'], datetime)
+
+    def test_time_series_creation_error(self):
+        self.database.create_collection.side_effect = OperationFailure('unauthorized', code=13)
+        backend = self.create_backend(time_series=True)
+
+        backend.send({'name': 'a'})
+
+        self.assertEqual(self.inserted(), {})
+        self.assertEqual(backend.prepared_collections, set())
+
+    def test_find_between(self):
+        backend = self.create_backend(bucket_interval=DAY)
+        start = datetime(2013, 1, 1, 12, tzinfo=UTC)
+        end = datetime(2013, 1, 3, tzinfo=UTC)
+        self.collections['events_20130101'] = MagicMock(**{'find.return_value': cursor([sentinel.first])})
+        self.collections['events_20130102'] = MagicMock(**{'find.return_value': cursor([sentinel.second])})
+
+        events = list(backend.find_between(start, end, {'name': 'a'}, batch_size=10))
+
+        self.assertEqual(events, [sentinel.first, sentinel.second])
+        self.collections['events_20130101'].find.assert_called_once_with(
+            {'name': 'a', 'time': {'$gte': start, '$lt': end}}, batch_size=10
+        )
+
+    def test_find_between_single_collection(self):
+        backend = self.create_backend()
+        self.collections['events'] = MagicMock(**{'find.return_value': cursor([sentinel.event])})
+        events = list(backend.find_between(datetime(2013, 1, 1), datetime(2014, 1, 1)))
+        self.assertEqual(events, [sentinel.event])
+
+
+class TestFindEvents(MongoTestCase):
+    """Test querying the stored events"""
+
+    def setUp(self):
+        super(TestFindEvents, self).setUp()
+        self.collections = {}
+        self.database = self.mongo_client.return_value.__getitem__.return_value
+        self.database.__getitem__.side_effect = lambda name: self.collections.setdefault(
+            name, MagicMock(**{'find.side_effect': lambda *args, **kwargs: cursor([name])})
+        )
+        self.start = datetime(2013, 1, 1, 12, tzinfo=UTC)
+        self.end = datetime(2013, 1, 3, tzinfo=UTC)
+
+    def find_call(self, name='events'):
+        """The arguments of the only query of a collection"""
+        self.collections[name].find.assert_called_once()
+        return self.collections[name].find.call_args
+
+    def test_query_by_name_and_time(self):
+        backend = MongoBackend(create_indexes=False)
+
+        events = list(backend.find_events(name='a', start=self.start, end=self.end, context={'user_id': 10}))
+
+        self.assertEqual(events, ['events'])
+        args, kwargs = self.find_call()
+        self.assertEqual(args, ({
+            'name': 'a',
+            'time': {'$gte': self.start, '$lt': self.end},
+            'context.user_id': 10,
+        },))
+        self.assertEqual(kwargs, {'batch_size': 1000, 'hint': [('time', pymongo.DESCENDING)]})
+
+    def test_query_by_name(self):
+        backend = MongoBackend(create_indexes=False)
+        list(backend.find_events(name='a', query={'data.value': {'$gt': 1}}, batch_size=10))
+
+        args, kwargs = self.find_call()
+        self.assertEqual(args, ({'name': 'a', 'data.value': {'$gt': 1}},))
+        self.assertEqual(kwargs, {'batch_size': 10, 'hint': [('name', pymongo.ASCENDING)]})
+
+    def test_open_range(self):
+        backend = MongoBackend(create_indexes=False)
+        list(backend.find_events(start=self.start, hint=None))
+        self.assertEqual(self.find_call(), (({'time': {'$gte': self.start}},), {'batch_size': 1000}))
+
+    def test_projection_and_sort(self):
+        backend = MongoBackend(create_indexes=False)
+        list(backend.find_events(fields=['name', 'time'], sort=pymongo.ASCENDING))
+
+        _, kwargs = self.find_call()
+        self.assertEqual(kwargs['projection'], {'name': True, 'time': True, '_id': False})
+        self.assertEqual(kwargs['sort'], [('time', pymongo.ASCENDING)])
+        self.assertNotIn('hint', kwargs)
+
+    def test_time_series_not_hinted(self):
+        backend = MongoBackend(create_indexes=False, time_series=True)
+        list(backend.find_events(start=self.start, end=self.end))
+        self.assertNotIn('hint', self.find_call()[1])
+
+    def test_buckets(self):
+        backend = MongoBackend(create_indexes=False, bucket_interval='day')
+        events = list(backend.find_events(start=self.start, end=self.end))
+        self.assertEqual(events, ['events_20130101', 'events_20130102'])
+
+    def test_buckets_descending(self):
+        backend = MongoBackend(create_indexes=False, bucket_interval='day')
+        events = list(backend.find_events(start=self.start, end=self.end, sort=pymongo.DESCENDING))
+        self.assertEqual(events, ['events_20130102', 'events_20130101'])
+
+    def test_buckets_open_range(self):
+        self.database.list_collection_names.return_value = [
+            'events_20130103', 'events_20121231', 'events_20130101', 'events', 'other_20130101',
+        ]
+        backend = MongoBackend(create_indexes=False, bucket_interval='day')
+
+        self.assertEqual(list(backend.find_events()), ['events_20121231', 'events_20130101', 'events_20130103'])
+        self.assertEqual(list(backend.find_events(start=self.start)), ['events_20130101', 'events_20130103'])
+        self.assertEqual(list(backend.find_events(end=self.start)), ['events_20121231', 'events_20130101'])
+
+    def test_cursor_closed(self):
+        mock_cursor = cursor(['a', 'b'])
+        self.collections['events'] = MagicMock(**{'find.return_value': mock_cursor})
+        backend = MongoBackend(create_indexes=False)
+
+        events = backend.find_events()
+        next(events)
+        events.close()
+
+        mock_cursor.close.assert_called_once_with()
+
+
+class TestEncodedDocuments(MongoTestCase):
+    """Test inserting documents that are encoded as BSON"""
+
+    def setUp(self):
+        super(TestEncodedDocuments, self).setUp()
+        self.database = self.mongo_client.return_value.__getitem__.return_value
+        self.database.codec_options = DEFAULT_CODEC_OPTIONS
+        self.insert_many = self.database.__getitem__.return_value.insert_many
+
+    def inserted(self):
+        """The documents passed to each call to insert_many"""
+        return [list(first_argument(call)) for call in self.insert_many.mock_calls]
+
+    def test_raw_document_inserted_as_is(self):
+        backend = MongoBackend(batch_size=1)
+        document = RawBSONDocument(BSON.encode({'_id': 1, 'name': 'test'}))
+
+        backend.send(document)
+
+        self.assertIs(self.inserted()[0][0], document)
+
+    def test_raw_document_bucket(self):
+        backend = MongoBackend(batch_size=1, bucket_interval='day', create_indexes=False)
+        timestamp = datetime(2013, 1, 1, tzinfo=UTC)
+
+        backend.send(RawBSONDocument(BSON.encode({'_id': 1, 'time': timestamp})))
+
+        self.database.__getitem__.assert_any_call('events_20130101')
+
+    def test_encode_documents(self):
+        raw = RawBSONDocument(BSON.encode({'_id': 1}))
+        documents = [{'name': 'a'}, {'name': object()}, raw, {'_id': 2, 'name': 'b'}]
+
+        encoded = encode_documents(documents, DEFAULT_CODEC_OPTIONS)
+
+        self.assertEqual(len(encoded), 3)
+        self.assertIsInstance(encoded[0]['_id'], ObjectId)
+        self.assertEqual(encoded[0]['_id'], documents[0]['_id'])
+        self.assertEqual(encoded[0]['name'], 'a')
+        self.assertIs(encoded[1], raw)
+        self.assertEqual(dict(encoded[2]), {'_id': 2, 'name': 'b'})
+
+    def test_encoders(self):
+        encoding_threads = set()
+
+        def record_thread(documents, codec_options):
+            """Record the thread that encodes the documents"""
+            encoding_threads.add(threading.current_thread().name)
+            return encode_documents(documents, codec_options)
+
+        backend = MongoBackend(batch_size=2, encoders=2, flush_interval=60)
+        self.addCleanup(backend.close)
+        events = [{'sequence': i} for i in range(7)]
+
+        with patch('eventtracking.backends.mongodb.encode_documents', side_effect=record_thread):
+            for event in events:
+                backend.send(event)
+            backend.flush()
+
+        batches = self.inserted()
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 2, 1])
+        self.assertEqual([document['sequence'] for batch in batches for document in batch], list(range(7)))
+        self.assertIsInstance(batches[0][0], RawBSONDocument)
+        self.assertNotIn('eventtracking-mongo-writer', encoding_threads)
+        self.assertNotIn('_id', events[0])
+
+    def test_encoding_error(self):
+        backend = MongoBackend(batch_size=2, encoders=1, flush_interval=60)
+        self.addCleanup(backend.close)
+
+        with patch.object(backend, 'encode_groups', side_effect=[PyMongoError, [('events', [sentinel.document])]]):
+            backend.send_batch([{'sequence': i} for i in range(4)])
+            backend.flush()
+
+        self.assertEqual(self.inserted(), [[sentinel.document]])
+
+    def test_unexpected_encoding_error(self):
+        backend = MongoBackend(batch_size=2, encoders=1, flush_interval=60)
+        self.addCleanup(backend.close)
+
+        with patch.object(backend, 'encode_groups', side_effect=[RuntimeError, [('events', [sentinel.document])]]):
+            backend.send_batch([{'sequence': i} for i in range(4)])
+            backend.flush()
+
+        self.assertEqual(self.inserted(), [[sentinel.document]])
+        self.assertTrue(backend.worker.is_alive())
+
+
+class TestBufferedMongoBackend(MongoTestCase):
+    """Test buffering events and writing them in batches"""
+
+    def setUp(self):
+        super(TestBufferedMongoBackend, self).setUp()
+        self.backend = MongoBackend(batch_size=3, flush_interval=60, retry_delay=0)
+        self.addCleanup(self.backend.close)
+        self.insert_many = self.backend.collection.insert_many
+        self.events = [{'test': i} for i in range(7)]
+
+    def inserted_batches(self):
+        """The documents passed to each call to insert_many"""
+        return [list(first_argument(call)) for call in self.insert_many.mock_calls]
+
+    def test_batches(self):
+        for event in self.events:
+            self.backend.send(event)
+        self.backend.flush()
+
+        self.assertEqual(self.inserted_batches(), [self.events[0:3], self.events[3:6], self.events[6:]])
+        for call in self.insert_many.mock_calls:
+            self.assertEqual(call[2], {'ordered': False})
+
+    def test_send_batch(self):
+        self.backend.send_batch(self.events[:3])
+        self.backend.flush()
+        self.assertEqual(self.inserted_batches(), [self.events[:3]])
+
+    def test_flush_interval(self):
+        self.backend.flush_interval = 0.01
+        self.backend.send(self.events[0])
+
+        for _ in range(500):
+            if self.insert_many.called:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(self.inserted_batches(), [self.events[:1]])
+
+    def test_close(self):
+        self.backend.send(self.events[0])
+        self.backend.close()
+        self.assertEqual(self.inserted_batches(), [self.events[:1]])
+        self.assertIsNone(self.backend.worker)
+
+    def test_flush_without_events(self):
+        self.backend.flush()
+        self.backend.close()
+        self.assertFalse(self.insert_many.called)
+
+    def test_retry_failed_documents(self):
+        self.insert_many.side_effect = [
+            BulkWriteError({'writeErrors': [
+                {'index': 0, 'code': DUPLICATE_KEY},
+                {'index': 2, 'code': 1},
+            ]}),
+            None,
+        ]
+
+        self.backend.send_batch(self.events[:3])
+        self.backend.flush()
+
+        self.assertEqual(self.inserted_batches(), [self.events[:3], self.events[2:3]])
+
+    def test_retries_limited(self):
+        self.insert_many.side_effect = BulkWriteError({'writeErrors': [{'index': 0, 'code': 1}]})
+        self.backend.send(self.events[0])
+        self.backend.flush()
+        self.assertEqual(len(self.insert_many.mock_calls), self.backend.max_retries + 1)
+
+    def test_invalid_document(self):
+        self.insert_many.side_effect = InvalidDocument
+        insert_one = self.backend.collection.insert_one
+        insert_one.side_effect = [None, InvalidDocument, None]
+
+        self.backend.send_batch(self.events[:3])
+        self.backend.flush()
+
+        self.assertEqual([first_argument(call) for call in insert_one.mock_calls], self.events[:3])
+
+    def test_unexpected_error(self):
+        self.insert_many.side_effect = [RuntimeError, None]
+
+        self.backend.send_batch(self.events[:3])
+        self.backend.flush()
+        self.backend.send(self.events[3])
+        self.backend.flush()
+
+        self.assertTrue(self.backend.worker.is_alive())
+        self.assertEqual(self.inserted_batches(), [self.events[:3], self.events[3:4]])
+
+    def test_event_changed_after_send(self):
+        event = {'name': 'test', 'data': {'value': 1}}
+
+        self.backend.send(event)
+        event['data']['value'] = 2
+        event['data']['other'] = 3
+        self.backend.flush()
+
+        self.assertEqual(self.inserted_batches(), [[{'name': 'test', 'data': {'value': 1}}]])
+
+    def test_acknowledged_writes(self):
+        self.assertEqual(self.backend.connection_parameters['w'], 1)
+        self.assertEqual(MongoBackend(batch_size=1).connection_parameters['w'], 0)
+        self.assertEqual(MongoBackend(extra={'w': 0}).connection_parameters['w'], 0)
+
+    def test_close_timeout(self):
+        self.backend.close_timeout = 0.2
+        started = threading.Event()
+
+        def slow_insert(documents, **kwargs):  # pylint: disable=unused-argument
+            """Take longer than closing may wait"""
+            started.set()
+            time.sleep(0.5)
+
+        self.insert_many.side_effect = slow_insert
+        self.backend.send_batch(self.events)
+        started.wait(5)
+        worker = self.backend.worker
+
+        before = time.monotonic()
+        self.backend.close()
+        self.assertLess(time.monotonic() - before, 0.4)
+        worker.join(5)
+
+        self.assertEqual(len(self.insert_many.mock_calls), 1)
+        self.assertEqual(self.backend.dropped, 4)
+
+    def test_unreachable_while_closing(self):
+        self.insert_many.side_effect = ServerSelectionTimeoutError('unreachable')
+        self.backend.send_batch(self.events)
+        self.backend.close()
+
+        self.assertEqual(len(self.insert_many.mock_calls), 1)
+        self.assertEqual(self.backend.dropped, 4)
+
+    def test_unreachable_before_closing(self):
+        self.insert_many.side_effect = [ServerSelectionTimeoutError('unreachable'), None, None]
+        self.backend.send_batch(self.events[:3])
+        self.backend.flush()
+        self.backend.send_batch(self.events[3:])
+        self.backend.close()
+
+        self.assertEqual(self.inserted_batches(), [self.events[:3], self.events[3:6], self.events[6:]])
+        self.assertEqual(self.backend.dropped, 0)
+
+    def test_queue_full(self):
+        backend = MongoBackend(queue_size=1)
+        with patch.object(backend, 'start_worker'):
+            backend.worker_pid = os.getpid()
+            backend.send(self.events[0])
+            backend.send(self.events[1])
+            backend.worker_pid = None
+        self.assertEqual(backend.dropped, 1)
+
+    def test_forked_process_starts_worker(self):
+        self.backend.send(self.events[0])
+        self.backend.flush()
+        parent_queue = self.backend.queue
+
+        with patch('eventtracking.backends.mongodb.os.getpid', return_value=-1):
+            self.backend.send(self.events[1])
+            self.assertIsNot(self.backend.queue, parent_queue)
+            self.backend.close()
+
+        self.assertEqual(self.inserted_batches(), [self.events[:1], self.events[1:2]])
@@ -35,6 +35,7 @@ class TestMongoIntegration(IntegrationTestCase):
 
     def tearDown(self):
         self.mongo_backend.connection.drop_database(self.database_name)
+        self.mongo_backend.close()
         super(TestMongoIntegration, self).tearDown()
 
     def test_sequential_events(self):
@@ -50,6 +51,7 @@ class TestMongoIntegration(IntegrationTestCase):
 
         # Ensure MongoDB has finished writing out the events before we
         # run our query.
+        self.mongo_backend.flush()
         self.mongo_backend.connection.fsync()
 
         mem_events = {}
@@ -30,12 +30,35 @@ class TestBackendPerformance(PerformanceTestCase):
 
     def tearDown(self):
         self.mongo_backend.connection.drop_database(self.database_name)
+        self.mongo_backend.close()
         super(TestBackendPerformance, self).tearDown()
 
     def test_sequential_events(self):
         with self.assert_execution_time_less_than_threshold():
-            for i in range(self.num_events):
-                self.tracker.emit('perf.event', {
-                    'sequence': i,
-                    'payload': self.random_payload
-                })
+            self.emit_events()
+            self.mongo_backend.flush()
+
+    def test_unbuffered_sequential_events(self):
+        self.mongo_backend.batch_size = 1
+        with self.assert_execution_time_less_than_threshold():
+            self.emit_events()
+
+    def test_bucketed_sequential_events(self):
+        self.mongo_backend.bucket_interval = 'day'
+        with self.assert_execution_time_less_than_threshold():
+            self.emit_events()
+            self.mongo_backend.flush()
+
+    def test_encoded_sequential_events(self):
+        self.mongo_backend.encoders = 2
+        with self.assert_execution_time_less_than_threshold():
+            self.emit_events()
+            self.mongo_backend.flush()
+
+    def emit_events(self):
+        """Emit the events to the tracker"""
+        for i in range(self.num_events):
+            self.tracker.emit('perf.event', {
+                'sequence': i,
+                'payload': self.random_payload
+            })
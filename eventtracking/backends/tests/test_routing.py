@@ -8,6 +8,7 @@ import six
 from mock import MagicMock, sentinel
 from six.moves import range
 
+from eventtracking.backends.logger import LoggerBackend
 from eventtracking.backends.routing import RoutingBackend
 from eventtracking.processors.exceptions import EventEmissionExit
 
@@ -280,3 +281,277 @@ class TestRoutingBackend(TestCase):
 
         router.send(self.sample_event)
         self.assertEqual(call_order, ['0', '1', '2', '3', '4'])
+
+    def test_processor_attached_to_router(self):
+        processor = MagicMock()
+        router = RoutingBackend(processors=[processor])
+        processor.attach_router.assert_called_once_with(router)
+
+    def test_send_from_processor(self):
+        first_processor = MagicMock()
+        second_processor = MagicMock()
+        second_processor.return_value = sentinel.processed_event
+        self.router.register_processor(first_processor)
+        self.router.register_processor(second_processor)
+
+        self.router.send_from(first_processor, self.sample_event)
+
+        self.assertEqual(len(first_processor.mock_calls), 1)  # Only the call to attach_router
+        second_processor.assert_called_once_with(self.sample_event)
+        self.assert_single_event_emitted(sentinel.processed_event)
+
+    def test_send_from_last_processor(self):
+        processor = MagicMock()
+        self.router.register_processor(processor)
+        self.router.send_from(processor, self.sample_event)
+        self.assert_single_event_emitted(self.sample_event)
+
+    def test_send_from_aborted(self):
+        first_processor = MagicMock()
+        second_processor = MagicMock(side_effect=EventEmissionExit)
+        self.router.register_processor(first_processor)
+        self.router.register_processor(second_processor)
+        self.router.send_from(first_processor, self.sample_event)
+        self.assertEqual(len(self.mock_backend.mock_calls), 0)
+
+    def test_warm_up(self):
+        nested_backend = MagicMock()
+        router = RoutingBackend(backends={
+            '0': self.mock_backend,
+            '1': RoutingBackend(backends={'0': nested_backend}),
+            '2': MagicMock(spec=['send']),
+        })
+        self.mock_backend.warm_up.side_effect = RuntimeError
+
+        router.warm_up()
+
+        self.mock_backend.warm_up.assert_called_once_with()
+        nested_backend.warm_up.assert_called_once_with()
+
+
+class PureFilter:
+    """A pure filter that records when it is called and rejects events with a given name"""
+
+    pure_filter = True
+
+    def __init__(self, name, call_order, rejected_name=None):
+        self.name = name
+        self.call_order = call_order
+        self.rejected_name = rejected_name
+
+    def __call__(self, event):
+        self.call_order.append(self.name)
+        if event['name'] == self.rejected_name:
+            raise EventEmissionExit()
+        return event
+
+
+class TestAdaptiveProcessorOrdering(TestCase):
+    """Test reordering of the processors that are pure filters"""
+
+    def setUp(self):
+        super(TestAdaptiveProcessorOrdering, self).setUp()
+        self.call_order = []
+        self.mock_backend = MagicMock()
+
+    def create_filter(self, name, rejected_name=None):
+        """Build a filter that records calls in the shared call order"""
+        return PureFilter(name, self.call_order, rejected_name)
+
+    def record_processor(self, name):
+        """Build a processor that is not a pure filter and records calls in the shared call order"""
+        def processor(event):
+            """Record the call"""
+            self.call_order.append(name)
+            return event
+        return processor
+
+    def send_events(self, router, names):
+        """Send an event for each name and return the order of processor calls for the last event"""
+        for name in names:
+            del self.call_order[:]
+            router.send({'name': name})
+        return list(self.call_order)
+
+    def test_selective_filter_moved_first(self):
+        router = RoutingBackend(
+            backends={'0': self.mock_backend},
+            processors=[self.create_filter('permissive'), self.create_filter('selective', rejected_name='spam')],
+            reorder_filters=True,
+            reorder_interval=10,
+        )
+        self.assertEqual(self.send_events(router, ['ok']), ['permissive', 'selective'])
+        self.assertEqual(self.send_events(router, ['spam'] * 20 + ['ok']), ['selective', 'permissive'])
+        self.assertEqual(router.filter_statistics[id(router.processors[1])].rejections, 20)
+        self.assertEqual(len(self.mock_backend.send.mock_calls), 2)
+
+    def test_filters_not_moved_past_other_processors(self):
+        router = RoutingBackend(
+            processors=[
+                self.create_filter('permissive'),
+                self.record_processor('mutating'),
+                self.create_filter('selective', rejected_name='spam'),
+            ],
+            reorder_filters=True,
+            reorder_interval=10,
+        )
+        self.assertEqual(
+            self.send_events(router, ['spam'] * 20 + ['ok']),
+            ['permissive', 'mutating', 'selective']
+        )
+
+    def test_disabled_by_default(self):
+        router = RoutingBackend(
+            processors=[self.create_filter('permissive'), self.create_filter('selective', rejected_name='spam')],
+            reorder_interval=10,
+        )
+        self.assertEqual(self.send_events(router, ['spam'] * 20 + ['ok']), ['permissive', 'selective'])
+        self.assertEqual(router.filter_statistics, {})
+
+    def test_mock_processors_are_not_filters(self):
+        router = RoutingBackend(processors=[MagicMock()], reorder_filters=True)
+        self.assertEqual(router.filter_statistics, {})
+
+    def test_failing_processors_are_logged(self):
+        failing_filter = self.create_filter('failing')
+        failing_filter.call_order = None  # Appending to None raises an AttributeError
+        router = RoutingBackend(
+            backends={'0': self.mock_backend},
+            processors=[MagicMock(side_effect=RuntimeError), failing_filter],
+            reorder_filters=True,
+        )
+        router.send({'name': 'ok'})
+        self.mock_backend.send.assert_called_once_with({'name': 'ok'})
+        self.assertEqual(router.filter_statistics[id(failing_filter)].calls, 1)
+
+
+class TestSharedSerialization(TestCase):
+    """Test that backends of a routing tree share the serialized event"""
+
+    def create_backend(self):
+        """Build a logger backend that records the events it logs"""
+        backend = LoggerBackend(max_event_size=None)
+        backend.serializer.encode = MagicMock(wraps=backend.serializer.encode)
+        backend.log = MagicMock()
+        return backend
+
+    def test_event_serialized_once(self):
+        backends = {str(i): self.create_backend() for i in range(3)}
+        router = RoutingBackend(backends=backends)
+        router.send({'name': 'test'})
+
+        encode_calls = sum(backend.serializer.encode.call_count for backend in backends.values())
+        self.assertEqual(encode_calls, 1)
+        for backend in backends.values():
+            backend.log.assert_called_once_with('{"name": "test"}')
+
+    def test_modified_by_nested_processors(self):
+        def change_name(event):
+            """Modify the event in place"""
+            event['name'] = 'changed'
+
+        first_backend = self.create_backend()
+        nested_backend = self.create_backend()
+        last_backend = self.create_backend()
+        router = RoutingBackend(backends={
+            '0': first_backend,
+            '1': RoutingBackend(backends={'0': nested_backend}, processors=[change_name]),
+            '2': last_backend,
+        })
+        router.send({'name': 'test'})
+
+        first_backend.log.assert_called_once_with('{"name": "test"}')
+        nested_backend.log.assert_called_once_with('{"name": "changed"}')
+        last_backend.log.assert_called_once_with('{"name": "changed"}')
+
+
+class BatchRecordingBackend:
+    """A backend that records the batches of events it is sent"""
+
+    def __init__(self):
+        self.batches = []
+
+    def send(self, event):
+        """Record a single event as a batch"""
+        self.batches.append([event])
+
+    def send_batch(self, events):
+        """Record a batch of events"""
+        self.batches.append(list(events))
+
+
+class TestSendBatch(TestCase):
+    """Test sending batches of events through a routing tree"""
+
+    def setUp(self):
+        super(TestSendBatch, self).setUp()
+        self.events = [{'name': str(i)} for i in range(3)]
+
+    def test_batch_backend(self):
+        backend = BatchRecordingBackend()
+        router = RoutingBackend(backends={'0': backend})
+        router.send_batch(self.events)
+        self.assertEqual(backend.batches, [self.events])
+
+    def test_backend_without_send_batch(self):
+        backend = MagicMock(spec=['send'])
+        router = RoutingBackend(backends={'0': backend})
+        router.send_batch(self.events)
+        self.assertEqual([c[0][0] for c in backend.send.call_args_list], self.events)
+
+    def test_aborted_events_left_out(self):
+        def reject_first(event):
+            """Prevent the first event from being emitted"""
+            if event['name'] == '0':
+                raise EventEmissionExit()
+            event['processed'] = True
+
+        backend = BatchRecordingBackend()
+        router = RoutingBackend(backends={'0': backend}, processors=[reject_first])
+        router.send_batch(self.events)
+        self.assertEqual(backend.batches, [[
+            {'name': '1', 'processed': True},
+            {'name': '2', 'processed': True},
+        ]])
+
+    def test_all_events_aborted(self):
+        backend = MagicMock()
+        router = RoutingBackend(backends={'0': backend}, processors=[MagicMock(side_effect=EventEmissionExit)])
+        router.send_batch(self.events)
+        self.assertEqual(len(backend.mock_calls), 0)
+
+    def test_backend_failure(self):
+        failing_backend = MagicMock()
+        failing_backend.send_batch.side_effect = RuntimeError
+        backend = BatchRecordingBackend()
+        router = RoutingBackend(backends={'0': failing_backend, '1': backend})
+        router.send_batch(self.events)
+        self.assertEqual(backend.batches, [self.events])
+
+    def test_nested_routers(self):
+        backend = BatchRecordingBackend()
+        router = RoutingBackend(backends={'0': RoutingBackend(backends={'0': backend})})
+        router.send_batch(self.events)
+        self.assertEqual(backend.batches, [self.events])
+
+    def test_backend_call_order(self):
+        call_order = []
+
+        def change_name(event):
+            """Modify the event in place"""
+            event['name'] = 'changed'
+
+        first_backend = MagicMock(spec=['send'])
+        first_backend.send.side_effect = lambda event: call_order.append(('first', event['name']))
+        last_backend = MagicMock(spec=['send'])
+        last_backend.send.side_effect = lambda event: call_order.append(('last', event['name']))
+        router = RoutingBackend(backends={
+            '0': first_backend,
+            '1': RoutingBackend(backends={}, processors=[change_name]),
+            '2': last_backend,
+        })
+        router.send_batch(self.events)
+        self.assertEqual(call_order, [
+            ('first', '0'), ('first', '1'), ('first', '2'),
+            ('last', 'changed'), ('last', 'changed'), ('last', 'changed'),
+        ])
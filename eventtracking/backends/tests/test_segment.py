@@ -2,11 +2,15 @@
 
 from __future__ import absolute_import
 
+from datetime import datetime
 from unittest import TestCase
+
 from mock import patch
 from mock import sentinel
+from pytz import UTC
 
-from eventtracking.backends.segment import SegmentBackend
+from eventtracking.backends.segment import MAX_MESSAGE_BYTES, SegmentBackend
+from eventtracking.backends.tests import StandInServer
 
 
 class TestSegmentBackend(TestCase):
@@ -175,6 +179,92 @@ class TestSegmentBackend(TestCase):
             sentinel.user_id, sentinel.name, event, context=expected_segment_context)
 
 
+class TestSegmentBackendProjections(TestCase):
+    """Test sending a subset of the fields of events to segment.com"""
+
+    def setUp(self):
+        super(TestSegmentBackendProjections, self).setUp()
+        patcher = patch('eventtracking.backends.segment.analytics')
+        self.addCleanup(patcher.stop)
+        self.mock_analytics = patcher.start()
+        self.event = {
+            'name': 'enrolled',
+            'context': {
+                'user_id': sentinel.user_id,
+                'org_id': sentinel.org_id,
+                'session': sentinel.session,
+            },
+            'data': {
+                'course_id': sentinel.course_id,
+                'mode': sentinel.mode,
+            }
+        }
+
+    def test_projection(self):
+        backend = SegmentBackend(projections={'enrolled': ['name', 'data.course_id', 'context.org_id']})
+        backend.send(self.event)
+        self.mock_analytics.track.assert_called_once_with(sentinel.user_id, 'enrolled', {
+            'name': 'enrolled',
+            'context': {'org_id': sentinel.org_id},
+            'data': {'course_id': sentinel.course_id},
+        }, context={})
+
+    def test_event_without_projection(self):
+        backend = SegmentBackend(projections={'other': ['name']})
+        backend.send(self.event)
+        self.mock_analytics.track.assert_called_once_with(sentinel.user_id, 'enrolled', self.event, context={})
+
+    def test_default_projection(self):
+        backend = SegmentBackend(projections={'other': ['data']}, default_projection=['name'])
+        backend.send(self.event)
+        self.mock_analytics.track.assert_called_once_with(
+            sentinel.user_id, 'enrolled', {'name': 'enrolled'}, context={}
+        )
+
+
+class TestSegmentBackendPageCache(TestCase):
+    """Test reusing the page context of events"""
+
+    def setUp(self):
+        super(TestSegmentBackendPageCache, self).setUp()
+        self.backend = SegmentBackend(max_cached_pages=2)
+
+    def test_cached(self):
+        context = {'host': 'hostname', 'path': '/a', 'ip': sentinel.ip}
+        with patch('eventtracking.backends.segment.urlunsplit', return_value='https://hostname/a') as mock_urlunsplit:
+            first = self.backend.segment_context(context)
+            second = self.backend.segment_context(dict(context, ip=sentinel.other_ip))
+
+        self.assertEqual(mock_urlunsplit.call_count, 1)
+        self.assertEqual(first['page'], {'path': '/a', 'url': 'https://hostname/a'})
+        self.assertIs(first['page'], second['page'])
+        self.assertEqual(second['ip'], sentinel.other_ip)
+
+    def test_distinct_pages(self):
+        first = self.backend.segment_context({'host': 'hostname', 'path': '/a'})
+        second = self.backend.segment_context({'host': 'hostname', 'path': '/a', 'referer': 'https://other/'})
+        third = self.backend.segment_context({'host': 'other', 'path': '/a'})
+        self.assertEqual(first['page'], {'path': '/a', 'url': 'https://hostname/a'})
+        self.assertEqual(second['page'], {'path': '/a', 'url': 'https://hostname/a', 'referrer': 'https://other/'})
+        self.assertEqual(third['page'], {'path': '/a', 'url': 'https://other/a'})
+
+    def test_no_page(self):
+        self.assertEqual(self.backend.segment_context({'host': 'hostname'}), {})
+        self.assertEqual(self.backend.segment_context({}), {})
+
+    def test_eviction(self):
+        for path in ('/a', '/b', '/c'):
+            self.backend.segment_context({'host': 'hostname', 'path': path})
+        self.assertEqual(
+            list(self.backend.pages), [('hostname', '/b', None, None), ('hostname', '/c', None, None)]
+        )
+
+    def test_unhashable(self):
+        context = {'path': ['not', 'hashable']}
+        self.assertEqual(self.backend.segment_context(context), {'page': {'path': ['not', 'hashable']}})
+        self.assertEqual(len(self.backend.pages), 0)
+
+
 class TestSegmentBackendMissingDependency(TestCase):
     """Test the segment.com backend without the package installed"""
 
@@ -190,3 +280,91 @@ class TestSegmentBackendMissingDependency(TestCase):
         }
         backend = SegmentBackend()
         backend.send(event)
+
+
+class TestSegmentBackendTransport(TestCase):
+    """Test sending events to the batch endpoint of segment.com"""
+
+    def setUp(self):
+        super(TestSegmentBackendTransport, self).setUp()
+        self.server = StandInServer()
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        patcher = patch('eventtracking.backends.segment.analytics')
+        self.addCleanup(patcher.stop)
+        self.mock_analytics = patcher.start()
+        self.backend = SegmentBackend(write_key='secret', url=self.server.url + 'v1/batch', flush_interval=60)
+        self.addCleanup(self.backend.close)
+
+    def test_batch(self):
+        timestamp = datetime(2013, 10, 3, 8, 24, 55, tzinfo=UTC)
+        event = {
+            'name': 'foo',
+            'timestamp': timestamp,
+            'context': {
+                'user_id': 10,
+                'agent': 'Mozilla',
+            },
+            'data': {
+                'foo': 'bar'
+            }
+        }
+        self.backend.send(event)
+        self.backend.send(dict(event, name='bar'))
+        self.backend.flush()
+
+        self.assertEqual(len(self.mock_analytics.mock_calls), 0)
+        self.assertEqual(len(self.server.requests), 1)
+        request = self.server.requests[0]
+        self.assertEqual(request.path, '/v1/batch')
+        self.assertEqual(request.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(request.headers['Authorization'], 'Basic c2VjcmV0Og==')
+
+        body = self.server.json_bodies()[0]
+        self.assertIn('sentAt', body)
+        messages = body['batch']
+        self.assertEqual([message['event'] for message in messages], ['foo', 'bar'])
+        message = messages[0]
+        self.assertEqual(message['type'], 'track')
+        self.assertEqual(message['userId'], '10')
+        self.assertEqual(message['context'], {'userAgent': 'Mozilla'})
+        self.assertEqual(message['timestamp'], '2013-10-03T08:24:55+00:00')
+        self.assertEqual(message['properties']['data'], {'foo': 'bar'})
+        self.assertEqual(len(message['messageId']), 26)
+        self.assertNotEqual(message['messageId'], messages[1]['messageId'])
+        self.assertEqual(self.backend.statistics.delivered, 2)
+
+    def test_missing_user_id(self):
+        self.backend.send({'name': 'foo', 'context': {}})
+        self.backend.flush()
+        self.assertEqual(self.server.requests, [])
+
+    def test_message_too_large(self):
+        self.backend.send({'name': 'foo', 'context': {'user_id': 10}, 'data': {'payload': 'x' * MAX_MESSAGE_BYTES}})
+        self.backend.flush()
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(self.backend.statistics.oversized, 1)
+
+    def test_projection(self):
+        backend = SegmentBackend(
+            write_key='secret', url=self.server.url, projections={'foo': ['name', 'data.foo']}
+        )
+        self.addCleanup(backend.close)
+        backend.send({'name': 'foo', 'context': {'user_id': 10, 'ip': '127.0.0.1'}, 'data': {'foo': 'bar', 'a': 1}})
+        backend.flush()
+
+        message = self.server.json_bodies()[0]['batch'][0]
+        self.assertEqual(message['properties'], {'name': 'foo', 'data': {'foo': 'bar'}})
+        self.assertEqual(message['context'], {'ip': '127.0.0.1'})
+
+    def test_batch_size_limit(self):
+        backend = SegmentBackend(write_key='secret', max_batch_size=1000)
+        self.addCleanup(backend.close)
+        self.assertEqual(backend.transport.max_batch_size, 100)
+
+    def test_no_write_key(self):
+        backend = SegmentBackend()
+        self.assertIsNone(backend.transport)
+        self.assertIsNone(backend.statistics)
+        backend.flush()
+        backend.close()
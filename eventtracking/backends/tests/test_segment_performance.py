@@ -0,0 +1,75 @@
+"""
+Measures the cost of sending events to a stand-in for the batch endpoint of segment.com.
+"""
+
+from __future__ import absolute_import, print_function
+
+import time
+
+from six.moves import range
+
+from eventtracking.backends.segment import SegmentBackend
+from eventtracking.backends.tests import PerformanceTestCase, StandInServer
+from eventtracking.tracker import Tracker
+
+
+class TestSegmentBackendPerformance(PerformanceTestCase):
+    """
+    Emits a burst of events to a SegmentBackend that sends them to a local server, and reports the rate at which they
+    are accepted by the backend and delivered to the server, along with the latency of delivery.
+    """
+
+    def test_burst(self):
+        with StandInServer() as server:
+            backend = SegmentBackend(write_key='secret', url=server.url, queue_size=self.num_events)
+            tracker = Tracker({'segment': backend})
+            tracker.enter_context('perf.request', {'user_id': 10, 'host': 'example.com', 'path': '/courses'})
+
+            with self.assert_execution_time_less_than_threshold():
+                start_time = time.time()
+                for i in range(self.num_events):
+                    tracker.emit('perf.event', {
+                        'sequence': i,
+                        'payload': self.random_payload
+                    })
+                accepted_time = time.time()
+                backend.close()
+                delivered_time = time.time()
+
+        statistics = backend.statistics.snapshot()
+        self.assertEqual(statistics['delivered'], self.num_events)
+
+        print('')
+        print('Accepted: {0:.0f} events per second'.format(self.num_events / (accepted_time - start_time)))
+        print('Delivered: {0:.0f} events per second in {1} requests'.format(
+            self.num_events / (delivered_time - start_time), statistics['requests']
+        ))
+        print('Delivery latency: {0:.3f} seconds on average, {1:.3f} seconds at most'.format(
+            statistics['delivery_seconds'] / statistics['batches'], statistics['max_delivery_seconds']
+        ))
+
+    def test_projection(self):
+        rates = []
+        sizes = []
+        for options in ({}, {'default_projection': ['name', 'timestamp', 'data.sequence']}):
+            with StandInServer() as server:
+                backend = SegmentBackend(write_key='secret', url=server.url, queue_size=self.num_events, **options)
+                tracker = Tracker({'segment': backend})
+                tracker.enter_context('perf.request', {'user_id': 10, 'host': 'example.com', 'path': '/courses'})
+
+                with self.assert_execution_time_less_than_threshold():
+                    start_time = time.time()
+                    for i in range(self.num_events):
+                        tracker.emit('perf.event', {
+                            'sequence': i,
+                            'payload': self.random_payload
+                        })
+                    backend.close()
+                    rates.append(self.num_events / (time.time() - start_time))
+                sizes.append(sum(len(request.body) for request in server.requests))
+
+        print('')
+        print('Entire events: {0:.0f} events per second, {1} bytes'.format(rates[0], sizes[0]))
+        print('Projected events: {0:.0f} events per second ({1:.1f}x), {2} bytes ({3:.0%})'.format(
+            rates[1], rates[1] / rates[0], sizes[1], float(sizes[1]) / sizes[0]
+        ))
@@ -0,0 +1,238 @@
+"""Test the serialization of events to JSON"""
+
+from __future__ import absolute_import
+
+import datetime
+import json
+from unittest import TestCase, skipIf
+
+from mock import MagicMock, patch
+import pytz
+
+from eventtracking.backends import serialization
+from eventtracking.backends.serialization import (
+    DateTimeJSONEncoder,
+    JSONSerializer,
+    OrjsonSerializer,
+    Serializer,
+    SharedSerialization,
+    encode_datetime,
+    get_serializer,
+)
+
+
+class CustomDateTime(datetime.datetime):
+    """A subclass of datetime that can't be found by type"""
+
+
+class TestEncodeDatetime(TestCase):
+    """Test the fast path for serializing datetime objects"""
+
+    def test_matches_conversion_to_utc(self):
+        naive = datetime.datetime(2012, 5, 1, 7, 27, 1, 200)
+        for test_time in [
+                naive,
+                naive.replace(microsecond=0),
+                pytz.UTC.localize(naive),
+                pytz.timezone('US/Eastern').localize(naive),
+                pytz.timezone('Europe/London').localize(datetime.datetime(2012, 1, 1, 7, 27, 1)),
+                naive.replace(tzinfo=datetime.timezone(datetime.timedelta(hours=5, minutes=30))),
+        ]:
+            if test_time.tzinfo is None:
+                expected = pytz.UTC.localize(test_time).isoformat()
+            else:
+                expected = test_time.astimezone(pytz.UTC).isoformat()
+            self.assertEqual(encode_datetime(test_time), expected)
+
+
+class TestJSONSerializer(TestCase):
+    """Test the standard library serializer"""
+
+    def setUp(self):
+        super(TestJSONSerializer, self).setUp()
+        self.serializer = JSONSerializer()
+
+    def test_identical_to_json_dumps(self):
+        event = {
+            'name': u'caf\xe9',
+            'timestamp': datetime.datetime(2012, 5, 1, 7, 27, 1, 200, tzinfo=pytz.UTC),
+            'data': {'date': datetime.date(2012, 5, 7), 'list': [1, 2.5, None, True], 10: 'int key'},
+        }
+        self.assertEqual(self.serializer.serialize(event), json.dumps(event, cls=DateTimeJSONEncoder))
+        self.assertEqual(
+            self.serializer.serialize(event),
+            '{"name": "caf\\u00e9", "timestamp": "2012-05-01T07:27:01.000200+00:00", '
+            '"data": {"date": "2012-05-07", "list": [1, 2.5, null, true], "10": "int key"}}'
+        )
+
+    def test_datetime_subclass(self):
+        test_time = CustomDateTime(2012, 5, 1, 7, 27, 1)
+        self.assertEqual(self.serializer.serialize([test_time]), '["2012-05-01T07:27:01+00:00"]')
+
+    def test_unserializable(self):
+        with self.assertRaises(TypeError):
+            self.serializer.serialize({'foo': object()})
+
+
+@skipIf(serialization.orjson is None, 'orjson is not installed')
+class TestOrjsonSerializer(TestCase):
+    """Test the orjson serializer"""
+
+    def setUp(self):
+        super(TestOrjsonSerializer, self).setUp()
+        self.serializer = OrjsonSerializer()
+
+    def test_equivalent_to_json_dumps(self):
+        event = {
+            'name': u'caf\xe9',
+            'timestamp': pytz.timezone('US/Eastern').localize(datetime.datetime(2012, 5, 1, 7, 27, 1, 200)),
+            'naive': datetime.datetime(2012, 5, 1, 7, 27, 1),
+            'data': {'date': datetime.date(2012, 5, 7), 'list': [1, 2.5, None, True], 10: 'int key'},
+        }
+        serialized = self.serializer.serialize(event)
+        self.assertEqual(json.loads(serialized), json.loads(json.dumps(event, cls=DateTimeJSONEncoder)))
+        self.assertIn(u'"timestamp":"2012-05-01T11:27:01.000200+00:00"', serialized)
+
+    def test_fallback_to_standard_library(self):
+        event = {'big': 2 ** 70}
+        self.assertEqual(self.serializer.serialize(event), json.dumps(event))
+
+    def test_unserializable(self):
+        with self.assertRaises(TypeError):
+            self.serializer.serialize({'foo': object()})
+
+
+class TestGetSerializer(TestCase):
+    """Test looking up serializers by name"""
+
+    def test_default(self):
+        self.assertIsInstance(get_serializer(), JSONSerializer)
+        self.assertIsInstance(get_serializer('json'), JSONSerializer)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            get_serializer('xml')
+
+    @patch('eventtracking.backends.serialization.orjson', None)
+    def test_fastest_without_orjson(self):
+        self.assertIsInstance(get_serializer('fastest'), JSONSerializer)
+
+    @patch('eventtracking.backends.serialization.orjson', None)
+    def test_orjson_not_installed(self):
+        with self.assertRaises(ValueError):
+            get_serializer('orjson')
+
+    @skipIf(serialization.orjson is None, 'orjson is not installed')
+    def test_fastest_with_orjson(self):
+        self.assertIsInstance(get_serializer('fastest'), OrjsonSerializer)
+
+
+class TestSharedSerialization(TestCase):
+    """Test sharing serialized events between serializers"""
+
+    def setUp(self):
+        super(TestSharedSerialization, self).setUp()
+        self.event = {'name': 'test'}
+        self.serializer = JSONSerializer()
+        self.serializer.encode = MagicMock(wraps=self.serializer.encode)
+        self.other_serializer = JSONSerializer()
+        self.other_serializer.encode = MagicMock(wraps=self.other_serializer.encode)
+
+    def assert_encode_calls(self, count):
+        """Assert the number of times the event was actually encoded"""
+        self.assertEqual(self.serializer.encode.call_count + self.other_serializer.encode.call_count, count)
+
+    def test_not_shared_outside_of_scope(self):
+        self.serializer.serialize(self.event)
+        self.serializer.serialize(self.event)
+        self.assert_encode_calls(2)
+
+    def test_shared_within_scope(self):
+        with SharedSerialization(self.event):
+            self.assertEqual(self.serializer.serialize(self.event), '{"name": "test"}')
+            self.assertEqual(self.other_serializer.serialize(self.event), '{"name": "test"}')
+        self.assert_encode_calls(1)
+
+    def test_only_shared_for_same_event(self):
+        with SharedSerialization(self.event):
+            self.serializer.serialize(self.event)
+            self.assertEqual(self.serializer.serialize({'name': 'other'}), '{"name": "other"}')
+        self.assert_encode_calls(2)
+
+    def test_only_shared_for_same_name(self):
+        orjson_serializer = MagicMock(wraps=JSONSerializer())
+        orjson_serializer.name = 'other'
+        with SharedSerialization(self.event):
+            self.serializer.serialize(self.event)
+            Serializer.serialize(orjson_serializer, self.event)
+        self.assertEqual(orjson_serializer.encode.call_count, 1)
+
+    def test_nested_scope_shares_results(self):
+        with SharedSerialization(self.event):
+            self.serializer.serialize(self.event)
+            with SharedSerialization(self.event):
+                self.other_serializer.serialize(self.event)
+        self.assert_encode_calls(1)
+
+    def test_isolated_scope(self):
+        with SharedSerialization(self.event):
+            self.serializer.serialize(self.event)
+            with SharedSerialization(self.event, isolated=True):
+                self.event['name'] = 'modified'
+                self.assertEqual(self.other_serializer.serialize(self.event), '{"name": "modified"}')
+            self.assertEqual(self.serializer.serialize(self.event), '{"name": "modified"}')
+        self.assert_encode_calls(3)
+
+    def test_isolated_scope_for_other_event(self):
+        with SharedSerialization(self.event):
+            self.serializer.serialize(self.event)
+            with SharedSerialization({'name': 'other'}, isolated=True):
+                pass
+            self.serializer.serialize(self.event)
+        self.assert_encode_calls(1)
+
+
+class TestEstimateSize(TestCase):
+    """Test estimating the serialized size of events"""
+
+    def test_exact_for_simple_values(self):
+        for value in [
+                {'name': 'test', 'data': {'list': [1, 2, None, True], 3: {}}},
+                [],
+                {},
+                'a string',
+                ['a', ('b', 'c')],
+        ]:
+            self.assertEqual(serialization.estimate_size(value), len(json.dumps(value)))
+
+    def test_exact_for_compact_separators(self):
+        for value in [
+                {'name': 'test', 'data': {'list': [1, 2, None, True], 'empty': {}}},
+                [],
+                {},
+                ['a', ('b', 'c')],
+        ]:
+            self.assertEqual(
+                serialization.estimate_size(value, compact=True), len(json.dumps(value, separators=(',', ':')))
+            )
+
+    def test_compact_serializers(self):
+        self.assertFalse(serialization.JSONSerializer.compact)
+        self.assertTrue(serialization.OrjsonSerializer.compact)
+
+    def test_lower_bound(self):
+        for value in [
+                {'time': datetime.datetime.now(), 'date': datetime.date.today()},
+                [1234567, 1.5, False, object()],
+                u'caf\xe9 "quoted"',
+        ]:
+            self.assertLessEqual(
+                serialization.estimate_size(value),
+                len(json.dumps(value, cls=DateTimeJSONEncoder, default=repr))
+            )
+
+    def test_stops_at_limit(self):
+        value = ['a' * 10] * 100
+        self.assertEqual(serialization.estimate_size(value), 1400)
+        self.assertGreater(serialization.estimate_size(value, limit=500), 500)
+        self.assertLess(serialization.estimate_size(value, limit=500), 600)
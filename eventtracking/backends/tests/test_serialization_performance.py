@@ -0,0 +1,69 @@
+"""
+Compares the throughput of the event serializers for events of different sizes.
+"""
+
+from __future__ import absolute_import, print_function
+
+from datetime import datetime
+import json
+import time
+
+from pytz import UTC
+from six.moves import range
+
+from eventtracking.backends import serialization
+from eventtracking.backends.serialization import DateTimeJSONEncoder, get_serializer
+from eventtracking.backends.tests import PerformanceTestCase
+
+PAYLOAD_SIZES = (100, 1000, 10000)
+
+
+class TestSerializationPerformance(PerformanceTestCase):
+    """
+    Serializes the same events with each serializer, and with `json.dumps` as a baseline, and reports the number of
+    events serialized per second.
+    """
+
+    def create_event(self, payload_size):
+        """Build an event that resembles a typical event with a payload of the given size"""
+        now = datetime.now(UTC)
+        return {
+            'name': 'perf.event',
+            'timestamp': now,
+            'context': {
+                'user_id': 10,
+                'course_id': 'course-v1:edX+DemoX+Demo_Course',
+                'host': 'courses.example.com',
+                'path': '/event',
+                'agent': 'Mozilla/5.0 (X11; Linux x86_64)',
+                'received_at': now,
+            },
+            'data': {
+                'sequence': 1,
+                'payload': self.random_payload[:payload_size].ljust(payload_size, 'x'),
+                'current_time': now,
+            }
+        }
+
+    def measure(self, serialize, event):
+        """Return the number of events serialized per second"""
+        start_time = time.time()
+        for _ in range(self.num_events):
+            serialize(event)
+        return self.num_events / (time.time() - start_time)
+
+    def test_serializer_throughput(self):
+        serializers = [get_serializer('json')]
+        if serialization.orjson is not None:
+            serializers.append(get_serializer('orjson'))
+
+        with self.assert_execution_time_less_than_threshold():
+            for payload_size in PAYLOAD_SIZES:
+                event = self.create_event(payload_size)
+                print('')
+                print('Payload Size: {0} bytes'.format(payload_size))
+                baseline = self.measure(lambda event: json.dumps(event, cls=DateTimeJSONEncoder), event)
+                print('  json.dumps: {0:.0f} events per second'.format(baseline))
+                for serializer in serializers:
+                    rate = self.measure(serializer.serialize, event)
+                    print('  {0}: {1:.0f} events per second ({2:.1f}x)'.format(serializer.name, rate, rate / baseline))
@@ -0,0 +1,254 @@
+"""Test the HTTP batch transport"""
+
+from __future__ import absolute_import
+
+import json
+import socket
+import time
+from unittest import TestCase
+
+from mock import patch
+
+from eventtracking.backends.tests import StandInServer
+from eventtracking.backends.transport import BatchTransport, json_lines
+
+
+def record(value):
+    """Serialize a value as a record"""
+    return json.dumps(value).encode('utf-8')
+
+
+class TestBatchTransport(TestCase):
+    """Test the HTTP batch transport against a stand-in server"""
+
+    def setUp(self):
+        super(TestBatchTransport, self).setUp()
+        self.server = StandInServer()
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+
+    def create_transport(self, **kwargs):
+        """Create a transport that sends to the stand-in server, and close it at the end of the test"""
+        kwargs.setdefault('url', self.server.url + 'events')
+        kwargs.setdefault('retry_delay', 0.01)
+        transport = BatchTransport(**kwargs)
+        self.addCleanup(transport.close)
+        return transport
+
+    def test_batch_size(self):
+        transport = self.create_transport(max_batch_size=3)
+        for i in range(7):
+            self.assertTrue(transport.add(record(i)))
+        transport.flush()
+
+        self.assertEqual(self.server.json_bodies(), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(self.server.requests[0].path, '/events')
+        self.assertEqual(self.server.requests[0].headers['Content-Type'], 'application/json')
+        statistics = transport.statistics.snapshot()
+        self.assertEqual(statistics['queued'], 7)
+        self.assertEqual(statistics['delivered'], 7)
+        self.assertEqual(statistics['batches'], 3)
+        self.assertEqual(statistics['requests'], 3)
+
+    def test_batch_bytes(self):
+        transport = self.create_transport(max_batch_bytes=10)
+        for value in ['aaa', 'bbb', 'ccc']:
+            transport.add(record(value))
+        transport.flush()
+
+        self.assertEqual(self.server.json_bodies(), [['aaa', 'bbb'], ['ccc']])
+
+    def test_oversized_record(self):
+        transport = self.create_transport(max_batch_bytes=100, max_record_bytes=5)
+        self.assertFalse(transport.add(record('too large')))
+        self.assertTrue(transport.add(record('ok')))
+        transport.flush()
+
+        self.assertEqual(self.server.json_bodies(), [['ok']])
+        self.assertEqual(transport.statistics.oversized, 1)
+
+    def test_flush_interval(self):
+        transport = self.create_transport(flush_interval=0.05)
+        transport.add(record(1))
+
+        deadline = time.time() + 5
+        while not self.server.requests and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.server.json_bodies(), [[1]])
+
+    def test_queue_full(self):
+        transport = self.create_transport(queue_size=1)
+        with patch.object(transport, 'start_worker'):
+            self.assertTrue(transport.add(record(1)))
+            self.assertFalse(transport.add(record(2)))
+        self.assertEqual(transport.statistics.queued, 1)
+        self.assertEqual(transport.statistics.dropped, 1)
+
+    def test_compress(self):
+        transport = self.create_transport(compress=True)
+        transport.add(record({'name': 'foo'}))
+        transport.flush()
+
+        self.assertEqual(self.server.requests[0].headers['Content-Encoding'], 'gzip')
+        self.assertEqual(self.server.json_bodies(), [[{'name': 'foo'}]])
+
+    def test_json_lines(self):
+        transport = self.create_transport(build_body=json_lines, content_type='application/x-ndjson')
+        transport.add(record(1))
+        transport.add(record(2))
+        transport.flush()
+
+        self.assertEqual(self.server.requests[0].body, b'1\n2\n')
+        self.assertEqual(self.server.requests[0].headers['Content-Type'], 'application/x-ndjson')
+
+    def test_headers(self):
+        transport = self.create_transport(username='key', headers={'X-Source': 'test'})
+        transport.add(record(1))
+        transport.flush()
+
+        headers = self.server.requests[0].headers
+        self.assertEqual(headers['Authorization'], 'Basic a2V5Og==')
+        self.assertEqual(headers['X-Source'], 'test')
+
+    def test_connection_reused(self):
+        transport = self.create_transport()
+        for i in range(3):
+            transport.add(record(i))
+            transport.flush()
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(set(request.client_address for request in self.server.requests)), 1)
+
+    def test_concurrency(self):
+        transport = self.create_transport(max_batch_size=1, concurrency=4)
+        for i in range(20):
+            transport.add(record(i))
+        transport.flush()
+
+        self.assertEqual(sorted(body[0] for body in self.server.json_bodies()), list(range(20)))
+        self.assertEqual(transport.statistics.delivered, 20)
+
+    def test_retry(self):
+        self.server.respond(503)
+        self.server.respond(429, {'Retry-After': '0'})
+        transport = self.create_transport()
+        transport.add(record(1))
+        transport.flush()
+
+        self.assertEqual(self.server.json_bodies(), [[1], [1], [1]])
+        statistics = transport.statistics.snapshot()
+        self.assertEqual(statistics['retries'], 2)
+        self.assertEqual(statistics['delivered'], 1)
+        self.assertEqual(statistics['failed'], 0)
+
+    def test_retries_exhausted(self):
+        for _ in range(3):
+            self.server.respond(500)
+        transport = self.create_transport(max_retries=2)
+        transport.add(record(1))
+        transport.add(record(2))
+        transport.flush()
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(transport.statistics.failed, 2)
+        self.assertEqual(transport.statistics.delivered, 0)
+
+    def test_rejected(self):
+        self.server.respond(400)
+        transport = self.create_transport()
+        transport.add(record(1))
+        transport.flush()
+        transport.add(record(2))
+        transport.flush()
+
+        self.assertEqual(self.server.json_bodies(), [[1], [2]])
+        self.assertEqual(transport.statistics.rejected, 1)
+        self.assertEqual(transport.statistics.retries, 0)
+        self.assertEqual(transport.statistics.delivered, 1)
+
+    def test_connection_error(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        url = 'http://127.0.0.1:{0}/'.format(listener.getsockname()[1])
+        listener.close()
+
+        transport = self.create_transport(url=url, max_retries=1)
+        transport.add(record(1))
+        transport.flush()
+
+        self.assertEqual(transport.statistics.requests, 2)
+        self.assertEqual(transport.statistics.failed, 1)
+
+    def test_unexpected_error(self):
+        def build_body(parts):
+            """Fail to build the body of the first batch"""
+            if parts == [b'1']:
+                raise ValueError('invalid record')
+            return json_lines(parts)
+
+        transport = self.create_transport(build_body=build_body)
+        transport.add(record(1))
+        transport.flush()
+        transport.add(record(2))
+        transport.flush()
+
+        self.assertEqual(self.server.requests[0].body, b'2\n')
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(transport.statistics.failed, 1)
+        self.assertEqual(transport.statistics.delivered, 1)
+        self.assertTrue(transport.worker.is_alive())
+
+    def test_invalid_header(self):
+        transport = self.create_transport(headers={'X-Source': 'line\nbreak'})
+        transport.add(record(1))
+        transport.flush()
+        transport.headers = {'X-Source': 'test'}
+        transport.add(record(2))
+        transport.flush()
+
+        self.assertEqual(self.server.json_bodies(), [[2]])
+        self.assertEqual(transport.statistics.failed, 1)
+
+    def test_close(self):
+        transport = self.create_transport(flush_interval=60)
+        transport.add(record(1))
+        transport.close()
+
+        self.assertEqual(self.server.json_bodies(), [[1]])
+        self.assertIsNone(transport.worker)
+
+    def test_close_timeout(self):
+        for _ in range(1000):
+            self.server.respond(503)
+        transport = self.create_transport(max_batch_size=1, max_retries=1000, close_timeout=0.3)
+        for i in range(3):
+            transport.add(record(i))
+        worker = transport.worker
+
+        started = time.monotonic()
+        transport.close()
+        self.assertLess(time.monotonic() - started, 2)
+        worker.join(5)
+
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(transport.statistics.dropped, 3)
+        self.assertEqual(transport.statistics.delivered, 0)
+
+    def test_flush_without_worker(self):
+        transport = self.create_transport()
+        transport.flush()
+        transport.close()
+        self.assertEqual(self.server.requests, [])
+
+    def test_invalid_url(self):
+        with self.assertRaises(TypeError):
+            BatchTransport()
+        with self.assertRaises(ValueError):
+            BatchTransport(url='ftp://example.com/')
+
+    def test_parse_retry_after(self):
+        transport = self.create_transport()
+        self.assertEqual(transport.parse_retry_after('2'), 2.0)
+        self.assertEqual(transport.parse_retry_after('-1'), 0.0)
+        self.assertIsNone(transport.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'))
+        self.assertIsNone(transport.parse_retry_after(None))
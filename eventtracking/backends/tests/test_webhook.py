@@ -0,0 +1,91 @@
+"""Test the HTTP batch backend"""
+
+from __future__ import absolute_import
+
+from datetime import datetime
+import json
+from unittest import TestCase
+
+from pytz import UTC
+
+from eventtracking import config
+from eventtracking.backends.tests import StandInServer
+from eventtracking.backends.webhook import HttpBatchBackend
+
+
+class TestHttpBatchBackend(TestCase):
+    """Test sending events to a stand-in server"""
+
+    def setUp(self):
+        super(TestHttpBatchBackend, self).setUp()
+        self.server = StandInServer()
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.event = {
+            'name': 'foo',
+            'timestamp': datetime(2013, 10, 3, 8, 24, 55, tzinfo=UTC),
+            'data': {'bar': 1},
+        }
+
+    def create_backend(self, **kwargs):
+        """Create a backend that sends to the stand-in server, and close it at the end of the test"""
+        backend = HttpBatchBackend(url=self.server.url + 'ingest', **kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_ndjson(self):
+        backend = self.create_backend()
+        backend.send(self.event)
+        backend.send(dict(self.event, name='baz'))
+        backend.flush()
+
+        request = self.server.requests[0]
+        self.assertEqual(request.path, '/ingest')
+        self.assertEqual(request.headers['Content-Type'], 'application/x-ndjson')
+        lines = request.body.decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines], ['foo', 'baz'])
+        self.assertEqual(json.loads(lines[0])['timestamp'], '2013-10-03T08:24:55+00:00')
+        self.assertEqual(backend.statistics.delivered, 2)
+
+    def test_json(self):
+        backend = self.create_backend(format='json', compress=True, headers={'Authorization': 'Bearer secret'})
+        backend.send(self.event)
+        backend.flush()
+
+        request = self.server.requests[0]
+        self.assertEqual(request.headers['Content-Type'], 'application/json')
+        self.assertEqual(request.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(request.headers['Authorization'], 'Bearer secret')
+        self.assertEqual([event['name'] for event in self.server.json_bodies()[0]], ['foo'])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            HttpBatchBackend(url=self.server.url, format='xml')
+
+    def test_warm_up(self):
+        backend = self.create_backend()
+        backend.warm_up()
+        self.assertTrue(backend.transport.worker.is_alive())
+
+    def test_configuration(self):
+        backend = config.instantiate_objects({
+            'ENGINE': 'eventtracking.backends.webhook.HttpBatchBackend',
+            'OPTIONS': {
+                'url': self.server.url,
+                'format': 'json',
+                'max_batch_size': 2,
+                'concurrency': 2,
+                'queue_size': 50,
+                'max_retries': 0,
+            }
+        })
+        self.addCleanup(backend.close)
+        for _ in range(3):
+            backend.send(self.event)
+        backend.flush()
+
+        self.assertEqual(backend.transport.max_batch_size, 2)
+        self.assertEqual(backend.transport.concurrency, 2)
+        self.assertEqual(backend.transport.queue.maxsize, 50)
+        self.assertEqual(backend.transport.max_retries, 0)
+        self.assertEqual(sorted(len(body) for body in self.server.json_bodies()), [1, 2])
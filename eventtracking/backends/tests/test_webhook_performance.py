@@ -0,0 +1,65 @@
+"""
+Measures the throughput and latency of the HttpBatchBackend against a local stand-in server.
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+import time
+
+from six.moves import range
+
+from eventtracking.backends.tests import PerformanceTestCase, StandInServer
+from eventtracking.backends.webhook import HttpBatchBackend
+
+
+class TestHttpBatchBackendPerformance(PerformanceTestCase):
+    """
+    Sends a burst of events with several settings, and reports the rate at which they are delivered along with the
+    median, 99th percentile and maximum time between sending an event and the server receiving it.
+    """
+
+    def measure(self, **options):
+        """Return the number of events delivered per second and the latencies of delivery, sorted"""
+        with StandInServer() as server:
+            backend = HttpBatchBackend(url=server.url, queue_size=self.num_events, **options)
+            with self.assert_execution_time_less_than_threshold():
+                start_time = time.time()
+                for i in range(self.num_events):
+                    backend.send({
+                        'name': 'perf.event',
+                        'sent': time.time(),
+                        'data': {
+                            'sequence': i,
+                            'payload': self.random_payload
+                        }
+                    })
+                backend.close()
+                rate = self.num_events / (time.time() - start_time)
+
+        self.assertEqual(backend.statistics.delivered, self.num_events)
+        latencies = sorted(
+            request.time - event['sent'] for request in server.requests for event in self.parse(request.body)
+        )
+        return rate, latencies
+
+    def parse(self, body):
+        """Parse the events in a request body, in either format"""
+        if body.startswith(b'['):
+            return json.loads(body.decode('utf-8'))
+        return [json.loads(line.decode('utf-8')) for line in body.splitlines()]
+
+    def test_throughput(self):
+        settings = [
+            ('ndjson', {}),
+            ('ndjson, gzip', {'compress': True}),
+            ('ndjson, 4 connections', {'concurrency': 4}),
+            ('json array, gzip, 4 connections', {'format': 'json', 'compress': True, 'concurrency': 4}),
+        ]
+        results = [(label, self.measure(**options)) for label, options in settings]
+
+        print('')
+        for label, (rate, latencies) in results:
+            print('{0}: {1:.0f} events per second, latency p50 {2:.3f}s, p99 {3:.3f}s, max {4:.3f}s'.format(
+                label, rate, latencies[len(latencies) // 2], latencies[len(latencies) * 99 // 100], latencies[-1]
+            ))
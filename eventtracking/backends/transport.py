@@ -0,0 +1,490 @@
+"""Deliver batches of serialized events to an HTTP endpoint from background threads."""
+
+from __future__ import absolute_import
+
+import atexit
+import base64
+from collections import deque
+from concurrent.futures import Future
+import gzip
+import logging
+import os
+import random
+import threading
+import time
+
+from six.moves import http_client, queue
+from six.moves.urllib.parse import urlsplit
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = 100
+DEFAULT_MAX_BATCH_BYTES = 500 * 1024
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_DELAY = 0.5
+DEFAULT_MAX_RETRY_DELAY = 30.0
+DEFAULT_CONCURRENCY = 1
+DEFAULT_CLOSE_TIMEOUT = 10.0
+
+# Responses with these statuses are retried, any other error status means the batch was rejected.
+RETRIED_STATUSES = frozenset([408, 429, 500, 502, 503, 504])
+
+
+def json_array(parts):
+    """Build a JSON array from serialized JSON values"""
+    return b'[' + b','.join(parts) + b']'
+
+
+def json_lines(parts):
+    """Build a body of newline delimited JSON from serialized JSON values"""
+    return b''.join(part + b'\n' for part in parts)
+
+
+class TransportStatistics:
+    """
+    Counters that describe the work done by a `BatchTransport`.
+
+    `queued` is the number of records accepted, `dropped` the number rejected because the queue was full or left
+    unsent when closing timed out, and `oversized` the number rejected because they were larger than
+    `max_record_bytes`. `delivered` is the number of
+    records in batches that the endpoint accepted, `rejected` the number in batches it refused with an error status
+    that isn't retried, and `failed` the number in batches that still failed once all retries were exhausted.
+    `requests` and `retries` count HTTP requests. `request_seconds` and `max_request_seconds` are the total and longest
+    time taken by a successful request, and `delivery_seconds` and `max_delivery_seconds` the total and longest time
+    from when the first record of each delivered batch was queued to when it was delivered.
+    """
+
+    COUNTERS = (
+        'queued', 'dropped', 'oversized', 'delivered', 'rejected', 'failed', 'batches', 'requests', 'retries',
+        'request_seconds', 'max_request_seconds', 'delivery_seconds', 'max_delivery_seconds',
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+
+    def add(self, **increments):
+        """Add to counters"""
+        with self.lock:
+            for name, increment in increments.items():
+                setattr(self, name, getattr(self, name) + increment)
+
+    def record_delivery(self, records, request_seconds, delivery_seconds):
+        """Record a batch that was delivered"""
+        with self.lock:
+            self.delivered += records
+            self.batches += 1
+            self.request_seconds += request_seconds
+            self.max_request_seconds = max(self.max_request_seconds, request_seconds)
+            self.delivery_seconds += delivery_seconds
+            self.max_delivery_seconds = max(self.max_delivery_seconds, delivery_seconds)
+
+    def snapshot(self):
+        """Return a dictionary of the current value of each counter"""
+        with self.lock:
+            return {name: getattr(self, name) for name in self.COUNTERS}
+
+
+class TransportError(Exception):
+    """A batch could not be delivered. `retry` is True if trying again may succeed."""
+
+    def __init__(self, message, retry=True, retry_after=None):
+        super(TransportError, self).__init__(message)
+        self.retry = retry
+        self.retry_after = retry_after
+
+
+class SenderPool:
+    """
+    A pool of daemon threads that call a function for each task submitted, returning a `Future` for its result.
+
+    Unlike a `ThreadPoolExecutor`, whose work is waited for when the interpreter exits, before any `atexit` handler
+    runs, a request to an endpoint that is down never holds up the exit of the process beyond `BatchTransport.close`.
+    """
+
+    def __init__(self, max_workers, name):
+        self.tasks = queue.Queue()
+        self.threads = []
+        for number in range(max_workers):
+            thread = threading.Thread(target=self.run, name='{0}-{1}'.format(name, number))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, function, *args):
+        """Call `function` with `args` from one of the threads"""
+        future = Future()
+        self.tasks.put((future, function, args))
+        return future
+
+    def run(self):
+        """Run the submitted tasks until the pool is shut down"""
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            future, function, args = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = function(*args)
+            except BaseException as error:  # pylint: disable=broad-except
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def shutdown(self):
+        """Stop the threads once they have run the tasks already submitted"""
+        for _ in self.threads:
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+class BatchTransport:
+    """
+    Deliver serialized records to an HTTP endpoint in batches, from background threads.
+
+    Records are handed to a background thread through a bounded queue, so the thread that adds them never waits for
+    the network. If the queue is full, the record is dropped. The thread gathers records into batches of up to
+    `max_batch_size` records and `max_batch_bytes` bytes, and hands each batch to a pool of `concurrency` threads
+    that POST them. A batch is also sent once its first record has waited `flush_interval` seconds.
+
+    Each sending thread keeps its connection to the endpoint open between requests. Requests that fail because of a
+    connection error, a timeout, or a status that indicates a temporary problem are retried up to `max_retries`
+    times, waiting an exponentially increasing, randomized delay that honors the "Retry-After" header. Batches that
+    are rejected by the endpoint, or that still fail after the last retry, are logged and discarded.
+
+    The work done is counted in `statistics`, see `TransportStatistics`. Call `flush` to send the queued records and
+    wait for them to be delivered, and `close` to also stop the threads, which is done automatically when the
+    interpreter exits. Closing waits at most `close_timeout` seconds, after which the records that haven't been sent
+    are dropped and no request is retried, so that an endpoint that is down doesn't hold up the exit of the process
+    for longer than that and the request in progress.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Deliver batches of records to an HTTP endpoint.
+
+        `url` is the URL of the endpoint, either http or https.
+        `build_body` is called with a list of records, as bytes, and returns the body of a request. By default, the
+            records are sent as a JSON array, see `json_array`.
+        `content_type` is the type of the body.
+        `headers` is a dictionary of additional headers sent with every request.
+        `username` and `password` are sent using HTTP basic authentication, if either is given.
+        `compress` enables compressing the body of requests with gzip.
+        `max_batch_size` is the maximum number of records in a batch.
+        `max_batch_bytes` is the maximum number of bytes of records in a batch, before compression.
+        `max_record_bytes` is the maximum size of a record, larger records are dropped. By default, it is
+            `max_batch_bytes`.
+        `flush_interval` is the maximum number of seconds that a record waits before being sent.
+        `queue_size` is the maximum number of records waiting to be sent.
+        `timeout` is the number of seconds to wait for the endpoint to respond.
+        `max_retries` is the number of times a failed request is retried.
+        `retry_delay` is the number of seconds before the first retry, doubled for each retry.
+        `max_retry_delay` is the maximum number of seconds before a retry.
+        `concurrency` is the maximum number of requests in progress at a time.
+        `close_timeout` is the maximum number of seconds that closing waits for the queued records to be sent.
+        """
+        self.url = kwargs.get('url')
+        if not self.url:
+            raise TypeError('The BatchTransport must be passed a URL using the "url" parameter')
+        parts = urlsplit(self.url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError('Unsupported URL scheme: {0}'.format(parts.scheme))
+        self.connection_class = http_client.HTTPSConnection if parts.scheme == 'https' else http_client.HTTPConnection
+        self.netloc = parts.netloc
+        self.path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+
+        self.build_body = kwargs.get('build_body', json_array)
+        self.headers = {
+            'Content-Type': kwargs.get('content_type', 'application/json'),
+        }
+        username = kwargs.get('username')
+        password = kwargs.get('password')
+        if username is not None or password is not None:
+            credentials = '{0}:{1}'.format(username or '', password or '').encode('utf-8')
+            self.headers['Authorization'] = 'Basic ' + base64.b64encode(credentials).decode('ascii')
+        self.compress = kwargs.get('compress', False)
+        if self.compress:
+            self.headers['Content-Encoding'] = 'gzip'
+        self.headers.update(kwargs.get('headers', {}))
+
+        self.max_batch_size = kwargs.get('max_batch_size', DEFAULT_MAX_BATCH_SIZE)
+        self.max_batch_bytes = kwargs.get('max_batch_bytes', DEFAULT_MAX_BATCH_BYTES)
+        self.max_record_bytes = min(kwargs.get('max_record_bytes', self.max_batch_bytes), self.max_batch_bytes)
+        self.flush_interval = kwargs.get('flush_interval', DEFAULT_FLUSH_INTERVAL)
+        self.queue_size = kwargs.get('queue_size', DEFAULT_QUEUE_SIZE)
+        self.timeout = kwargs.get('timeout', DEFAULT_TIMEOUT)
+        self.max_retries = kwargs.get('max_retries', DEFAULT_MAX_RETRIES)
+        self.retry_delay = kwargs.get('retry_delay', DEFAULT_RETRY_DELAY)
+        self.max_retry_delay = kwargs.get('max_retry_delay', DEFAULT_MAX_RETRY_DELAY)
+        self.concurrency = kwargs.get('concurrency', DEFAULT_CONCURRENCY)
+        self.close_timeout = kwargs.get('close_timeout', DEFAULT_CLOSE_TIMEOUT)
+
+        self.statistics = TransportStatistics()
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.lock = threading.Lock()
+        self.worker = None
+        self.worker_pid = None
+        # The time after which the records that are left are dropped, once the transport is closing.
+        self.close_deadline = None
+        self.connections = threading.local()
+
+        atexit.register(self.close)
+
+    def add(self, record):
+        """
+        Queue a record, as bytes, to be sent.
+
+        Returns False if the record was dropped, because the queue is full or the record is too large.
+        """
+        if len(record) > self.max_record_bytes:
+            self.statistics.add(oversized=1)
+            return False
+
+        if self.worker_pid != os.getpid():
+            self.start_worker()
+
+        try:
+            self.queue.put_nowait((record, time.monotonic()))
+        except queue.Full:
+            self.statistics.add(dropped=1)
+            return False
+        self.statistics.add(queued=1)
+        return True
+
+    def start_worker(self):
+        """
+        Start the background thread that gathers records into batches, if it isn't already running in this process.
+
+        A process forked from one that was running the thread starts with an empty queue and a thread of its own.
+        """
+        with self.lock:
+            if self.worker_pid == os.getpid():
+                return
+
+            if self.worker_pid is not None:
+                self.queue = queue.Queue(maxsize=self.queue_size)
+                self.connections = threading.local()
+            self.worker_pid = os.getpid()
+            self.close_deadline = None
+
+            self.worker = threading.Thread(
+                target=self.gather_batches, args=(self.queue,), name='eventtracking-http-batcher'
+            )
+            self.worker.daemon = True
+            self.worker.start()
+
+    def gather_batches(self, records):
+        """
+        Gather the records in the queue `records` into batches and hand them to the senders until the transport is
+        closed.
+
+        The queue is passed in, rather than read from the transport, since a worker that is still sending when `close`
+        times out keeps its queue, while the transport is given a new one.
+        """
+        pool = SenderPool(self.concurrency, 'eventtracking-http-sender')
+        # The batches being sent, oldest first.
+        pending = deque()
+        batch = []
+        batch_bytes = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = records.get(timeout=timeout)
+            except queue.Empty:
+                # The oldest record has waited long enough.
+                self.submit(pool, pending, batch)
+                batch, batch_bytes, deadline = [], 0, None
+                continue
+
+            if item is None:
+                break
+
+            if isinstance(item, threading.Event):
+                self.submit(pool, pending, batch)
+                batch, batch_bytes, deadline = [], 0, None
+                self.wait_for(pending, 0)
+                item.set()
+                continue
+
+            if self.abandoned():
+                self.statistics.add(dropped=len(batch) + 1)
+                batch, batch_bytes, deadline = [], 0, None
+                continue
+
+            if batch and batch_bytes + len(item[0]) > self.max_batch_bytes:
+                self.submit(pool, pending, batch)
+                batch, batch_bytes, deadline = [], 0, None
+
+            if not batch:
+                deadline = time.monotonic() + self.flush_interval
+            batch.append(item)
+            batch_bytes += len(item[0])
+            if len(batch) >= self.max_batch_size:
+                self.submit(pool, pending, batch)
+                batch, batch_bytes, deadline = [], 0, None
+
+        self.submit(pool, pending, batch)
+        self.wait_for(pending, 0)
+        pool.shutdown()
+
+    def abandoned(self):
+        """True if the transport is closing and has run out of time to send the records that are left"""
+        close_deadline = self.close_deadline
+        return close_deadline is not None and time.monotonic() >= close_deadline
+
+    def submit(self, pool, pending, batch):
+        """Hand a batch to the senders, waiting for a sender to be free if they are all busy"""
+        if batch:
+            # Waiting here leaves the records in the queue, which is bounded, rather than in an unbounded backlog.
+            self.wait_for(pending, self.concurrency - 1)
+            pending.append(pool.submit(self.send_batch, batch))
+
+    def wait_for(self, pending, remaining):
+        """Wait until no more than `remaining` batches are being sent"""
+        while len(pending) > remaining:
+            oldest = pending[0]
+            oldest.result()
+            pending.popleft()
+        # Forget the batches that have been sent, out of order.
+        for future in list(pending):
+            if future.done():
+                pending.remove(future)
+
+    def send_batch(self, batch):
+        """
+        Send a batch of `(record, time queued)` tuples, retrying if necessary, and record the outcome.
+
+        Unexpected errors, such as a body that can't be built or a header that the HTTP client refuses, are logged and
+        count the batch as failed, so that the batches that follow are still sent.
+        """
+        try:
+            self.deliver(batch)
+        except Exception:  # pylint: disable=broad-except
+            LOG.exception('Error sending a batch of %d events to %s', len(batch), self.url)
+            # The request may have been interrupted part way through.
+            self.close_connection()
+            self.statistics.add(failed=len(batch))
+
+    def deliver(self, batch):
+        """Send a batch, retrying if necessary, and record the outcome, see `send_batch`"""
+        body = self.build_body([record for record, _ in batch])
+        if self.compress:
+            body = gzip.compress(body)
+
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            if self.abandoned():
+                self.statistics.add(dropped=len(batch))
+                return
+            if attempt > 0:
+                self.statistics.add(retries=1)
+
+            started = time.monotonic()
+            try:
+                self.post(body)
+            except TransportError as error:
+                if not error.retry:
+                    LOG.error('Batch of %d events rejected by %s: %s', len(batch), self.url, error)
+                    self.statistics.add(rejected=len(batch))
+                    return
+                if attempt == self.max_retries:
+                    LOG.error('Failed to send a batch of %d events to %s: %s', len(batch), self.url, error)
+                    self.statistics.add(failed=len(batch))
+                    return
+
+                wait = error.retry_after if error.retry_after is not None else delay * random.uniform(0.5, 1.0)
+                wait = min(wait, self.max_retry_delay)
+                close_deadline = self.close_deadline
+                if close_deadline is not None:
+                    wait = min(wait, max(close_deadline - time.monotonic(), 0))
+                time.sleep(wait)
+                delay *= 2
+                continue
+
+            finished = time.monotonic()
+            self.statistics.record_delivery(len(batch), finished - started, finished - batch[0][1])
+            return
+
+    def post(self, body):
+        """POST a body to the endpoint, reusing this thread's connection. Raises `TransportError` if it fails."""
+        connection = getattr(self.connections, 'connection', None)
+        if connection is None:
+            connection = self.connections.connection = self.connection_class(self.netloc, timeout=self.timeout)
+
+        self.statistics.add(requests=1)
+        try:
+            connection.request('POST', self.path, body=body, headers=self.headers)
+            response = connection.getresponse()
+            # The response must be read completely before the connection can be reused.
+            content = response.read()
+        except (http_client.HTTPException, OSError) as error:
+            self.close_connection()
+            raise TransportError('{0}: {1}'.format(error.__class__.__name__, error))
+
+        if response.getheader('Connection', '').lower() == 'close':
+            self.close_connection()
+
+        if response.status < 300:
+            return
+        message = 'HTTP {0}: {1}'.format(response.status, content[:200].decode('utf-8', 'replace'))
+        if response.status in RETRIED_STATUSES:
+            raise TransportError(message, retry_after=self.parse_retry_after(response.getheader('Retry-After')))
+        raise TransportError(message, retry=False)
+
+    def close_connection(self):
+        """Close this thread's connection, if it has one, so that the next request opens a new one"""
+        connection = getattr(self.connections, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.connections.connection = None
+
+    def parse_retry_after(self, value):
+        """Parse the number of seconds in a "Retry-After" header, returning None if it isn't a number"""
+        try:
+            return max(float(value), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+    def flush(self):
+        """Send all of the queued records and wait until they have been delivered, or have failed"""
+        if self.worker_pid != os.getpid():
+            return
+
+        flushed = threading.Event()
+        self.queue.put(flushed)
+        flushed.wait()
+
+    def close(self):
+        """
+        Send the queued records and stop the background threads.
+
+        Waits at most `close_timeout` seconds, after which the records that haven't been sent are dropped.
+        """
+        with self.lock:
+            if self.worker_pid != os.getpid():
+                return
+            worker = self.worker
+            self.worker = None
+            self.worker_pid = None
+            deadline = self.close_deadline = time.monotonic() + self.close_timeout
+            # Sent while holding the lock, so that it is received by this worker rather than one started later.
+            try:
+                self.queue.put(None, timeout=self.close_timeout)
+            except queue.Full:
+                pass
+
+        worker.join(max(deadline - time.monotonic(), 0))
+        if worker.is_alive():
+            LOG.error('Timed out sending the queued records to %s', self.url)
+            with self.lock:
+                # A worker started later must not share the queue of this one, which may still be sending.
+                if self.worker_pid is None:
+                    self.queue = queue.Queue(maxsize=self.queue_size)
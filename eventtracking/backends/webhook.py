@@ -0,0 +1,87 @@
+"""Event tracking backend that sends batches of events to an HTTP endpoint"""
+
+from __future__ import absolute_import
+
+from eventtracking.backends.serialization import get_serializer
+from eventtracking.backends.transport import BatchTransport, json_array, json_lines
+
+FORMATS = {
+    'ndjson': (json_lines, 'application/x-ndjson'),
+    'json': (json_array, 'application/json'),
+}
+
+# Options that are passed to the `BatchTransport`.
+TRANSPORT_OPTIONS = (
+    'url', 'headers', 'username', 'password', 'compress', 'max_batch_size', 'max_batch_bytes', 'max_record_bytes',
+    'flush_interval', 'queue_size', 'timeout', 'max_retries', 'retry_delay', 'max_retry_delay', 'concurrency',
+    'close_timeout',
+)
+
+
+class HttpBatchBackend:
+    """
+    POST batches of events to an HTTP endpoint, such as an internal ingestion service.
+
+    Events are serialized when they are sent, and then queued and delivered from background threads by a
+    `BatchTransport`, which keeps a connection open for each concurrent request. Each request contains a batch of
+    events, either as newline delimited JSON or as a JSON array. For example::
+
+        EVENT_TRACKING_BACKENDS = {
+            'ingestion': {
+                'ENGINE': 'eventtracking.backends.webhook.HttpBatchBackend',
+                'OPTIONS': {
+                    'url': 'https://ingest.example.com/v1/events',
+                    'headers': {'Authorization': 'Bearer secret'},
+                    'compress': True,
+                    'concurrency': 4,
+                },
+            },
+        }
+
+    If the endpoint is slower than events are emitted, at most `queue_size` events are kept, and the rest are dropped
+    and counted in `statistics`.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        POST batches of events to an HTTP endpoint.
+
+        `url` is the URL of the endpoint.
+        `format` is either "ndjson", to send newline delimited JSON, or "json", to send a JSON array of events.
+        `serializer` is the name of the serializer used to convert events to JSON, see
+            `eventtracking.backends.serialization.get_serializer`.
+
+        The `headers`, `username`, `password`, `compress`, `max_batch_size`, `max_batch_bytes`, `max_record_bytes`,
+        `flush_interval`, `queue_size`, `timeout`, `max_retries`, `retry_delay`, `max_retry_delay`, `concurrency` and
+        `close_timeout` parameters configure the transport, see `BatchTransport`.
+        """
+        body_format = kwargs.get('format', 'ndjson')
+        try:
+            build_body, content_type = FORMATS[body_format]
+        except KeyError:
+            raise ValueError('Unknown format: {0}'.format(body_format))
+
+        self.serializer = get_serializer(kwargs.get('serializer'))
+        options = {name: kwargs[name] for name in TRANSPORT_OPTIONS if name in kwargs}
+        self.transport = BatchTransport(build_body=build_body, content_type=content_type, **options)
+
+    @property
+    def statistics(self):
+        """The statistics of the transport, see `TransportStatistics`"""
+        return self.transport.statistics
+
+    def warm_up(self):
+        """Start the background thread, so that the first event doesn't wait for it"""
+        self.transport.start_worker()
+
+    def send(self, event):
+        """Queue the event to be sent"""
+        self.transport.add(self.serializer.serialize(event).encode('utf-8'))
+
+    def flush(self):
+        """Wait until the queued events have been sent"""
+        self.transport.flush()
+
+    def close(self):
+        """Send the queued events and stop the background threads"""
+        self.transport.close()
@@ -2,31 +2,42 @@
 
 from __future__ import absolute_import
 
-from importlib import import_module
-
 from django.conf import settings
 
+from eventtracking import config as configuration
 from eventtracking import tracker
 from eventtracking.tracker import Tracker
 from eventtracking.locator import ThreadLocalContextLocator
-import six  # pylint: disable=wrong-import-order
 
 
 DJANGO_BACKEND_SETTING_NAME = 'EVENT_TRACKING_BACKENDS'
 DJANGO_PROCESSOR_SETTING_NAME = 'EVENT_TRACKING_PROCESSORS'
 DJANGO_ENABLED_SETTING_NAME = 'EVENT_TRACKING_ENABLED'
+DJANGO_ID_FIELD_SETTING_NAME = 'EVENT_TRACKING_ID_FIELD'
+DJANGO_REORDER_FILTERS_SETTING_NAME = 'EVENT_TRACKING_REORDER_FILTERS'
 
 
 class DjangoTracker(Tracker):
     """
     A `eventtracking.tracker.Tracker` that constructs its backends from
     Django settings.
+
+    The optional "EVENT_TRACKING_ID_FIELD" setting is the field that a unique,
+    time-sortable id is assigned to in each event.
+
+    The optional "EVENT_TRACKING_REORDER_FILTERS" setting enables adaptive
+    ordering of the processors in "EVENT_TRACKING_PROCESSORS" that are pure
+    filters, see `eventtracking.backends.routing.RoutingBackend`.
     """
 
     def __init__(self):
         backends = self.create_backends_from_settings()
         processors = self.create_processors_from_settings()
-        super(DjangoTracker, self).__init__(backends, ThreadLocalContextLocator(), processors)
+        id_field = getattr(settings, DJANGO_ID_FIELD_SETTING_NAME, None)
+        reorder_filters = getattr(settings, DJANGO_REORDER_FILTERS_SETTING_NAME, False)
+        super(DjangoTracker, self).__init__(
+            backends, ThreadLocalContextLocator(), processors, id_field=id_field, reorder_filters=reorder_filters
+        )
 
     def create_backends_from_settings(self):
         """
@@ -58,89 +69,19 @@ class DjangoTracker(Tracker):
 
     def instantiate_objects(self, node):
         """
-        Recursively traverse a structure to identify dictionaries that represent objects that need to be instantiated
-
-        Traverse all values of all dictionaries and all elements of all lists to identify dictionaries that contain the
-        special "ENGINE" key which indicates that a class of that type should be instantiated and passed all key-value
-        pairs found in the sibling "OPTIONS" dictionary as keyword arguments.
-
-        For example::
-
-            tree = {
-                'a': {
-                    'b': {
-                        'first_obj': {
-                            'ENGINE': 'mypackage.mymodule.Clazz',
-                            'OPTIONS': {
-                                'size': 10,
-                                'foo': 'bar'
-                            }
-                        }
-                    },
-                    'c': [
-                        {
-                            'ENGINE': 'mypackage.mymodule.Clazz2',
-                            'OPTIONS': {
-                                'more_objects': {
-                                    'd': {'ENGINE': 'mypackage.foo.Bar'}
-                                }
-                            }
-                        }
-                    ]
-                }
-            }
-            root = self.instantiate_objects(tree)
-
-        That structure of dicts, lists, and strings will end up with (this example assumes that all keyword arguments to
-        constructors were saved as attributes of the same name):
+        Recursively instantiate the objects described by a structure of dictionaries and lists.
 
-        assert type(root['a']['b']['first_obj']) == <type 'mypackage.mymodule.Clazz'>
-        assert root['a']['b']['first_obj'].size == 10
-        assert root['a']['b']['first_obj'].foo == 'bar'
-        assert type(root['a']['c'][0]) == <type 'mypackage.mymodule.Clazz2'>
-        assert type(root['a']['c'][0].more_objects['d']) == <type 'mypackage.foo.Bar'>
+        See `eventtracking.config.instantiate_objects`.
         """
-        result = node
-        if isinstance(node, dict):
-            if 'ENGINE' in node:
-                result = self.instantiate_from_dict(node)
-            else:
-                result = {}
-                for key, value in six.iteritems(node):
-                    result[key] = self.instantiate_objects(value)
-        elif isinstance(node, list):
-            result = []
-            for child in node:
-                result.append(self.instantiate_objects(child))
-
-        return result
+        return configuration.instantiate_objects(node)
 
     def instantiate_from_dict(self, values):
         """
-        Constructs an object given a dictionary containing an "ENGINE" key
-        which contains the full module path to the class, and an "OPTIONS"
-        key which contains a dictionary that will be passed in to the
-        constructor as keyword args.
-        """
+        Construct an object from a dictionary containing "ENGINE" and "OPTIONS" keys.
 
-        name = values['ENGINE']
-        options = values.get('OPTIONS', {})
-
-        # Parse the name
-        parts = name.split('.')
-        module_name = '.'.join(parts[:-1])
-        class_name = parts[-1]
-
-        # Get the class
-        try:
-            module = import_module(module_name)
-            cls = getattr(module, class_name)
-        except (ValueError, AttributeError, TypeError, ImportError):
-            raise ValueError('Cannot find class %s' % name)
-
-        options = self.instantiate_objects(options)
-
-        return cls(**options)
+        See `eventtracking.config.instantiate_from_dict`.
+        """
+        return configuration.instantiate_from_dict(values)
 
     def create_processors_from_settings(self):
         """
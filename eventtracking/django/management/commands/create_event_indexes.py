@@ -0,0 +1,49 @@
+"""
+Create the indexes used by the backends of a tracker.
+
+Backends such as `eventtracking.backends.mongodb.MongoBackend` can be configured not to create their indexes when they
+first connect, with the `create_indexes` option set to False, so that the indexes are only created when this command is
+run, for example during a deployment.
+"""
+
+from __future__ import absolute_import
+
+from django.core.management.base import BaseCommand, CommandError
+
+import six
+
+from eventtracking import tracker
+
+
+def find_backends(backends, prefix=''):
+    """Yield the name and backend of each backend of a routing tree, including the backends of nested routers"""
+    for name, backend in six.iteritems(backends):
+        name = prefix + name
+        yield name, backend
+        nested = getattr(backend, 'backends', None)
+        if isinstance(nested, dict):
+            for nested_name, nested_backend in find_backends(nested, prefix=name + '.'):
+                yield nested_name, nested_backend
+
+
+class Command(BaseCommand):
+    """Create the indexes used by the backends of a tracker"""
+
+    help = 'Create the indexes used by the event tracking backends.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tracker', default=tracker.DEFAULT_TRACKER_NAME, help='name of the tracker whose backends are indexed',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            event_tracker = tracker.get_tracker(options['tracker'])
+        except KeyError:
+            raise CommandError('No tracker named {0} is registered'.format(options['tracker']))
+
+        for name, backend in find_backends(event_tracker.backends):
+            create_indexes = getattr(backend, 'create_indexes', None)
+            if callable(create_indexes):
+                create_indexes()
+                self.stdout.write('Created the indexes of backend {0}'.format(name))
@@ -0,0 +1,157 @@
+"""
+Export stored events as JSON lines.
+
+The events are read from a backend of a tracker that supports queries, such as
+`eventtracking.backends.mongodb.MongoBackend`, see its `find_events` method. For example::
+
+    python manage.py export_events --name edx.course.enrollment.activated --start 2013-01-01 --end 2013-01-02 \\
+        --context user_id=10 --output enrollments.jsonl
+"""
+
+from __future__ import absolute_import
+
+import base64
+from datetime import timedelta
+import io
+import json
+import uuid
+
+from bson.decimal128 import Decimal128
+from bson.dbref import DBRef
+from bson.objectid import ObjectId
+from bson.regex import Regex
+from bson.timestamp import Timestamp
+from django.core.management.base import BaseCommand, CommandError
+
+from eventtracking import tracker
+from eventtracking.backends.index import EPOCH, parse_timestamp
+from eventtracking.backends.serialization import DateTimeJSONEncoder, encode_datetime
+from eventtracking.django.management.commands.create_event_indexes import find_backends
+
+
+def parse_time(value):
+    """Parse a date, or a date and time in ISO 8601 format, into a datetime in UTC"""
+    if len(value) == 10:
+        value += 'T00:00:00'
+    microseconds = parse_timestamp(value)
+    if microseconds is None:
+        raise CommandError('Invalid date or time: {0}'.format(value))
+    return EPOCH + timedelta(microseconds=microseconds)
+
+
+def parse_context(values):
+    """Parse a list of "field=value" strings, where values are JSON if possible and strings otherwise"""
+    context = {}
+    for item in values:
+        field, separator, value = item.partition('=')
+        if not separator:
+            raise CommandError('Invalid context field, expected field=value: {0}'.format(item))
+        try:
+            context[field] = json.loads(value)
+        except ValueError:
+            context[field] = value
+    return context
+
+
+def encode_bson(obj):
+    """
+    Serialize the BSON types that stored events may contain, such as the `ObjectId` of their _id.
+
+    Binary data is encoded as base64. Raises a `TypeError` if the object isn't one of these types.
+    """
+    if isinstance(obj, (ObjectId, Decimal128, uuid.UUID)):
+        return str(obj)
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode('ascii')
+    if isinstance(obj, Timestamp):
+        return encode_datetime(obj.as_datetime())
+    if isinstance(obj, Regex):
+        return obj.pattern
+    if isinstance(obj, DBRef):
+        return obj.as_doc().to_dict()
+    raise TypeError('Object of type {0} is not JSON serializable'.format(obj.__class__.__name__))
+
+
+class EventJSONEncoder(DateTimeJSONEncoder):
+    """JSON encoder aware of dates and times, and of the BSON types of stored events, see `encode_bson`"""
+
+    def default(self, obj):  # lint-amnesty, pylint: disable=arguments-differ, method-hidden
+        """Serialize dates, times and BSON types"""
+        try:
+            return encode_bson(obj)
+        except TypeError:
+            return super(EventJSONEncoder, self).default(obj)
+
+
+class Command(BaseCommand):
+    """Export stored events as JSON lines"""
+
+    help = 'Export the events stored by an event tracking backend as JSON lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tracker', default=tracker.DEFAULT_TRACKER_NAME, help='name of the tracker whose backend is queried',
+        )
+        parser.add_argument(
+            '--backend', help='name of the backend to query, nested backends are named "router.backend", by default '
+            'the first backend that supports queries',
+        )
+        parser.add_argument('--name', help='name of the events')
+        parser.add_argument('--start', help='earliest date or time of the events, in ISO 8601 format')
+        parser.add_argument('--end', help='date or time before which the events happened, in ISO 8601 format')
+        parser.add_argument(
+            '--context', action='append', default=[], metavar='FIELD=VALUE',
+            help='value of a field of the context of the events, may be repeated',
+        )
+        parser.add_argument('--fields', help='comma separated list of the fields to export')
+        parser.add_argument('--batch-size', type=int, help='number of events fetched at a time')
+        parser.add_argument('--output', help='file the events are written to, standard output by default')
+
+    def handle(self, *args, **options):
+        backend = self.find_backend(options['tracker'], options['backend'])
+
+        query = {
+            'name': options['name'],
+            'start': parse_time(options['start']) if options['start'] else None,
+            'end': parse_time(options['end']) if options['end'] else None,
+            'context': parse_context(options['context']),
+        }
+        if options['fields']:
+            query['fields'] = [field.strip() for field in options['fields'].split(',') if field.strip()]
+        if options['batch_size']:
+            query['batch_size'] = options['batch_size']
+
+        if options['output']:
+            with io.open(options['output'], 'w', encoding='utf-8') as output:
+                count = self.export(backend.find_events(**query), output)
+        else:
+            count = self.export(backend.find_events(**query), self.stdout)
+        self.stderr.write('Exported {0} events'.format(count))
+
+    def find_backend(self, tracker_name, backend_name):
+        """Find the backend to query"""
+        try:
+            event_tracker = tracker.get_tracker(tracker_name)
+        except KeyError:
+            raise CommandError('No tracker named {0} is registered'.format(tracker_name))
+
+        for name, backend in find_backends(event_tracker.backends):
+            if backend_name is not None and name != backend_name:
+                continue
+            if callable(getattr(backend, 'find_events', None)):
+                return backend
+            if backend_name is not None:
+                raise CommandError('Backend {0} does not support queries'.format(backend_name))
+
+        if backend_name is not None:
+            raise CommandError('No backend named {0} is configured'.format(backend_name))
+        raise CommandError('No backend that supports queries is configured')
+
+    def export(self, events, output):
+        """Write each event to `output` as a line of JSON, and return the number of events written"""
+        encoder = EventJSONEncoder()
+        count = 0
+        for event in events:
+            output.write(encoder.encode(event) + '\n')
+            count += 1
+        return count
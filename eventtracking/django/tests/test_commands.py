@@ -0,0 +1,225 @@
+"""Test the management commands of the django tracker"""
+
+from __future__ import absolute_import
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from bson.binary import Binary
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+from bson.timestamp import Timestamp
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from mock import MagicMock, patch
+from pytz import UTC
+from six import StringIO
+
+from eventtracking import tracker
+from eventtracking.backends.mongodb import ClientRegistry, MongoBackend
+from eventtracking.backends.routing import RoutingBackend
+from eventtracking.django.management.commands import create_event_indexes, export_events
+
+TEST_TRACKER_NAME = 'django.test.indexes'
+
+
+class TestCreateEventIndexes(TestCase):
+    """Test the create_event_indexes command"""
+
+    def setUp(self):
+        super(TestCreateEventIndexes, self).setUp()
+        self.backend = MagicMock()
+        self.nested_backend = MagicMock()
+        tracker.register_tracker(tracker.Tracker({
+            'mongo': self.backend,
+            'logger': MagicMock(spec=['send']),
+            'router': RoutingBackend(backends={'mongo': self.nested_backend}),
+        }), TEST_TRACKER_NAME)
+        self.addCleanup(tracker.TRACKERS.pop, TEST_TRACKER_NAME)
+
+    def test_create_indexes(self):
+        stdout = StringIO()
+        call_command(create_event_indexes.Command(), tracker=TEST_TRACKER_NAME, stdout=stdout)
+
+        self.backend.create_indexes.assert_called_once_with()
+        self.nested_backend.create_indexes.assert_called_once_with()
+        self.assertEqual(stdout.getvalue().splitlines(), [
+            'Created the indexes of backend mongo',
+            'Created the indexes of backend router.mongo',
+        ])
+
+    def test_missing_tracker(self):
+        with self.assertRaises(CommandError):
+            call_command(create_event_indexes.Command(), tracker='missing')
+
+
+class QueryableBackend:
+    """A backend that returns the given events from queries, and records them"""
+
+    def __init__(self, events):
+        self.events = events
+        self.queries = []
+
+    def send(self, event):
+        """Ignore the event"""
+
+    def find_events(self, **kwargs):
+        """Record the query and return the events"""
+        self.queries.append(kwargs)
+        return iter(self.events)
+
+
+class TestExportEvents(TestCase):
+    """Test the export_events command"""
+
+    def setUp(self):
+        super(TestExportEvents, self).setUp()
+        self.events = [
+            {'_id': ObjectId('5f0c5a1e9d1e8a3b4c5d6e7f'), 'name': 'a', 'time': datetime(2013, 1, 1, tzinfo=UTC)},
+            {'name': 'b'},
+        ]
+        self.backend = QueryableBackend(self.events)
+        self.other_backend = QueryableBackend([])
+        tracker.register_tracker(tracker.Tracker({
+            'logger': MagicMock(spec=['send']),
+            'mongo': self.backend,
+            'router': RoutingBackend(backends={'mongo': self.other_backend}),
+        }), TEST_TRACKER_NAME)
+        self.addCleanup(tracker.TRACKERS.pop, TEST_TRACKER_NAME)
+
+    def export(self, *args, **kwargs):
+        """Run the command and return what it wrote to standard output"""
+        stdout = StringIO()
+        call_command(export_events.Command(), *args, tracker=TEST_TRACKER_NAME, stdout=stdout, stderr=StringIO(),
+                     **kwargs)
+        return stdout.getvalue()
+
+    def test_export(self):
+        output = self.export(
+            '--name', 'a', '--start', '2013-01-01', '--end', '2013-01-02T12:00:00+01:00',
+            '--context', 'user_id=10', '--context', 'course_id=course-v1:a+b+c', '--fields', 'name, time',
+            '--batch-size', '10',
+        )
+
+        self.assertEqual([json.loads(line) for line in output.splitlines()], [
+            {'_id': '5f0c5a1e9d1e8a3b4c5d6e7f', 'name': 'a', 'time': '2013-01-01T00:00:00+00:00'},
+            {'name': 'b'},
+        ])
+        self.assertEqual(self.backend.queries, [{
+            'name': 'a',
+            'start': datetime(2013, 1, 1, tzinfo=UTC),
+            'end': datetime(2013, 1, 2, 11, tzinfo=UTC),
+            'context': {'user_id': 10, 'course_id': 'course-v1:a+b+c'},
+            'fields': ['name', 'time'],
+            'batch_size': 10,
+        }])
+
+    def test_output_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'events.jsonl')
+
+        self.assertEqual(self.export('--output', path), '')
+
+        with open(path) as output:
+            self.assertEqual(len(output.readlines()), 2)
+
+    def test_nested_backend(self):
+        self.assertEqual(self.export('--backend', 'router.mongo'), '')
+        self.assertEqual(len(self.other_backend.queries), 1)
+
+    def test_invalid_arguments(self):
+        for args in (
+                ['--backend', 'missing'],
+                ['--backend', 'logger'],
+                ['--start', 'yesterday'],
+                ['--context', 'user_id'],
+        ):
+            with self.assertRaises(CommandError):
+                self.export(*args)
+
+    def test_no_queryable_backend(self):
+        tracker.register_tracker(tracker.Tracker({'logger': MagicMock(spec=['send'])}), TEST_TRACKER_NAME)
+        with self.assertRaises(CommandError):
+            self.export()
+
+    def test_bson_types(self):
+        self.backend.events = [{
+            'name': 'a',
+            'data': {
+                'id': ObjectId('5f0c5a1e9d1e8a3b4c5d6e7f'),
+                'amount': Decimal128(Decimal('1.50')),
+                'payload': Binary(b'abc'),
+                'at': Timestamp(1356998400, 1),
+            },
+        }]
+
+        self.assertEqual(json.loads(self.export()), {
+            'name': 'a',
+            'data': {
+                'id': '5f0c5a1e9d1e8a3b4c5d6e7f',
+                'amount': '1.50',
+                'payload': 'YWJj',
+                'at': '2013-01-01T00:00:00+00:00',
+            },
+        })
+
+    def test_unsupported_type(self):
+        self.backend.events = [{'name': 'a', 'data': object()}]
+        with self.assertRaises(TypeError):
+            self.export()
+
+
+def in_range(document, query):
+    """Whether a document matches the ranges of time of a query, which is all that is queried here"""
+    for field, bounds in query.items():
+        value = document.get(field)
+        if value is None or not bounds['$gte'] <= value < bounds['$lt']:
+            return False
+    return True
+
+
+class TestExportTrackedEvents(TestCase):
+    """Test exporting the events emitted by a tracker to a MongoDB backend"""
+
+    def setUp(self):
+        super(TestExportTrackedEvents, self).setUp()
+        mongo_patcher = patch('eventtracking.backends.mongodb.MongoClient')
+        self.addCleanup(mongo_patcher.stop)
+        mongo_patcher.start()
+        registry_patcher = patch('eventtracking.backends.mongodb.CLIENTS', ClientRegistry())
+        self.addCleanup(registry_patcher.stop)
+        registry_patcher.start()
+
+        self.backend = MongoBackend(batch_size=1, create_indexes=False)
+        self.documents = []
+        collection = self.backend.collection
+        collection.insert_many.side_effect = lambda documents, **kwargs: self.documents.extend(documents)
+        collection.find.side_effect = lambda query, **kwargs: MagicMock(**{
+            '__iter__.return_value': iter([document for document in self.documents if in_range(document, query)]),
+        })
+        tracker.register_tracker(tracker.Tracker({'mongo': self.backend}), TEST_TRACKER_NAME)
+        self.addCleanup(tracker.TRACKERS.pop, TEST_TRACKER_NAME)
+
+    def export(self, *args):
+        """Run the command and return the events it exported"""
+        stdout = StringIO()
+        call_command(export_events.Command(), *args, tracker=TEST_TRACKER_NAME, stdout=stdout, stderr=StringIO())
+        return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_export_between(self):
+        tracker.get_tracker(TEST_TRACKER_NAME).emit('a', {'value': 1})
+        today = datetime.now(UTC).date()
+
+        events = self.export(
+            '--start', (today - timedelta(days=1)).isoformat(), '--end', (today + timedelta(days=2)).isoformat(),
+        )
+        earlier = self.export('--start', '2013-01-01', '--end', '2013-01-02')
+
+        self.assertEqual([(event['name'], event['data']) for event in events], [('a', {'value': 1})])
+        self.assertEqual(earlier, [])
@@ -32,6 +32,24 @@ class TestConfiguration(TestCase):
         fake_backend = self.tracker.get_backend('fake')
         self.assertTrue(isinstance(fake_backend, TrivialFakeBackend))
 
+    @override_settings(EVENT_TRACKING_ID_FIELD='id')
+    def test_id_field(self):
+        self.configure_tracker()
+        self.assertEqual(self.tracker.id_field, 'id')
+
+    def test_no_id_field(self):
+        self.configure_tracker()
+        self.assertIsNone(self.tracker.id_field)
+
+    @override_settings(EVENT_TRACKING_REORDER_FILTERS=True)
+    def test_reorder_filters(self):
+        self.configure_tracker()
+        self.assertTrue(self.tracker.routing_backend.reorder_filters)
+
+    def test_no_reorder_filters(self):
+        self.configure_tracker()
+        self.assertFalse(self.tracker.routing_backend.reorder_filters)
+
     def configure_tracker(self):
         """Reads the tracker configuration from the Django settings"""
         self.tracker = django.DjangoTracker()
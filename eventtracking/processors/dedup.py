@@ -0,0 +1,144 @@
+"""Drop events that are repeats of events that were recently seen"""
+
+from __future__ import absolute_import
+
+import hashlib
+import json
+import math
+import struct
+import threading
+import time
+
+from eventtracking.processors.exceptions import EventEmissionExit
+from eventtracking.processors.fields import compile_field_path
+
+DEFAULT_FIELDS = ('name', 'context.user_id', 'data')
+DEFAULT_WINDOW_SECONDS = 60
+DEFAULT_CAPACITY = 100000
+DEFAULT_ERROR_RATE = 0.001
+
+
+class BloomFilter:
+    """
+    A fixed size set of fingerprints that may report false positives, but never false negatives.
+
+    `capacity` is the number of fingerprints that can be added before the false positive rate exceeds `error_rate`.
+
+    Fingerprints are passed as a pair of 64 bit integers which are combined to derive the position of each bit.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / float(capacity) * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def positions(self, first_hash, second_hash):
+        """Yield the index of every bit that represents the fingerprint"""
+        for i in range(self.num_hashes):
+            yield (first_hash + i * second_hash) % self.num_bits
+
+    def __contains__(self, fingerprint):
+        bits = self.bits
+        for position in self.positions(*fingerprint):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, fingerprint):
+        """Add the fingerprint to the set"""
+        bits = self.bits
+        for position in self.positions(*fingerprint):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def clear(self):
+        """Remove all fingerprints from the set"""
+        self.bits[:] = bytearray(len(self.bits))
+
+    @property
+    def false_positive_rate(self):
+        """Estimate the probability that a fingerprint that was never added is reported as present"""
+        bits_set = bin(int.from_bytes(bytes(self.bits), 'little')).count('1')
+        return (bits_set / float(self.num_bits)) ** self.num_hashes
+
+
+class DeduplicationProcessor:
+    """
+
+    Drop events that are repeats of events that were seen within a time window.
+
+    A fingerprint is computed from the configured fields of each event and checked against two rotating bloom filters:
+    the filter for the current window and the filter for the previous window. Every `window` seconds the previous
+    filter is cleared and becomes the current one. Memory usage is therefore fixed, regardless of event volume, and
+    each event costs a constant amount of work. A repeat is always detected if it arrives within `window` seconds of
+    the original, and may be detected up to twice that long after it.
+
+    Bloom filters can report false positives, so an event that was never seen before may occasionally be dropped.
+    The `false_positive_rate` attribute reports the current estimate of this probability. It stays below `error_rate`
+    as long as fewer than `capacity` distinct events are emitted per window.
+
+    `fields` is a list of dot separated paths to the fields that identify an event, for example "context.user_id".
+        Defaults to the name, the user id and the data of the event.
+    `window` is the number of seconds for which an event is remembered.
+    `capacity` is the number of distinct events that are expected within a window.
+    `error_rate` is the acceptable probability of dropping an event that is not a repeat.
+    """
+
+    def __init__(self, fields=DEFAULT_FIELDS, window=DEFAULT_WINDOW_SECONDS, capacity=DEFAULT_CAPACITY,
+                 error_rate=DEFAULT_ERROR_RATE, **_kwargs):
+        if not fields:
+            raise ValueError('The DeduplicationProcessor must be passed at least one field to fingerprint')
+
+        if not 0 < error_rate < 1:
+            raise ValueError('The "error_rate" must be between 0 and 1')
+
+        self.field_getters = tuple(compile_field_path(path) for path in fields)
+        self.window = window
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = BloomFilter(capacity, error_rate)
+        self.rotate_at = time.time() + window
+        self.duplicates_dropped = 0
+        self.lock = threading.Lock()
+
+    @property
+    def size_in_bytes(self):
+        """The amount of memory used to store fingerprints"""
+        return len(self.current.bits) + len(self.previous.bits)
+
+    @property
+    def false_positive_rate(self):
+        """Estimate the probability that an event that is not a repeat is dropped"""
+        with self.lock:
+            current_rate = self.current.false_positive_rate
+            previous_rate = self.previous.false_positive_rate
+        return 1 - (1 - current_rate) * (1 - previous_rate)
+
+    def fingerprint(self, event):
+        """Hash the identifying fields of the event into a pair of 64 bit integers"""
+        values = [get_field(event) for get_field in self.field_getters]
+        serialized = json.dumps(values, sort_keys=True, default=str).encode('utf-8')
+        return struct.unpack('<QQ', hashlib.sha1(serialized).digest()[:16])
+
+    def __call__(self, event):
+        fingerprint = self.fingerprint(event)
+        now = time.time()
+
+        with self.lock:
+            if now >= self.rotate_at:
+                self.rotate(now)
+
+            if fingerprint in self.current or fingerprint in self.previous:
+                self.duplicates_dropped += 1
+                raise EventEmissionExit()
+
+            self.current.add(fingerprint)
+
+        return event
+
+    def rotate(self, now):
+        """Forget the events of the previous window and start a new one"""
+        self.previous.clear()
+        if now >= self.rotate_at + self.window:
+            # Nothing has been seen for over a window, so everything in the current window has expired too.
+            self.current.clear()
+        self.current, self.previous = self.previous, self.current
+        self.rotate_at = now + self.window
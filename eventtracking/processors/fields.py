@@ -0,0 +1,82 @@
+"""Helpers for processors that read fields out of events"""
+
+from __future__ import absolute_import
+
+
+def compile_field_path(path):
+    """
+    Build a function that reads a field out of a (nested) event.
+
+    `path` is a dot separated list of keys, for example "context.user_id" reads `event['context']['user_id']`.
+
+    The returned callable accepts an event and returns the value of the field, or None if any part of the path is
+    missing.
+    """
+    keys = tuple(path.split('.'))
+
+    if len(keys) == 1:
+        key = keys[0]
+
+        def get_top_level_field(event):
+            """Read a field from the root of the event"""
+            return event.get(key)
+
+        return get_top_level_field
+
+    def get_nested_field(event):
+        """Walk the event to find the field"""
+        value = event
+        for key in keys:
+            try:
+                value = value[key]
+            except (KeyError, TypeError, IndexError):
+                return None
+        return value
+
+    return get_nested_field
+
+
+def compile_projection(paths):
+    """
+    Build a function that copies a subset of the fields of a (nested) event.
+
+    `paths` is a list of dot separated lists of keys, like those accepted by `compile_field_path`. The returned
+    callable accepts an event and returns a new dictionary that contains only those fields, nested the same way as in
+    the event. Fields that are missing from the event are left out, and a path that names a dictionary copies the whole
+    dictionary, including fields that are also named by longer paths.
+    """
+    tree = {}
+    for path in paths:
+        keys = path.split('.')
+        node = tree
+        for key in keys[:-1]:
+            if key in node and node[key] is None:
+                # An enclosing field is already copied whole.
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[keys[-1]] = None
+    return _compile_projection_tree(tree)
+
+
+def _compile_projection_tree(tree):
+    """Build the projection function for a tree of keys, where None marks the fields copied whole"""
+    fields = tuple(
+        (key, None if subtree is None else _compile_projection_tree(subtree)) for key, subtree in tree.items()
+    )
+
+    def project(value):
+        """Copy the selected fields"""
+        projected = {}
+        for key, project_nested in fields:
+            try:
+                field = value[key]
+            except (KeyError, TypeError, IndexError):
+                continue
+            if project_nested is None:
+                projected[key] = field
+            elif isinstance(field, dict):
+                projected[key] = project_nested(field)
+        return projected
+
+    return project
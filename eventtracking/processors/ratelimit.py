@@ -0,0 +1,120 @@
+"""Drop events that are emitted faster than a configured rate"""
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import threading
+import time
+
+import six
+
+from eventtracking.processors.exceptions import EventEmissionExit
+from eventtracking.processors.fields import compile_field_path
+
+DEFAULT_MAX_KEYS = 10000
+
+# Indexes into the list that holds the state of a token bucket
+TOKENS = 0
+UPDATED = 1
+DROPPED = 2
+LIMIT = 3
+
+
+class RateLimitProcessor:
+    """
+
+    Drop events that exceed a token bucket rate limit.
+
+    A separate bucket is kept for every event name and, if `key_field` is set, for every value of that field. Each
+    bucket holds up to `burst` tokens and is refilled at `rate` tokens per second. Every event consumes a token, events
+    that find their bucket empty are dropped.
+
+    Buckets are created lazily and stored in a map that holds at most `max_keys` buckets. Once it is full, the least
+    recently used bucket is evicted to make room for a new one. Events whose `key_field` can't be hashed are not rate
+    limited. Allowing an event costs a dictionary lookup and a little arithmetic, no lock is taken unless a bucket has
+    to be created. Concurrent updates to the same bucket may race, which can let a few extra events through, but never
+    blocks the emitting thread.
+
+    `rate` is the default number of events per second allowed for each bucket. If it is not set, only events whose
+        names are listed in `limits` are rate limited.
+    `burst` is the default number of events that can be emitted at once. Defaults to `rate`.
+    `limits` is a dictionary mapping event names to a dictionary that overrides `rate` and `burst` for those events.
+    `key_field` is a dot separated path to a field that further partitions the buckets, for example "context.user_id"
+        or "context.ip".
+    `max_keys` is the maximum number of buckets to keep in memory.
+    """
+
+    def __init__(self, rate=None, burst=None, limits=None, key_field=None, max_keys=DEFAULT_MAX_KEYS, **_kwargs):
+        self.default_limit = self.parse_limit(rate, burst) if rate is not None else None
+        self.limits = {
+            name: self.parse_limit(limit.get('rate'), limit.get('burst'))
+            for name, limit in six.iteritems(limits or {})
+        }
+        if self.default_limit is None and not self.limits:
+            raise ValueError('The RateLimitProcessor must be passed a "rate" or a dictionary of "limits"')
+
+        self.get_key = compile_field_path(key_field) if key_field is not None else None
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.total_dropped = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def parse_limit(rate, burst):
+        """Validate a rate and burst pair, defaulting the burst to the rate"""
+        if rate is None or rate <= 0:
+            raise ValueError('The rate limit must be a positive number of events per second')
+        if burst is None:
+            burst = rate
+        return float(rate), float(burst)
+
+    def __call__(self, event):
+        name = event.get('name')
+        key = name if self.get_key is None else (name, self.get_key(event))
+
+        try:
+            bucket = self.buckets.get(key)
+        except TypeError:
+            # Unhashable key values can't be tracked, let the event through.
+            return event
+        if bucket is None:
+            limit = self.limits.get(name, self.default_limit)
+            if limit is None:
+                return event
+            bucket = self.create_bucket(key, limit)
+        else:
+            try:
+                self.buckets.move_to_end(key)
+            except KeyError:
+                # Evicted by another thread, it is used one last time.
+                pass
+
+        rate, burst = bucket[LIMIT]
+        now = time.time()
+        tokens = min(burst, bucket[TOKENS] + (now - bucket[UPDATED]) * rate)
+        bucket[UPDATED] = now
+        if tokens < 1:
+            bucket[TOKENS] = tokens
+            bucket[DROPPED] += 1
+            self.total_dropped += 1
+            raise EventEmissionExit()
+
+        bucket[TOKENS] = tokens - 1
+        return event
+
+    def create_bucket(self, key, limit):
+        """Add a full bucket for the key, evicting the least recently used bucket if there are too many"""
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                while len(self.buckets) >= self.max_keys:
+                    self.buckets.popitem(last=False)
+                bucket = [limit[1], time.time(), 0, limit]
+                self.buckets[key] = bucket
+            return bucket
+
+    def dropped_counts(self):
+        """Return a dictionary mapping the key of every bucket in memory to the number of events it has dropped"""
+        with self.lock:
+            buckets = list(self.buckets.items())
+        return {key: bucket[DROPPED] for key, bucket in buckets if bucket[DROPPED]}
@@ -0,0 +1,184 @@
+"""Replace high frequency events with periodic summaries"""
+
+from __future__ import absolute_import
+
+from array import array
+import atexit
+from datetime import datetime
+import numbers
+import threading
+import time
+
+import six
+from pytz import UTC
+
+from eventtracking.processors.exceptions import EventEmissionExit
+from eventtracking.processors.fields import compile_field_path
+
+DEFAULT_KEY_FIELDS = ('context.course_id',)
+DEFAULT_WINDOW_SECONDS = 60
+DEFAULT_SUMMARY_SUFFIX = '.rollup'
+
+
+class RollupProcessor:
+    """
+
+    Absorb high frequency events into in-memory aggregates and emit one summary event per key per time window.
+
+    Matching events are dropped and counted against a key made of their name and the values of `key_fields`. The
+    values of `sum_fields` are added up for each key. Windows are aligned to multiples of `window` seconds since the
+    epoch, so a 60 second window covers a wall clock minute. The first event to reach the processor after a window
+    has ended causes the summaries for that window to be emitted; call `flush` or `close` to emit them explicitly. Once
+    the processor is registered with a `RoutingBackend`, the summaries of the current window are also emitted when the
+    interpreter exits. Since the backends of the router are constructed before it, this happens before backends that
+    close themselves at exit are closed.
+
+    Summaries are sent through the processors registered after this one and then to the backends of the
+    `RoutingBackend` this processor is registered with. A summary for the event "play_video" looks like::
+
+        {
+            'name': 'play_video.rollup',
+            'timestamp': <the start of the window>,
+            'context': {'course_id': 'course-v1:edX+DemoX+Demo_Course'},
+            'data': {
+                'count': 1523,
+                'sum': {'data.duration': 9138.0},
+                'window_seconds': 60,
+            }
+        }
+
+    Key fields under "context" are copied into the context of the summary, all others into its data.
+
+    Counters and sums are stored in arrays indexed by a slot number assigned to each key, so the memory used only grows
+    with the number of distinct keys within a window, not with the number of events.
+
+    `names` is an iterable collection of the names of the events to aggregate.
+    `key_fields` is a list of dot separated paths to the fields that, together with the name, identify an aggregate.
+    `sum_fields` is a list of dot separated paths to numeric fields to add up. Non-numeric values are ignored.
+    `window` is the length of a window in seconds.
+    `summary_suffix` is appended to the name of the aggregated events to name the summary events.
+    """
+
+    def __init__(self, names=None, key_fields=DEFAULT_KEY_FIELDS, sum_fields=(), window=DEFAULT_WINDOW_SECONDS,
+                 summary_suffix=DEFAULT_SUMMARY_SUFFIX, **_kwargs):
+        if not names or isinstance(names, six.string_types):
+            raise TypeError(
+                'The RollupProcessor must be passed a collection of event names to aggregate '
+                'using the "names" parameter'
+            )
+
+        self.names = frozenset(names)
+        self.key_fields = tuple(key_fields)
+        self.key_getters = tuple(compile_field_path(path) for path in self.key_fields)
+        self.sum_fields = tuple(sum_fields)
+        self.sum_getters = tuple(compile_field_path(path) for path in self.sum_fields)
+        self.window = window
+        self.summary_suffix = summary_suffix
+        self.router = None
+        self.lock = threading.Lock()
+
+        self.window_start = self.get_window_start(time.time())
+        self.slots, self.counts, self.sums = self.create_aggregates()
+
+    def create_aggregates(self):
+        """Create an empty map of keys to slots, and the arrays of counts and sums indexed by slot"""
+        return {}, array('Q'), tuple(array('d') for _ in self.sum_fields)
+
+    def get_window_start(self, timestamp):
+        """Find the start of the window that contains the timestamp"""
+        return timestamp - (timestamp % self.window)
+
+    def attach_router(self, router):
+        """Remember the routing backend that summaries are sent through, and emit the summaries when exiting"""
+        if self.router is None:
+            atexit.register(self.close)
+        self.router = router
+
+    def __call__(self, event):
+        now = time.time()
+        if now >= self.window_start + self.window:
+            self.flush(now)
+
+        name = event.get('name')
+        if name not in self.names:
+            return event
+
+        key = (name,) + tuple(get_field(event) for get_field in self.key_getters)
+        try:
+            hash(key)
+        except TypeError:
+            # Unhashable key values can't be aggregated, let the raw event through.
+            return event
+
+        with self.lock:
+            slot = self.slots.get(key)
+            if slot is None:
+                slot = len(self.counts)
+                self.slots[key] = slot
+                self.counts.append(0)
+                for sums in self.sums:
+                    sums.append(0.0)
+
+            self.counts[slot] += 1
+            for get_field, sums in zip(self.sum_getters, self.sums):
+                value = get_field(event)
+                if isinstance(value, numbers.Real) and not isinstance(value, bool):
+                    sums[slot] += value
+
+        raise EventEmissionExit()
+
+    def flush(self, now=None):
+        """
+        Emit the summaries of the current window and start a new window.
+
+        If `now` is provided, the window is only flushed if it ended before that time. This prevents concurrent callers
+        from flushing the same window more than once.
+
+        Returns the list of summary events.
+        """
+        with self.lock:
+            if now is None:
+                now = time.time()
+            elif now < self.window_start + self.window:
+                return []
+
+            window_start = self.window_start
+            slots, counts, sums = self.slots, self.counts, self.sums
+            self.window_start = self.get_window_start(now)
+            self.slots, self.counts, self.sums = self.create_aggregates()
+
+        summaries = [
+            self.create_summary(key, window_start, counts[slot], [field_sums[slot] for field_sums in sums])
+            for key, slot in six.iteritems(slots)
+        ]
+
+        if self.router is not None:
+            for summary in summaries:
+                self.router.send_from(self, summary)
+
+        return summaries
+
+    def close(self):
+        """Emit the summaries of the current window, for example when shutting down"""
+        self.flush()
+
+    def create_summary(self, key, window_start, count, sums):
+        """Build the summary event for an aggregate"""
+        context = {}
+        data = {
+            'count': count,
+            'sum': dict(zip(self.sum_fields, sums)),
+            'window_seconds': self.window,
+        }
+        for path, value in zip(self.key_fields, key[1:]):
+            if path.startswith('context.'):
+                context[path[len('context.'):]] = value
+            else:
+                data[path[len('data.'):] if path.startswith('data.') else path] = value
+
+        return {
+            'name': key[0] + self.summary_suffix,
+            'timestamp': datetime.fromtimestamp(window_start, UTC),
+            'context': context,
+            'data': data,
+        }
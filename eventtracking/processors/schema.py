@@ -0,0 +1,187 @@
+"""Validate the data of events against a schema registered for each event name"""
+
+from __future__ import absolute_import
+
+import six
+
+from eventtracking.processors.exceptions import EventEmissionExit
+
+DROP = 'drop'
+TAG = 'tag'
+DEFAULT_TAG_FIELD = 'schema_errors'
+
+
+def _is_integer(value):
+    """Booleans are integers in python, but not in a schema."""
+    return isinstance(value, six.integer_types) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    """Any non-boolean integer or floating point number."""
+    return isinstance(value, six.integer_types + (float,)) and not isinstance(value, bool)
+
+
+TYPE_CHECKS = {
+    'string': lambda value: isinstance(value, six.string_types),
+    'integer': _is_integer,
+    'number': _is_number,
+    'boolean': lambda value: isinstance(value, bool),
+    'object': lambda value: isinstance(value, dict),
+    'array': lambda value: isinstance(value, (list, tuple)),
+    'null': lambda value: value is None,
+}
+
+
+def compile_type_check(field_name, type_names):
+    """
+    Build a predicate that returns True if a value is of one of the named types.
+
+    `type_names` is either a single type name or a list of type names from `TYPE_CHECKS`.
+
+    Raises a `ValueError` if any of the names are unknown.
+    """
+    if isinstance(type_names, six.string_types):
+        type_names = [type_names]
+
+    try:
+        checks = tuple(TYPE_CHECKS[type_name] for type_name in type_names)
+    except KeyError as error:
+        raise ValueError('Unknown type {0} for field "{1}"'.format(error, field_name))
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_any(value):
+        """True if any of the checks pass"""
+        for check in checks:
+            if check(value):
+                return True
+        return False
+
+    return check_any
+
+
+def compile_field(field_name, spec):
+    """
+    Build a validator for a single field of the event data.
+
+    `spec` is a dictionary that may contain the following keys:
+
+    * `type` - the name of the type the value must have, or a list of allowed type names.
+    * `required` - if True, the field must be present in the data. Defaults to False.
+    * `max_length` - the maximum length of a string, array or object value.
+
+    The returned callable accepts the data dictionary and returns an error message, or None if the field is valid.
+    """
+    required = spec.get('required', False)
+    max_length = spec.get('max_length')
+    type_name = spec.get('type')
+    type_check = compile_type_check(field_name, type_name) if type_name is not None else None
+
+    def validate(data):
+        """Validate a single field of the data"""
+        try:
+            value = data[field_name]
+        except KeyError:
+            if required:
+                return 'missing required field "{0}"'.format(field_name)
+            return None
+
+        if type_check is not None and not type_check(value):
+            return 'field "{0}" is not of type {1}'.format(field_name, type_name)
+
+        if max_length is not None:
+            try:
+                length = len(value)
+            except TypeError:
+                return None
+            if length > max_length:
+                return 'field "{0}" is longer than {1}'.format(field_name, max_length)
+
+        return None
+
+    return validate
+
+
+def compile_schema(schema):
+    """
+    Build a validator for the data of an event from a `schema`, which maps field names to field specifications.
+
+    The returned callable accepts the data of an event and returns a list of error messages, which is empty if the
+    data is valid.
+    """
+    validators = tuple(compile_field(field_name, spec) for field_name, spec in six.iteritems(schema))
+
+    def validate(data):
+        """Validate all fields of the data"""
+        if not isinstance(data, dict):
+            return ['data is not an object']
+
+        errors = []
+        for validator in validators:
+            error = validator(data)
+            if error is not None:
+                errors.append(error)
+        return errors
+
+    return validate
+
+
+class SchemaValidationProcessor:
+    """
+
+    Validate the `data` of events against a schema registered for the event name.
+
+    Schemas are compiled into validators once, when the processor is constructed, so validating an event only costs a
+    dictionary lookup for the event name and a few checks per field. Events whose names have no registered schema are
+    passed through untouched.
+
+    `schemas` is a dictionary mapping event names to schemas. Each schema maps field names to a specification
+        dictionary with the optional keys `type`, `required` and `max_length`. For example::
+
+            {
+                'edx.video.played': {
+                    'id': {'type': 'string', 'required': True, 'max_length': 255},
+                    'currentTime': {'type': 'number'},
+                }
+            }
+
+        Recognized type names are: string, integer, number, boolean, object, array and null.
+    `on_invalid` is either "drop", which prevents invalid events from being emitted, or "tag", which records the
+        validation errors in the event and lets it through. Defaults to "drop".
+    `tag_field` is the name of the field, added to the root of invalid events, that holds the list of validation errors
+        when `on_invalid` is "tag".
+    """
+
+    def __init__(self, schemas=None, on_invalid=DROP, tag_field=DEFAULT_TAG_FIELD, **_kwargs):
+        if not isinstance(schemas, dict):
+            raise TypeError(
+                'The SchemaValidationProcessor must be passed a dictionary of schemas '
+                'using the "schemas" parameter'
+            )
+
+        if on_invalid not in (DROP, TAG):
+            raise ValueError('Unknown "on_invalid" action: {0}'.format(on_invalid))
+
+        self.drop_invalid = on_invalid == DROP
+        # Tagging modifies the event, so only a processor that drops invalid events is a pure filter.
+        self.pure_filter = self.drop_invalid
+        self.tag_field = tag_field
+        self.validators = {
+            name: compile_schema(schema)
+            for name, schema in six.iteritems(schemas)
+        }
+
+    def __call__(self, event):
+        validator = self.validators.get(event.get('name'))
+        if validator is None:
+            return event
+
+        errors = validator(event.get('data'))
+        if errors:
+            if self.drop_invalid:
+                raise EventEmissionExit()
+
+            event[self.tag_field] = errors
+
+        return event
@@ -0,0 +1,124 @@
+"""Test the deduplication processor"""
+
+from __future__ import absolute_import
+
+from unittest import TestCase
+
+from mock import patch
+from six.moves import range
+
+from eventtracking.processors.dedup import BloomFilter, DeduplicationProcessor
+from eventtracking.processors.exceptions import EventEmissionExit
+
+
+class TestDeduplicationProcessor(TestCase):
+    """Test the deduplication processor"""
+
+    def setUp(self):
+        super(TestDeduplicationProcessor, self).setUp()
+        patcher = patch('eventtracking.processors.dedup.time')
+        self.mock_time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_time.time.return_value = 1000
+
+        self.processor = DeduplicationProcessor(window=10, capacity=1000)
+
+    def create_event(self, user_id=1, sequence=1):
+        """Build an event that is identified by the user and sequence"""
+        return {
+            'name': 'test.event',
+            'context': {'user_id': user_id, 'path': '/ignored'},
+            'data': {'sequence': sequence},
+        }
+
+    def test_first_event_passes(self):
+        event = self.create_event()
+        self.assertEqual(self.processor(event), event)
+
+    def test_repeat_dropped(self):
+        self.processor(self.create_event())
+        self.assert_dropped(self.create_event())
+        self.assertEqual(self.processor.duplicates_dropped, 1)
+
+    def assert_dropped(self, event):
+        """Assert that the processor drops the event"""
+        with self.assertRaises(EventEmissionExit):
+            self.processor(event)
+
+    def test_distinct_events_pass(self):
+        self.processor(self.create_event(sequence=1))
+        self.processor(self.create_event(sequence=2))
+        self.processor(self.create_event(user_id=2, sequence=1))
+        self.assertEqual(self.processor.duplicates_dropped, 0)
+
+    def test_unlisted_fields_ignored(self):
+        self.processor(self.create_event())
+        event = self.create_event()
+        event['context']['path'] = '/other'
+        self.assert_dropped(event)
+
+    def test_repeat_in_next_window_dropped(self):
+        self.processor(self.create_event())
+        self.mock_time.time.return_value = 1015
+        self.assert_dropped(self.create_event())
+
+    def test_repeat_after_two_windows_passes(self):
+        self.processor(self.create_event())
+        self.mock_time.time.return_value = 1015
+        self.processor(self.create_event(sequence=2))
+        self.mock_time.time.return_value = 1030
+        self.processor(self.create_event())
+
+    def test_repeat_after_long_idle_passes(self):
+        self.processor(self.create_event())
+        self.mock_time.time.return_value = 1100
+        self.processor(self.create_event())
+
+    def test_custom_fields(self):
+        processor = DeduplicationProcessor(fields=['name'])
+        processor(self.create_event(sequence=1))
+        with self.assertRaises(EventEmissionExit):
+            processor(self.create_event(sequence=2))
+
+    def test_no_fields(self):
+        with self.assertRaises(ValueError):
+            DeduplicationProcessor(fields=[])
+
+    def test_invalid_error_rate(self):
+        with self.assertRaises(ValueError):
+            DeduplicationProcessor(error_rate=1)
+
+    def test_fixed_memory(self):
+        size = self.processor.size_in_bytes
+        for i in range(5000):
+            try:
+                self.processor(self.create_event(sequence=i))
+            except EventEmissionExit:
+                # False positives are expected once the capacity is exceeded
+                pass
+        self.assertEqual(self.processor.size_in_bytes, size)
+
+    def test_false_positive_rate(self):
+        self.assertEqual(self.processor.false_positive_rate, 0)
+        for i in range(1000):
+            self.processor(self.create_event(sequence=i))
+        self.assertGreater(self.processor.false_positive_rate, 0)
+        self.assertLess(self.processor.false_positive_rate, 0.01)
+
+
+class TestBloomFilter(TestCase):
+    """Test the bloom filter used to remember fingerprints"""
+
+    def test_sizing(self):
+        bloom_filter = BloomFilter(1000, 0.01)
+        self.assertEqual(bloom_filter.num_bits, 9586)
+        self.assertEqual(bloom_filter.num_hashes, 7)
+
+    def test_membership(self):
+        bloom_filter = BloomFilter(100, 0.01)
+        bloom_filter.add((1, 2))
+        self.assertIn((1, 2), bloom_filter)
+        self.assertNotIn((3, 4), bloom_filter)
+
+        bloom_filter.clear()
+        self.assertNotIn((1, 2), bloom_filter)
@@ -0,0 +1,68 @@
+"""Test the helpers for reading fields out of events"""
+
+from __future__ import absolute_import
+
+from unittest import TestCase
+
+from eventtracking.processors.fields import compile_field_path, compile_projection
+
+
+class TestCompileFieldPath(TestCase):
+    """Test reading fields out of events"""
+
+    def setUp(self):
+        super(TestCompileFieldPath, self).setUp()
+        self.event = {
+            'name': 'test.event',
+            'context': {'user_id': 10, 'nested': {'key': 'value'}},
+            'data': 'not a dictionary',
+        }
+
+    def test_top_level_field(self):
+        self.assertEqual(compile_field_path('name')(self.event), 'test.event')
+
+    def test_nested_field(self):
+        self.assertEqual(compile_field_path('context.user_id')(self.event), 10)
+        self.assertEqual(compile_field_path('context.nested.key')(self.event), 'value')
+
+    def test_missing_field(self):
+        self.assertIsNone(compile_field_path('missing')(self.event))
+        self.assertIsNone(compile_field_path('context.missing')(self.event))
+        self.assertIsNone(compile_field_path('data.missing')(self.event))
+
+
+class TestCompileProjection(TestCase):
+    """Test copying a subset of the fields of events"""
+
+    def setUp(self):
+        super(TestCompileProjection, self).setUp()
+        self.event = {
+            'name': 'test.event',
+            'context': {'user_id': 10, 'course_id': 'course', 'nested': {'key': 'value', 'other': 'value'}},
+            'data': 'not a dictionary',
+        }
+
+    def test_top_level_fields(self):
+        project = compile_projection(['name', 'data'])
+        self.assertEqual(project(self.event), {'name': 'test.event', 'data': 'not a dictionary'})
+
+    def test_nested_fields(self):
+        project = compile_projection(['name', 'context.user_id', 'context.nested.key'])
+        self.assertEqual(project(self.event), {
+            'name': 'test.event',
+            'context': {'user_id': 10, 'nested': {'key': 'value'}},
+        })
+
+    def test_missing_fields(self):
+        project = compile_projection(['missing', 'context.missing', 'data.missing'])
+        self.assertEqual(project(self.event), {'context': {}})
+
+    def test_whole_dictionary(self):
+        for paths in (['context.nested', 'context.nested.key'], ['context.nested.key', 'context.nested']):
+            project = compile_projection(paths)
+            self.assertEqual(project(self.event), {'context': {'nested': {'key': 'value', 'other': 'value'}}})
+
+    def test_copy(self):
+        projected = compile_projection(['context.user_id'])(self.event)
+        projected['context']['user_id'] = 20
+        self.assertEqual(self.event['context']['user_id'], 10)
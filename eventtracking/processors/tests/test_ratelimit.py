@@ -0,0 +1,109 @@
+"""Test the rate limiting processor"""
+
+from __future__ import absolute_import
+
+from unittest import TestCase
+
+from mock import patch
+from six.moves import range
+
+from eventtracking.processors.exceptions import EventEmissionExit
+from eventtracking.processors.ratelimit import RateLimitProcessor
+
+
+class TestRateLimitProcessor(TestCase):
+    """Test the rate limiting processor"""
+
+    def setUp(self):
+        super(TestRateLimitProcessor, self).setUp()
+        patcher = patch('eventtracking.processors.ratelimit.time')
+        self.mock_time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_time.time.return_value = 1000
+
+    def create_event(self, name='test.event', user_id=1):
+        """Build an event for the given user"""
+        return {'name': name, 'context': {'user_id': user_id}}
+
+    def count_allowed(self, processor, num_events, **kwargs):
+        """Send a number of events through the processor and count the ones that were not dropped"""
+        allowed = 0
+        for _ in range(num_events):
+            try:
+                processor(self.create_event(**kwargs))
+                allowed += 1
+            except EventEmissionExit:
+                pass
+        return allowed
+
+    def test_burst_allowed(self):
+        processor = RateLimitProcessor(rate=1, burst=5)
+        self.assertEqual(self.count_allowed(processor, 10), 5)
+        self.assertEqual(processor.total_dropped, 5)
+        self.assertEqual(processor.dropped_counts(), {'test.event': 5})
+
+    def test_burst_defaults_to_rate(self):
+        processor = RateLimitProcessor(rate=3)
+        self.assertEqual(self.count_allowed(processor, 10), 3)
+
+    def test_refill(self):
+        processor = RateLimitProcessor(rate=2, burst=2)
+        self.assertEqual(self.count_allowed(processor, 5), 2)
+        self.mock_time.time.return_value = 1001
+        self.assertEqual(self.count_allowed(processor, 5), 2)
+        self.mock_time.time.return_value = 1001.5
+        self.assertEqual(self.count_allowed(processor, 5), 1)
+
+    def test_refill_capped_at_burst(self):
+        processor = RateLimitProcessor(rate=2, burst=2)
+        self.count_allowed(processor, 2)
+        self.mock_time.time.return_value = 2000
+        self.assertEqual(self.count_allowed(processor, 5), 2)
+
+    def test_separate_bucket_per_name(self):
+        processor = RateLimitProcessor(rate=1)
+        self.assertEqual(self.count_allowed(processor, 2, name='a'), 1)
+        self.assertEqual(self.count_allowed(processor, 2, name='b'), 1)
+
+    def test_key_field(self):
+        processor = RateLimitProcessor(rate=1, key_field='context.user_id')
+        self.assertEqual(self.count_allowed(processor, 2, user_id=1), 1)
+        self.assertEqual(self.count_allowed(processor, 2, user_id=2), 1)
+        self.assertEqual(processor.dropped_counts(), {('test.event', 1): 1, ('test.event', 2): 1})
+
+    def test_per_name_limits(self):
+        processor = RateLimitProcessor(limits={'limited': {'rate': 1, 'burst': 2}})
+        self.assertEqual(self.count_allowed(processor, 5, name='limited'), 2)
+        self.assertEqual(self.count_allowed(processor, 5, name='unlimited'), 5)
+
+    def test_per_name_limits_override_default(self):
+        processor = RateLimitProcessor(rate=1, limits={'special': {'rate': 3}})
+        self.assertEqual(self.count_allowed(processor, 5, name='special'), 3)
+        self.assertEqual(self.count_allowed(processor, 5, name='other'), 1)
+
+    def test_bounded_buckets(self):
+        processor = RateLimitProcessor(rate=1, key_field='context.user_id', max_keys=2)
+        for user_id in range(5):
+            self.count_allowed(processor, 1, user_id=user_id)
+        self.assertEqual(list(processor.buckets.keys()), [('test.event', 3), ('test.event', 4)])
+
+    def test_least_recently_used_evicted(self):
+        processor = RateLimitProcessor(rate=10, key_field='context.user_id', max_keys=2)
+        self.count_allowed(processor, 1, user_id=1)
+        self.count_allowed(processor, 1, user_id=2)
+        self.count_allowed(processor, 1, user_id=1)
+        self.count_allowed(processor, 1, user_id=3)
+        self.assertEqual(list(processor.buckets.keys()), [('test.event', 1), ('test.event', 3)])
+
+    def test_unhashable_key(self):
+        processor = RateLimitProcessor(rate=1, key_field='context.user_id')
+        self.assertEqual(self.count_allowed(processor, 3, user_id=[1]), 3)
+        self.assertEqual(len(processor.buckets), 0)
+
+    def test_no_limits(self):
+        with self.assertRaises(ValueError):
+            RateLimitProcessor()
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            RateLimitProcessor(rate=0)
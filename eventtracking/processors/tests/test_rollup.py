@@ -0,0 +1,131 @@
+"""Test the rollup processor"""
+
+from __future__ import absolute_import
+
+from datetime import datetime
+from unittest import TestCase
+
+from mock import patch
+from pytz import UTC
+from six.moves import range
+
+from eventtracking.backends.routing import RoutingBackend
+from eventtracking.backends.tests import InMemoryBackend
+from eventtracking.processors.exceptions import EventEmissionExit
+from eventtracking.processors.rollup import RollupProcessor
+
+
+class TestRollupProcessor(TestCase):
+    """Test the rollup processor"""
+
+    def setUp(self):
+        super(TestRollupProcessor, self).setUp()
+        patcher = patch('eventtracking.processors.rollup.time')
+        self.mock_time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_time.time.return_value = 1020
+
+        self.processor = RollupProcessor(
+            names=['play_video'],
+            key_fields=['context.course_id', 'data.code'],
+            sum_fields=['data.duration'],
+        )
+        self.backend = InMemoryBackend()
+        self.router = RoutingBackend(backends={'mem': self.backend}, processors=[self.processor])
+
+    def create_event(self, name='play_video', course_id='course-a', duration=2.5):
+        """Build a video event"""
+        return {
+            'name': name,
+            'context': {'course_id': course_id},
+            'data': {'code': 'html5', 'duration': duration},
+        }
+
+    def test_matching_events_dropped(self):
+        with self.assertRaises(EventEmissionExit):
+            self.processor(self.create_event())
+
+    def test_other_events_pass(self):
+        event = self.create_event(name='other')
+        self.assertEqual(self.processor(event), event)
+
+    def test_summary_emitted_after_window(self):
+        for _ in range(3):
+            self.router.send(self.create_event())
+        self.router.send(self.create_event(course_id='course-b', duration='invalid'))
+        self.assertEqual(self.backend.events, [])
+
+        self.mock_time.time.return_value = 1090
+        self.router.send(self.create_event(name='other'))
+
+        summaries = sorted(self.backend.events[:2], key=lambda event: event['context']['course_id'])
+        window_start = datetime(1970, 1, 1, 0, 17, tzinfo=UTC)
+        self.assertEqual(summaries, [
+            {
+                'name': 'play_video.rollup',
+                'timestamp': window_start,
+                'context': {'course_id': 'course-a'},
+                'data': {'count': 3, 'sum': {'data.duration': 7.5}, 'window_seconds': 60, 'code': 'html5'},
+            },
+            {
+                'name': 'play_video.rollup',
+                'timestamp': window_start,
+                'context': {'course_id': 'course-b'},
+                'data': {'count': 1, 'sum': {'data.duration': 0.0}, 'window_seconds': 60, 'code': 'html5'},
+            },
+        ])
+        self.assertEqual(self.backend.events[2]['name'], 'other')
+
+    def test_aggregates_reset_after_flush(self):
+        self.router.send(self.create_event())
+        self.assertEqual(len(self.processor.flush()), 1)
+        self.assertEqual(self.processor.flush(), [])
+
+    def test_flush_skipped_within_window(self):
+        self.router.send(self.create_event())
+        self.assertEqual(self.processor.flush(now=1070), [])
+        self.assertEqual(len(self.processor.flush(now=1090)), 1)
+
+    def test_summary_sent_through_remaining_processors(self):
+        def tag(event):
+            """Mark the event as processed"""
+            event['tagged'] = True
+
+        self.router.register_processor(tag)
+        self.router.send(self.create_event())
+        self.processor.flush()
+        self.assertTrue(self.backend.events[0]['tagged'])
+
+    def test_unhashable_key_passes(self):
+        event = self.create_event(course_id={'not': 'hashable'})
+        self.assertEqual(self.processor(event), event)
+
+    def test_close(self):
+        with self.assertRaises(EventEmissionExit):
+            self.processor(self.create_event())
+        self.processor.close()
+        self.assertEqual(len(self.backend.events), 1)
+        self.assertEqual(self.backend.events[0]['data']['count'], 1)
+
+    def test_flushed_at_exit(self):
+        with patch('eventtracking.processors.rollup.atexit') as mock_atexit:
+            processor = RollupProcessor(names=['play_video'])
+            mock_atexit.register.assert_not_called()
+            RoutingBackend(processors=[processor])
+        mock_atexit.register.assert_called_once_with(processor.close)
+
+    def test_flush_without_router(self):
+        processor = RollupProcessor(names=['play_video'])
+        with self.assertRaises(EventEmissionExit):
+            processor(self.create_event())
+        summaries = processor.flush()
+        self.assertEqual(summaries[0]['data']['count'], 1)
+        self.assertEqual(summaries[0]['data']['sum'], {})
+
+    def test_no_names(self):
+        with self.assertRaises(TypeError):
+            RollupProcessor()
+
+    def test_names_just_a_string(self):
+        with self.assertRaises(TypeError):
+            RollupProcessor(names='play_video')
@@ -0,0 +1,103 @@
+"""Test the schema validation processor"""
+
+from __future__ import absolute_import
+
+from unittest import TestCase
+
+from eventtracking.processors.exceptions import EventEmissionExit
+from eventtracking.processors.schema import SchemaValidationProcessor
+
+SCHEMAS = {
+    'test.event': {
+        'id': {'type': 'string', 'required': True, 'max_length': 5},
+        'count': {'type': 'integer'},
+        'position': {'type': ['number', 'null']},
+        'tags': {'type': 'array', 'max_length': 2},
+    }
+}
+
+
+class TestSchemaValidationProcessor(TestCase):
+    """Test the schema validation processor"""
+
+    def setUp(self):
+        super(TestSchemaValidationProcessor, self).setUp()
+        self.processor = SchemaValidationProcessor(schemas=SCHEMAS)
+
+    def create_event(self, data, name='test.event'):
+        """Build an event with the given name and data"""
+        return {'name': name, 'data': data}
+
+    def assert_dropped(self, data):
+        """Assert that an event with the given data is dropped"""
+        with self.assertRaises(EventEmissionExit):
+            self.processor(self.create_event(data))
+
+    def test_valid_event(self):
+        event = self.create_event({'id': 'abc', 'count': 1, 'position': None, 'tags': ['a']})
+        self.assertEqual(self.processor(event), event)
+
+    def test_unknown_event_name(self):
+        event = self.create_event({'anything': object()}, name='other.event')
+        self.assertEqual(self.processor(event), event)
+
+    def test_missing_required_field(self):
+        self.assert_dropped({'count': 1})
+
+    def test_optional_field_may_be_absent(self):
+        event = self.create_event({'id': 'abc'})
+        self.assertEqual(self.processor(event), event)
+
+    def test_wrong_type(self):
+        self.assert_dropped({'id': 10})
+
+    def test_boolean_is_not_integer(self):
+        self.assert_dropped({'id': 'abc', 'count': True})
+
+    def test_multiple_types(self):
+        event = self.create_event({'id': 'abc', 'position': 1.5})
+        self.assertEqual(self.processor(event), event)
+        self.assert_dropped({'id': 'abc', 'position': 'start'})
+
+    def test_string_too_long(self):
+        self.assert_dropped({'id': 'abcdef'})
+
+    def test_array_too_long(self):
+        self.assert_dropped({'id': 'abc', 'tags': ['a', 'b', 'c']})
+
+    def test_data_not_an_object(self):
+        self.assert_dropped(['abc'])
+
+    def test_tag_invalid_events(self):
+        processor = SchemaValidationProcessor(schemas=SCHEMAS, on_invalid='tag')
+        event = processor(self.create_event({'count': 'one'}))
+        self.assertEqual(event['schema_errors'], [
+            'missing required field "id"',
+            'field "count" is not of type integer',
+        ])
+
+    def test_custom_tag_field(self):
+        processor = SchemaValidationProcessor(schemas=SCHEMAS, on_invalid='tag', tag_field='invalid')
+        event = processor(self.create_event({}))
+        self.assertEqual(event['invalid'], ['missing required field "id"'])
+
+    def test_valid_event_not_tagged(self):
+        processor = SchemaValidationProcessor(schemas=SCHEMAS, on_invalid='tag')
+        event = processor(self.create_event({'id': 'abc'}))
+        self.assertNotIn('schema_errors', event)
+
+    def test_no_schemas_param(self):
+        with self.assertRaises(TypeError):
+            SchemaValidationProcessor()
+
+    def test_unknown_action(self):
+        with self.assertRaises(ValueError):
+            SchemaValidationProcessor(schemas=SCHEMAS, on_invalid='ignore')
+
+    def test_unknown_type(self):
+        with self.assertRaises(ValueError):
+            SchemaValidationProcessor(schemas={'test.event': {'id': {'type': 'uuid'}}})
+
+    def test_pure_filter(self):
+        self.assertTrue(self.processor.pure_filter)
+        self.assertFalse(SchemaValidationProcessor(schemas=SCHEMAS, on_invalid='tag').pure_filter)
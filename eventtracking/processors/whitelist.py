@@ -15,6 +15,8 @@ class NameWhitelistProcessor:
     `whitelist` is an iterable collection containing event names that should be allowed to pass.
     """
 
+    pure_filter = True
+
     def __init__(self, whitelist=None, **_kwargs):
         try:
             if isinstance(whitelist, six.string_types):
@@ -0,0 +1,288 @@
+"""
+Replay events from log files through a routing tree of backends.
+
+Each input file contains one JSON event per line, optionally preceded by other text such as the prefix added by a
+logging handler, and may be compressed with gzip or xz. Lines are read in chunks, and the chunks are parsed in a pool of
+worker processes while the main process sends the parsed events to the backends in batches. Only a bounded number of
+chunks are ever in flight, so files of any size are replayed in constant memory.
+
+Usage::
+
+    eventtracking-replay --config backends.json --processes 4 --rate 5000 tracking.log.1.gz tracking.log
+
+The configuration file is a JSON object in the same format as the `EVENT_TRACKING_BACKENDS` setting, see
+`eventtracking.config.instantiate_objects`, or a single object with an "ENGINE" key, such as a `RoutingBackend` with
+its own processors.
+"""
+
+from __future__ import absolute_import
+
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+import gzip
+import io
+import json
+import lzma
+import sys
+import time
+
+import six
+
+from eventtracking import config
+from eventtracking.backends.index import EPOCH, parse_timestamp
+from eventtracking.backends.routing import RoutingBackend
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_PROGRESS_INTERVAL = 10.0
+DEFAULT_TIMESTAMP_FIELD = 'timestamp'
+
+
+def open_input(path):
+    """Open an input file for reading text, decompressing it based on the extension of its name"""
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', errors='replace')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    if path.endswith('.xz'):
+        return lzma.open(path, 'rt', encoding='utf-8', errors='replace')
+    return io.open(path, 'r', encoding='utf-8', errors='replace')
+
+
+def read_chunks(paths, chunk_size):
+    """Read the lines of each of the files in turn, and yield them in lists of at most `chunk_size` lines"""
+    chunk = []
+    for path in paths:
+        with open_input(path) as input_file:
+            for line in input_file:
+                chunk.append(line)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_lines(lines, timestamp_field=DEFAULT_TIMESTAMP_FIELD):
+    """
+    Parse a list of lines into events.
+
+    Any text before the first "{" of a line is ignored. The field `timestamp_field` of each event is converted back to
+    a datetime in UTC, if it is a timestamp written by the JSON serializers. Blank lines are skipped.
+
+    Returns a list of the events and the number of lines that did not contain an event.
+    """
+    events = []
+    invalid = 0
+    for line in lines:
+        start = line.find('{')
+        if start < 0:
+            if line.strip():
+                invalid += 1
+            continue
+
+        try:
+            event = json.loads(line[start:])
+        except ValueError:
+            invalid += 1
+            continue
+        if not isinstance(event, dict):
+            invalid += 1
+            continue
+
+        if timestamp_field:
+            microseconds = parse_timestamp(event.get(timestamp_field))
+            if microseconds is not None:
+                event[timestamp_field] = EPOCH + timedelta(microseconds=microseconds)
+        events.append(event)
+    return events, invalid
+
+
+def parse_chunks(chunks, timestamp_field, pool=None, max_pending=1):
+    """
+    Parse each chunk of lines, see `parse_lines`, and yield the results in the same order as the chunks.
+
+    If `pool` is given, chunks are parsed by the executor, with at most `max_pending` chunks submitted to it and not
+    yet yielded at any time.
+    """
+    if pool is None:
+        for chunk in chunks:
+            yield parse_lines(chunk, timestamp_field)
+        return
+
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(parse_lines, chunk, timestamp_field))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class RateLimiter:
+    """Slow down a sequence of operations so that at most `rate` items are processed per second on average"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.count = 0
+
+    def wait(self, count):
+        """Record that `count` more items are about to be processed, and wait until that is allowed"""
+        self.count += count
+        delay = self.count / float(self.rate) - (time.monotonic() - self.started)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ReplayStatistics:
+    """Counters for a replay, which are reported while it runs and at the end"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.lines = 0
+        self.events = 0
+        self.invalid = 0
+
+    @property
+    def elapsed(self):
+        """The number of seconds since the replay started"""
+        return time.monotonic() - self.started
+
+    def report(self, stream, prefix='Replayed'):
+        """Write a summary of the counters to `stream`"""
+        elapsed = self.elapsed
+        stream.write('{0} {1} events from {2} lines in {3:.1f}s ({4:.0f} events/s), {5} invalid lines\n'.format(
+            prefix, self.events, self.lines, elapsed, self.events / elapsed if elapsed > 0 else 0.0, self.invalid,
+        ))
+        stream.flush()
+
+
+def replay(paths, router, **kwargs):
+    """
+    Replay the events in the files at `paths` through `router`.
+
+    `router` is sent each batch of events using `send_batch`, see `RoutingBackend.send_batch`.
+    `processes` is the number of worker processes that parse lines, or 0 to parse them in this process.
+    `batch_size` is the number of lines parsed, and the maximum number of events sent, at a time.
+    `rate` is the maximum number of events sent per second, or None for no limit.
+    `progress_interval` is the number of seconds between progress reports, or None for no progress reports.
+    `timestamp_field` is the field of each event that holds its timestamp.
+    `stream` is where progress is reported, standard error by default.
+
+    Returns the `ReplayStatistics` of the replay.
+    """
+    processes = kwargs.get('processes', 0)
+    batch_size = kwargs.get('batch_size', DEFAULT_BATCH_SIZE)
+    rate = kwargs.get('rate')
+    progress_interval = kwargs.get('progress_interval', DEFAULT_PROGRESS_INTERVAL)
+    timestamp_field = kwargs.get('timestamp_field', DEFAULT_TIMESTAMP_FIELD)
+    stream = kwargs.get('stream') or sys.stderr
+
+    statistics = ReplayStatistics()
+    limiter = RateLimiter(rate) if rate else None
+    next_report = statistics.started + progress_interval if progress_interval else None
+
+    pool = ProcessPoolExecutor(max_workers=processes) if processes else None
+    try:
+        chunks = read_chunks(paths, batch_size)
+        # Two chunks per process keep the workers busy while the main process sends the previous results.
+        for events, invalid in parse_chunks(chunks, timestamp_field, pool, max_pending=2 * processes):
+            statistics.lines += len(events) + invalid
+            statistics.invalid += invalid
+            if events:
+                if limiter is not None:
+                    limiter.wait(len(events))
+                router.send_batch(events)
+                statistics.events += len(events)
+
+            if next_report is not None and time.monotonic() >= next_report:
+                statistics.report(stream, prefix='Replayed')
+                next_report = time.monotonic() + progress_interval
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return statistics
+
+
+def load_router(path):
+    """Build the routing tree described by the configuration file at `path`"""
+    with io.open(path, 'r', encoding='utf-8') as config_file:
+        values = json.load(config_file)
+
+    if isinstance(values, dict) and 'ENGINE' in values:
+        backend = config.instantiate_from_dict(values)
+        if isinstance(backend, RoutingBackend):
+            return backend
+        return RoutingBackend(backends={'default': backend})
+
+    if not isinstance(values, dict):
+        raise ValueError('The configuration must be a JSON object')
+    return RoutingBackend(backends=config.instantiate_objects(values))
+
+
+def close_backends(backend):
+    """Close each backend in a routing tree that can be closed, so that buffered events are written"""
+    for child in six.itervalues(getattr(backend, 'backends', {})):
+        close_backends(child)
+    close = getattr(backend, 'close', None)
+    if callable(close):
+        close()
+
+
+def parse_arguments(argv):
+    """Parse the command line arguments"""
+    parser = argparse.ArgumentParser(
+        prog='eventtracking-replay',
+        description='Replay events from log files through a routing tree of backends.',
+    )
+    parser.add_argument('paths', metavar='FILE', nargs='+', help='files to replay, "-" for standard input')
+    parser.add_argument(
+        '--config', required=True,
+        help='JSON file in the format of the EVENT_TRACKING_BACKENDS setting, or a single backend with an "ENGINE"',
+    )
+    parser.add_argument('--processes', type=int, default=0, help='worker processes that parse lines, 0 for none')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='lines parsed and sent at a time')
+    parser.add_argument('--rate', type=float, help='maximum number of events sent per second')
+    parser.add_argument(
+        '--progress-interval', type=float, default=DEFAULT_PROGRESS_INTERVAL,
+        help='seconds between progress reports, 0 for none',
+    )
+    parser.add_argument(
+        '--timestamp-field', default=DEFAULT_TIMESTAMP_FIELD, help='field of each event that holds its timestamp',
+    )
+    arguments = parser.parse_args(argv)
+    if arguments.processes < 0:
+        parser.error('--processes must not be negative')
+    if arguments.batch_size < 1:
+        parser.error('--batch-size must be positive')
+    if arguments.rate is not None and arguments.rate <= 0:
+        parser.error('--rate must be positive')
+    return arguments
+
+
+def main(argv=None):
+    """Run the eventtracking-replay command"""
+    arguments = parse_arguments(argv)
+    router = load_router(arguments.config)
+    try:
+        statistics = replay(
+            arguments.paths,
+            router,
+            processes=arguments.processes,
+            batch_size=arguments.batch_size,
+            rate=arguments.rate,
+            progress_interval=arguments.progress_interval or None,
+            timestamp_field=arguments.timestamp_field,
+        )
+    finally:
+        close_backends(router)
+
+    statistics.report(sys.stderr, prefix='Finished: replayed')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
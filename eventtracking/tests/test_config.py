@@ -0,0 +1,33 @@
+"""Test constructing backends and processors from configuration"""
+
+from __future__ import absolute_import
+
+from unittest import TestCase
+
+from eventtracking import config
+from eventtracking.backends.routing import RoutingBackend
+
+
+class TestInstantiateObjects(TestCase):
+    """Test instantiating objects without Django"""
+
+    def test_nested_objects(self):
+        tree = config.instantiate_objects({
+            'default': {
+                'ENGINE': 'eventtracking.backends.routing.RoutingBackend',
+                'OPTIONS': {
+                    'backends': {
+                        'nested': {'ENGINE': 'eventtracking.backends.routing.RoutingBackend'},
+                    },
+                },
+            },
+            'values': [1, {'a': 'b'}],
+        })
+
+        self.assertIsInstance(tree['default'], RoutingBackend)
+        self.assertIsInstance(tree['default'].backends['nested'], RoutingBackend)
+        self.assertEqual(tree['values'], [1, {'a': 'b'}])
+
+    def test_missing_class(self):
+        with self.assertRaisesRegex(ValueError, 'Cannot find class foo.Bar'):
+            config.instantiate_from_dict({'ENGINE': 'foo.Bar'})
@@ -0,0 +1,76 @@
+"""Test the generation of event ids"""
+
+from __future__ import absolute_import
+
+from datetime import datetime
+from unittest import TestCase
+
+from mock import patch
+from pytz import UTC
+
+from eventtracking import ids
+
+
+class TestIds(TestCase):
+    """Test the generation of event ids"""
+
+    def setUp(self):
+        super(TestIds, self).setUp()
+        self.generator = ids.IdGenerator()
+
+    def test_format(self):
+        event_id = self.generator.new_id()
+        self.assertEqual(len(event_id), ids.LENGTH)
+        self.assertTrue(set(event_id) <= set(ids.ALPHABET))
+
+    def test_increasing(self):
+        generated = [self.generator.new_id() for _ in range(10000)]
+        self.assertEqual(generated, sorted(generated))
+        self.assertEqual(len(set(generated)), len(generated))
+
+    def test_encode_decode(self):
+        for value in (0, 1, 12345678901234567890, (1 << 128) - 1):
+            self.assertEqual(ids.decode(ids.encode(value)), value)
+        self.assertEqual(ids.decode(ids.encode(31).lower()), 31)
+
+    def test_invalid_ids(self):
+        for event_id in ('', 'U' * ids.LENGTH, '0' * (ids.LENGTH + 1)):
+            with self.assertRaises(ValueError):
+                ids.decode(event_id)
+
+    def test_id_time(self):
+        with patch('eventtracking.ids.time.time', return_value=1356998400.123):
+            event_id = self.generator.new_id()
+        self.assertEqual(ids.id_time(event_id), datetime(2013, 1, 1, 0, 0, 0, 123000, tzinfo=UTC))
+
+    def test_counter_within_millisecond(self):
+        with patch('eventtracking.ids.time.time', return_value=1356998400.0):
+            first = ids.decode(self.generator.new_id())
+            second = ids.decode(self.generator.new_id())
+        self.assertEqual(second, first + 1)
+
+    def test_clock_goes_backwards(self):
+        with patch('eventtracking.ids.time.time', return_value=1356998400.0):
+            first = self.generator.new_id()
+        with patch('eventtracking.ids.time.time', return_value=1356998300.0):
+            second = self.generator.new_id()
+        self.assertLess(first, second)
+        self.assertEqual(ids.id_time(first), ids.id_time(second))
+
+    def test_counter_overflow(self):
+        with patch('eventtracking.ids.time.time', return_value=1356998400.0):
+            first = self.generator.new_id()
+            self.generator.last_random = ids.MAX_RANDOM
+            second = self.generator.new_id()
+        self.assertLess(first, second)
+        self.assertEqual(ids.decode(second) >> ids.RANDOM_BITS, (ids.decode(first) >> ids.RANDOM_BITS) + 1)
+
+    def test_forked_process(self):
+        with patch('eventtracking.ids.time.time', return_value=1356998400.0):
+            parent = ids.decode(self.generator.new_id())
+            with patch('eventtracking.ids.os.getpid', return_value=-1):
+                child = ids.decode(self.generator.new_id())
+        self.assertNotEqual(child, parent + 1)
+
+    def test_shared_generator(self):
+        self.assertLess(ids.new_id(), ids.new_id())
@@ -0,0 +1,183 @@
+"""Test replaying events from log files"""
+
+from __future__ import absolute_import
+
+from datetime import datetime
+import gzip
+import io
+import json
+import lzma
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+from pytz import UTC
+
+from eventtracking import replay
+from eventtracking.backends.routing import RoutingBackend
+
+TIMESTAMP = datetime(2013, 1, 1, 12, 30, 15, 123456, tzinfo=UTC)
+
+
+class RecordingBackend:
+    """Record the batches of events sent to the backend"""
+
+    batches = []
+
+    def __init__(self, **kwargs):
+        self.options = kwargs
+        self.closed = False
+
+    def send(self, event):
+        """Record a single event"""
+        self.send_batch([event])
+
+    def send_batch(self, events):
+        """Record a batch of events"""
+        RecordingBackend.batches.append(list(events))
+
+    def close(self):
+        """Record that the backend was closed"""
+        self.closed = True
+
+
+class TestReplay(TestCase):
+    """Test replaying events through a routing tree"""
+
+    def setUp(self):
+        super(TestReplay, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        RecordingBackend.batches = []
+        self.backend = RecordingBackend()
+        self.router = RoutingBackend(backends={'0': self.backend})
+        self.stream = io.StringIO()
+
+    def write_log(self, name, lines, opener=io.open):
+        """Write a log file containing the given lines"""
+        path = os.path.join(self.directory, name)
+        with opener(path, 'wt', encoding='utf-8') as log_file:
+            for line in lines:
+                log_file.write(line + '\n')
+        return path
+
+    def event_line(self, index):
+        """A line containing an event, as written by the logger backend"""
+        return json.dumps({'name': str(index), 'timestamp': TIMESTAMP.isoformat()})
+
+    def replay(self, paths, **kwargs):
+        """Replay the files through the router"""
+        kwargs.setdefault('stream', self.stream)
+        return replay.replay(paths, self.router, **kwargs)
+
+    def replayed_names(self):
+        """The names of the events sent to the backend, in order"""
+        return [event['name'] for batch in RecordingBackend.batches for event in batch]
+
+    def test_events_sent_in_batches(self):
+        path = self.write_log('tracking.log', [self.event_line(i) for i in range(5)])
+
+        statistics = self.replay([path], batch_size=2)
+
+        self.assertEqual([len(batch) for batch in RecordingBackend.batches], [2, 2, 1])
+        self.assertEqual(self.replayed_names(), ['0', '1', '2', '3', '4'])
+        self.assertEqual(statistics.events, 5)
+        self.assertEqual(statistics.lines, 5)
+
+    def test_timestamps_rehydrated(self):
+        path = self.write_log('tracking.log', [self.event_line(0)])
+        self.replay([path])
+        self.assertEqual(RecordingBackend.batches[0][0]['timestamp'], TIMESTAMP)
+
+    def test_custom_timestamp_field(self):
+        path = self.write_log('tracking.log', [json.dumps({'name': '0', 'time': '2013-01-01T12:30:15.123456+00:00'})])
+        self.replay([path], timestamp_field='time')
+        self.assertEqual(RecordingBackend.batches[0][0]['time'], TIMESTAMP)
+
+    def test_invalid_lines(self):
+        path = self.write_log('tracking.log', [
+            '2013-01-01 12:30:15 INFO ' + self.event_line(0),
+            'not an event',
+            '{"truncated',
+            '[1, 2]',
+            '',
+            self.event_line(1),
+        ])
+
+        statistics = self.replay([path])
+
+        self.assertEqual(self.replayed_names(), ['0', '1'])
+        self.assertEqual(statistics.invalid, 3)
+
+    def test_compressed_files(self):
+        paths = [
+            self.write_log('tracking.log.1.gz', [self.event_line(0)], opener=gzip.open),
+            self.write_log('tracking.log.2.xz', [self.event_line(1)], opener=lzma.open),
+            self.write_log('tracking.log', [self.event_line(2)]),
+        ]
+        self.replay(paths)
+        self.assertEqual(self.replayed_names(), ['0', '1', '2'])
+
+    def test_worker_processes(self):
+        path = self.write_log('tracking.log', [self.event_line(i) for i in range(50)])
+
+        statistics = self.replay([path], processes=2, batch_size=7)
+
+        self.assertEqual(self.replayed_names(), [str(i) for i in range(50)])
+        self.assertEqual(RecordingBackend.batches[0][0]['timestamp'], TIMESTAMP)
+        self.assertEqual(statistics.events, 50)
+
+    def test_rate_limit(self):
+        path = self.write_log('tracking.log', [self.event_line(i) for i in range(4)])
+
+        with patch('eventtracking.replay.time.sleep') as mock_sleep:
+            self.replay([path], batch_size=2, rate=1)
+
+        delays = [call_args[0][0] for call_args in mock_sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertAlmostEqual(delays[0], 2, places=1)
+        self.assertAlmostEqual(delays[1], 4, places=1)
+
+    def test_progress_reported(self):
+        path = self.write_log('tracking.log', [self.event_line(i) for i in range(4)])
+        self.replay([path], batch_size=2, progress_interval=1e-9)
+        self.assertIn('Replayed 2 events from 2 lines', self.stream.getvalue())
+
+    def test_main(self):
+        path = self.write_log('tracking.log', [self.event_line(i) for i in range(3)])
+        config_path = self.write_log('backends.json', [json.dumps({
+            'recording': {
+                'ENGINE': 'eventtracking.tests.test_replay.RecordingBackend',
+                'OPTIONS': {'name': 'test'},
+            },
+        })])
+
+        with patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            self.assertEqual(replay.main(['--config', config_path, '--progress-interval', '0', path]), 0)
+
+        self.assertEqual(self.replayed_names(), ['0', '1', '2'])
+        self.assertIn('Finished: replayed 3 events from 3 lines', stderr.getvalue())
+
+    def test_load_single_backend(self):
+        config_path = self.write_log('backend.json', [json.dumps({
+            'ENGINE': 'eventtracking.tests.test_replay.RecordingBackend',
+            'OPTIONS': {'name': 'test'},
+        })])
+
+        router = replay.load_router(config_path)
+
+        self.assertIsInstance(router, RoutingBackend)
+        self.assertEqual(router.backends['default'].options, {'name': 'test'})
+
+    def test_load_routing_backend(self):
+        config_path = self.write_log('backend.json', [json.dumps({
+            'ENGINE': 'eventtracking.backends.routing.RoutingBackend',
+        })])
+        self.assertEqual(len(replay.load_router(config_path).backends), 0)
+
+    def test_close_backends(self):
+        nested = RoutingBackend(backends={'0': self.backend})
+        replay.close_backends(RoutingBackend(backends={'0': nested}))
+        self.assertTrue(self.backend.closed)
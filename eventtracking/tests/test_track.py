@@ -122,6 +122,24 @@ class TestTrack(TestCase):
         self.assert_backend_called_with(
             sentinel.name)
 
+    def test_event_ids(self):
+        id_tracker = tracker.Tracker({'mock': self._mock_backend}, id_field='id')
+        id_tracker.emit(sentinel.name)
+        id_tracker.emit(sentinel.name)
+
+        event_ids = [call_args[0][0]['id'] for call_args in self._mock_backend.send.call_args_list]
+        self.assertEqual(len(event_ids), 2)
+        self.assertLess(event_ids[0], event_ids[1])
+
+    def test_reorder_filters(self):
+        self.assertFalse(self.tracker.routing_backend.reorder_filters)
+        reordering_tracker = tracker.Tracker({'mock': self._mock_backend}, reorder_filters=True)
+        self.assertTrue(reordering_tracker.routing_backend.reorder_filters)
+
+    def test_warm_up(self):
+        tracker.warm_up()
+        self._mock_backend.warm_up.assert_called_once_with()
+
     def test_missing_tracker(self):
         self.assertRaises(KeyError, tracker.get_tracker, 'foobar')
 
@@ -23,6 +23,7 @@ import logging
 
 from pytz import UTC
 
+from eventtracking import ids
 from eventtracking.locator import DefaultContextLocator
 from eventtracking.backends.routing import RoutingBackend
 
@@ -36,10 +37,20 @@ class Tracker:
     """
     Track application events.  Holds references to a set of backends that will
     be used to persist any events that are emitted.
+
+    If `id_field` is given, each event is assigned a unique id in that field,
+    see `eventtracking.ids`. Ids sort in the order the events were emitted,
+    and give backends and consumers a key to deduplicate events by.
+
+    If `reorder_filters` is True, processors that are pure filters are
+    reordered so that the most selective ones run first, see `RoutingBackend`.
     """
-    def __init__(self, backends=None, context_locator=None, processors=None):
-        self.routing_backend = RoutingBackend(backends=backends, processors=processors)
+    def __init__(self, backends=None, context_locator=None, processors=None, id_field=None, reorder_filters=False):
+        self.routing_backend = RoutingBackend(
+            backends=backends, processors=processors, reorder_filters=reorder_filters
+        )
         self.context_locator = context_locator or DefaultContextLocator()
+        self.id_field = id_field
 
     @property
     def located_context(self):
@@ -62,6 +73,10 @@ class Tracker:
         """The dictionary of registered backends"""
         return self.routing_backend.backends
 
+    def warm_up(self):
+        """Prepare the backends to send events, see `RoutingBackend.warm_up`"""
+        self.routing_backend.warm_up()
+
     def emit(self, name=None, data=None):
         """
         Emit an event annotated with the UTC time when this function was called.
@@ -78,6 +93,8 @@ class Tracker:
             'data': data or {},
             'context': self.resolve_context()
         }
+        if self.id_field:
+            event[self.id_field] = ids.new_id()
 
         self.routing_backend.send(event)
 
@@ -142,3 +159,16 @@ def get_tracker(name=DEFAULT_TRACKER_NAME):
 def emit(name=None, data=None):
     """Calls `Tracker.emit` on the default global tracker"""
     return get_tracker().emit(name=name, data=data)
+
+
+def warm_up(name=DEFAULT_TRACKER_NAME):
+    """
+    Calls `Tracker.warm_up` on a tracker, the default global tracker unless `name` is given.
+
+    For example, in the configuration file of gunicorn::
+
+        def post_fork(server, worker):
+            from eventtracking import tracker
+            tracker.warm_up()
+    """
+    get_tracker(name).warm_up()
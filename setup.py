@@ -57,6 +57,11 @@ setup(
     description='A simple event tracking system.',
     long_description=README,
     install_requires=REQUIREMENTS,
+    entry_points={
+        'console_scripts': [
+            'eventtracking-replay = eventtracking.replay:main',
+        ],
+    },
     url='https://github.com/edx/event-tracking',
     author='edX',
     author_email='oscm@edx.org',